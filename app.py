@@ -1,76 +1,1821 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, g, has_request_context
+from flask import Response, stream_with_context
+from werkzeug.middleware.proxy_fix import ProxyFix
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, IntegrityError, errorcode
+from mysql.connector.errors import PoolError
 import json
+import base64
 from datetime import datetime, timedelta
 import os
+import time
+import threading
+import queue
 import bcrypt
 import secrets
+import random
+import mmap
+import struct
+import hashlib
+import tempfile
+import atexit
+import re
+import csv
+import io
+import heapq
 from functools import wraps
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+try:
+    import fcntl  # Trava entre processos (indisponível no Windows)
+except ImportError:
+    fcntl = None
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)  # Chave secreta para sessões
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)  # Chave secreta para sessões (fixa entre workers)
+
+# Proxies reversos confiáveis à frente da aplicação: com N > 0, request.remote_addr
+# (limite de login por IP, auditoria) vem do X-Forwarded-For escrito por esses N saltos
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))
+if TRUSTED_PROXY_HOPS > 0:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXY_HOPS, x_proto=TRUSTED_PROXY_HOPS)
 
 # Configuração do banco de dados
 DB_CONFIG = {
-    'host': 'localhost',
-    'database': 'logistica_estoque',
-    'user': 'root',
-    'password': 'ecalfma'
+    'host': os.environ.get('DB_HOST', 'localhost'),
+    'port': int(os.environ.get('DB_PORT', 3306)),
+    'database': os.environ.get('DB_NAME', 'logistica_estoque'),
+    'user': os.environ.get('DB_USER', 'root'),
+    'password': os.environ.get('DB_PASSWORD', 'ecalfma')
+}
+
+# Configuração do pool de conexões
+POOL_CONFIG = {
+    'pool_size': int(os.environ.get('DB_POOL_SIZE', 10)),                      # Máximo de conexões abertas
+    'checkout_timeout': float(os.environ.get('DB_POOL_TIMEOUT', 5)),           # Segundos aguardando conexão livre
+    'ping_interval': float(os.environ.get('DB_POOL_PING_INTERVAL', 30))        # Verificar conexões ociosas há mais tempo que isso
+}
+
+# Configuração do cache de autorização (usuários e permissões, por processo)
+AUTH_CACHE_CONFIG = {
+    'max_entries': int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', 2048)),
+    'ttl': float(os.environ.get('AUTH_CACHE_TTL', 30))                         # Segundos até recarregar do banco
+}
+
+# Configuração das sessões com claims assinadas (opcional)
+SESSION_CLAIMS_CONFIG = {
+    'enabled': os.environ.get('SESSION_CLAIMS', 'false').lower() in ('1', 'true', 'yes'),
+    'epoch_ttl': float(os.environ.get('SESSION_EPOCH_TTL', 5)),                # Atraso máximo para uma revogação valer em outro worker
+    'catalog_ttl': float(os.environ.get('SESSION_PERMISSION_CATALOG_TTL', 300))
+}
+
+# Configuração do hash de senhas (bcrypt fora da thread da requisição)
+PASSWORD_CONFIG = {
+    'workers': int(os.environ.get('BCRYPT_WORKERS', min(4, os.cpu_count() or 1))),  # Threads dedicadas ao bcrypt
+    'max_pending': int(os.environ.get('BCRYPT_MAX_PENDING', 32)),              # Operações na fila antes de recusar (503)
+    'wait_timeout': float(os.environ.get('BCRYPT_WAIT_TIMEOUT', 10)),          # Segundos aguardando o resultado
+    'target_ms': float(os.environ.get('BCRYPT_TARGET_MS', 250)),               # Custo ajustado para este tempo por hash
+    'min_rounds': int(os.environ.get('BCRYPT_MIN_ROUNDS', 10)),
+    'max_rounds': int(os.environ.get('BCRYPT_MAX_ROUNDS', 14)),
+    'rounds': int(os.environ.get('BCRYPT_ROUNDS', 0)) or None,                 # Fixar custo (desativa a calibração)
+    'rounds_file': os.environ.get('BCRYPT_ROUNDS_FILE',                        # Custo calibrado, reutilizado por todos os processos
+                                  os.path.join(tempfile.gettempdir(), 'logistica_bcrypt_rounds'))
+}
+
+# Configuração da limitação de tentativas de login (compartilhada entre workers)
+LOGIN_LIMITER_CONFIG = {
+    'path': os.environ.get('LOGIN_LIMITER_FILE',
+                           os.path.join(tempfile.gettempdir(), 'logistica_login_limiter.bin')),
+    'slots': int(os.environ.get('LOGIN_LIMITER_SLOTS', 8192)),                 # Chaves acompanhadas simultaneamente
+    'user_burst': float(os.environ.get('LOGIN_LIMITER_USER_BURST', 5)),        # Tentativas seguidas por usuário
+    'user_per_minute': float(os.environ.get('LOGIN_LIMITER_USER_PER_MIN', 5)),
+    'ip_burst': float(os.environ.get('LOGIN_LIMITER_IP_BURST', 20)),           # Tentativas seguidas por IP
+    'ip_per_minute': float(os.environ.get('LOGIN_LIMITER_IP_PER_MIN', 30))
+}
+
+# Configuração da gravação adiada do registro de logins/sessões
+LOGIN_WRITER_CONFIG = {
+    'flush_interval': float(os.environ.get('LOGIN_WRITER_FLUSH_INTERVAL', 0.25)),  # Segundos entre gravações em lote
+    'max_batch': int(os.environ.get('LOGIN_WRITER_MAX_BATCH', 500)),              # Gravar antes se acumular isso
+    'max_pending': int(os.environ.get('LOGIN_WRITER_MAX_PENDING', 10000)),        # Descartar além disso (banco fora do ar)
+    'pending_window': float(os.environ.get('LOGIN_WRITER_PENDING_WINDOW', 5))     # Sessão nova ainda ausente do banco vale como pendente
+}
+
+# Configuração da limpeza de sessões expiradas
+SESSION_SWEEPER_CONFIG = {
+    'interval': float(os.environ.get('SESSION_SWEEP_INTERVAL', 300)),          # Segundos entre execuções
+    'batch_size': int(os.environ.get('SESSION_SWEEP_BATCH', 1000)),            # Linhas por DELETE
+    'pause': float(os.environ.get('SESSION_SWEEP_PAUSE', 0.05)),               # Pausa entre lotes
+    'months_ahead': int(os.environ.get('SESSION_PARTITION_MONTHS_AHEAD', 2))   # Partições mensais criadas com antecedência
+}
+
+# Configuração da sincronização incremental do catálogo (/api/sync/catalogo)
+SYNC_CONFIG = {
+    'settle_seconds': int(os.environ.get('SYNC_SETTLE_SECONDS', 5)),           # Alterações mais novas ficam para a próxima chamada (commits em andamento)
+    'tombstone_days': int(os.environ.get('SYNC_TOMBSTONE_DAYS', 90))           # Exclusões guardadas; marcas mais antigas exigem sincronização completa
+}
+
+# Configuração da trilha de auditoria (gravada em lote, tabela particionada por mês)
+AUDIT_CONFIG = {
+    'flush_interval': float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1)),             # Segundos entre gravações
+    'max_batch': int(os.environ.get('AUDIT_MAX_BATCH', 500)),                       # Linhas por INSERT
+    'max_pending': int(os.environ.get('AUDIT_MAX_PENDING', 10000)),                 # Descartar além disso (banco fora do ar)
+    'months_ahead': int(os.environ.get('AUDIT_PARTITION_MONTHS_AHEAD', 2)),         # Partições mensais criadas com antecedência
+    'retention_months': int(os.environ.get('AUDIT_RETENTION_MONTHS', 0)),           # 0 mantém todo o histórico
+    'maintenance_interval': float(os.environ.get('AUDIT_MAINTENANCE_INTERVAL', 3600))
+}
+
+# Configuração das métricas por endpoint (formato Prometheus)
+METRICS_CONFIG = {
+    'directory': os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'logistica_metrics')),
+    'flush_interval': float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))       # Segundos entre gravações do resumo de cada worker
+}
+
+# Configuração do log de queries lentas
+SLOW_QUERY_CONFIG = {
+    'threshold_ms': float(os.environ.get('SLOW_QUERY_MS', 200)),               # 0 desativa
+    'explain': os.environ.get('SLOW_QUERY_EXPLAIN', 'true').lower() in ('1', 'true', 'yes'),
+    'max_pending': int(os.environ.get('SLOW_QUERY_MAX_PENDING', 1000))         # Ocorrências aguardando gravação
+}
+
+# Configuração do canal de eventos em tempo real (SSE)
+EVENTS_CONFIG = {
+    'poll_interval': float(os.environ.get('EVENTS_POLL_INTERVAL', 2)),         # Segundos entre verificações de novas movimentações
+    'keepalive': float(os.environ.get('EVENTS_KEEPALIVE', 15)),                # Comentário periódico para manter a conexão aberta
+    'queue_size': int(os.environ.get('EVENTS_QUEUE_SIZE', 1000)),              # Eventos pendentes por cliente antes de pedir recarga
+    'max_clients': int(os.environ.get('EVENTS_MAX_CLIENTS', 8)),               # Conexões SSE por processo (cada uma ocupa uma thread)
+    'late_window': float(os.environ.get('EVENTS_LATE_WINDOW', 30))             # Segundos procurando ids pulados (commit fora de ordem)
+}
+
+# Configuração do aquecimento de cada worker antes de receber tráfego (gunicorn.conf.py)
+WARMUP_CONFIG = {
+    'connections': int(os.environ.get('WARMUP_CONNECTIONS', 4))                # Conexões do pool abertas antecipadamente
+}
+
+# Versões dos recursos para ETag/GET condicional (arquivo compartilhado pelos workers)
+RESOURCE_VERSION_FILE = os.environ.get('RESOURCE_VERSION_FILE',
+                                       os.path.join(tempfile.gettempdir(), 'logistica_versions.bin'))
+
+# Configuração do cache de consulta de produtos por id/código de barras (por processo)
+PRODUCT_CACHE_CONFIG = {
+    'max_entries': int(os.environ.get('PRODUCT_CACHE_MAX_ENTRIES', 20000)),
+    'ttl': float(os.environ.get('PRODUCT_CACHE_TTL', 10))                      # Curto: a linha inclui a quantidade em estoque
 }
 
+class ConnectionPool:
+    """Pool de conexões MySQL reutilizáveis entre requisições"""
+    def __init__(self, config, pool_size=10, checkout_timeout=5, ping_interval=30):
+        self.config = dict(config, autocommit=True)
+        self.pool_size = pool_size
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self._condition = threading.Condition()
+        self._idle = []  # Pilha de (conexão, instante da devolução)
+        self._open = 0
+        self._pid = os.getpid()
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'reconnects': 0,
+            'discarded': 0
+        }
+
+    def _connect(self):
+        connection = mysql.connector.connect(**self.config)
+        with self._condition:
+            self._stats['created'] += 1
+        return connection
+
+    def discard(self, connection):
+        """Fechar uma conexão emprestada em vez de devolvê-la (estado desconhecido)"""
+        try:
+            connection.close()
+        except Error:
+            pass
+        with self._condition:
+            self._open -= 1
+            self._stats['discarded'] += 1
+            self._condition.notify()
+
+    def _after_fork(self):
+        # Conexões herdadas do processo pai compartilham o socket com ele: esquecê-las sem fechar
+        self._condition = threading.Condition()
+        self._idle = []
+        self._open = 0
+        self._pid = os.getpid()
+
+    def get_connection(self):
+        """Obter conexão do pool, aguardando até checkout_timeout"""
+        if self._pid != os.getpid():
+            self._after_fork()
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, returned_at = self._idle.pop()
+                    break
+                if self._open < self.pool_size:
+                    self._open += 1
+                    connection, returned_at = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolError(f"Tempo esgotado aguardando conexão do pool ({self.checkout_timeout}s)")
+                self._stats['waits'] += 1
+                self._condition.wait(remaining)
+            self._stats['checkouts'] += 1
+
+        if connection is None:
+            try:
+                return self._connect()
+            except Error:
+                with self._condition:
+                    self._open -= 1
+                    self._condition.notify()
+                raise
+
+        # Conexões ociosas há muito tempo podem ter sido encerradas pelo servidor
+        if time.monotonic() - returned_at > self.ping_interval:
+            try:
+                connection.ping(reconnect=False)
+            except Error:
+                try:
+                    connection.close()
+                except Error:
+                    pass
+                with self._condition:
+                    self._stats['reconnects'] += 1
+                try:
+                    return self._connect()
+                except Error:
+                    with self._condition:
+                        self._open -= 1
+                        self._condition.notify()
+                    raise
+        return connection
+
+    def release(self, connection):
+        """Devolver conexão ao pool"""
+        try:
+            if not connection.is_connected():
+                self.discard(connection)
+                return
+            if connection.in_transaction:
+                connection.rollback()
+        except Error:
+            self.discard(connection)
+            return
+
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def warm(self, count):
+        """Abrir até count conexões ociosas antecipadamente; retorna quantas ficaram disponíveis"""
+        connections = []
+        try:
+            for _ in range(min(count, self.pool_size)):
+                connections.append(self.get_connection())
+        except (Error, PoolError) as e:
+            print(f"Erro ao preparar conexões do pool: {e}")
+        for connection in connections:
+            self.release(connection)
+        return len(connections)
+
+    def stats(self):
+        """Estatísticas de uso do pool"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats['pool_size'] = self.pool_size
+            stats['open'] = self._open
+            stats['idle'] = len(self._idle)
+            stats['in_use'] = self._open - len(self._idle)
+        return stats
+
+def timed_execute(cursor, query, params=None, many=False, fetch=False):
+    """Executar no cursor contabilizando a query nas métricas e no log de queries lentas"""
+    started = time.perf_counter()
+    rowcount = None
+    try:
+        if many:
+            cursor.executemany(query, params)
+        else:
+            cursor.execute(query, params)
+        rows = cursor.fetchall() if fetch else None
+        rowcount = len(rows) if fetch else cursor.rowcount
+        return rows
+    finally:
+        elapsed = time.perf_counter() - started
+        request_metrics.record_query(elapsed)
+        slow_query_log.observe(query, params, elapsed, rowcount, many)
+
+def run_statement(cursor, query, params=None):
+    """Executar uma query no cursor e retornar linhas (SELECT) ou lastrowid"""
+    if query.strip().lower().startswith('select'):
+        return timed_execute(cursor, query, params, fetch=True)
+    timed_execute(cursor, query, params)
+    return cursor.lastrowid
+
+class Transaction:
+    """Unidade de trabalho: várias queries na mesma conexão com um único commit"""
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, params=None):
+        cursor = self.connection.cursor(dictionary=True)
+        try:
+            return run_statement(cursor, query, params)
+        finally:
+            cursor.close()
+
+    def execute_many(self, query, seq_params):
+        cursor = self.connection.cursor()
+        try:
+            timed_execute(cursor, query, seq_params, many=True)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def execute_update(self, query, params=None):
+        """Executar UPDATE/DELETE e retornar o número de linhas afetadas"""
+        cursor = self.connection.cursor()
+        try:
+            timed_execute(cursor, query, params)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
 class DatabaseManager:
-    def __init__(self, config):
+    def __init__(self, config, pool_config=None):
         self.config = config
+        self.pool = ConnectionPool(config, **(pool_config or {}))
+        self._local = threading.local()
 
     def get_connection(self):
         try:
-            connection = mysql.connector.connect(**self.config)
-            return connection
+            return self.pool.get_connection()
         except Error as e:
             print(f"Erro ao conectar com MySQL: {e}")
             return None
 
+    def release_connection(self, connection):
+        self.pool.release(connection)
+
+    def discard_connection(self, connection):
+        self.pool.discard(connection)
+
+    def current_transaction(self):
+        return getattr(self._local, 'transaction', None)
+
+    @contextmanager
+    def transaction(self):
+        """Agrupar queries em uma transação; commit ao final, rollback em caso de erro.
+
+        Enquanto o bloco estiver ativo, execute_query na mesma thread usa a conexão
+        da transação e propaga erros em vez de retornar None. Blocos aninhados
+        participam da transação externa.
+        """
+        current = self.current_transaction()
+        if current is not None:
+            yield current
+            return
+
+        connection = self.pool.get_connection()
+        transaction = Transaction(connection)
+        self._local.transaction = transaction
+        try:
+            connection.start_transaction()
+            yield transaction
+            connection.commit()
+        except Exception:
+            try:
+                connection.rollback()
+            except Error as e:
+                print(f"Erro ao desfazer transação: {e}")
+            raise
+        finally:
+            self._local.transaction = None
+            self.release_connection(connection)
+
     def execute_query(self, query, params=None):
+        transaction = self.current_transaction()
+        if transaction is not None:
+            return transaction.execute(query, params)
+
         connection = self.get_connection()
         if connection is None:
             return None
         
+        cursor = None
         try:
             cursor = connection.cursor(dictionary=True)
-            cursor.execute(query, params)
+            return run_statement(cursor, query, params)
+        except Error as e:
+            print(f"Erro na execução da query: {e}")
+            return None
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Error:
+                    pass
+            self.release_connection(connection)
+
+    def execute_many(self, query, seq_params):
+        """Executar a mesma query para vários conjuntos de parâmetros"""
+        with self.transaction() as transaction:
+            return transaction.execute_many(query, seq_params)
+
+    def execute_update(self, query, params=None):
+        """Executar UPDATE/DELETE e retornar o número de linhas afetadas"""
+        with self.transaction() as transaction:
+            return transaction.execute_update(query, params)
+
+db = DatabaseManager(DB_CONFIG, POOL_CONFIG)
+
+class RequestMetrics:
+    """Contadores por endpoint: requisições, histograma de latência, queries e tempo de banco.
+
+    Cada worker acumula em memória e grava um resumo em directory a cada
+    flush_interval; a exportação soma os resumos dos workers vivos, então
+    qualquer worker responde pelo servidor inteiro.
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, directory, flush_interval=5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._endpoints = {}   # (endpoint, método) -> contadores
+        self._statuses = {}    # (endpoint, método, status) -> requisições
+        self._last_flush = 0.0
+
+    def start_request(self):
+        g._metrics = {'started': time.perf_counter(), 'queries': 0, 'db_seconds': 0.0}
+
+    def record_query(self, elapsed):
+        if not has_request_context():
+            return  # Threads de fundo não entram na conta de nenhum endpoint
+        current = g.get('_metrics')
+        if current is not None:
+            current['queries'] += 1
+            current['db_seconds'] += elapsed
+
+    def finish_request(self, response):
+        current = g.pop('_metrics', None)
+        if current is None:
+            return
+        elapsed = time.perf_counter() - current['started']
+        endpoint = request.endpoint or 'nao_encontrado'
+        key = (endpoint, request.method)
+        
+        with self._lock:
+            data = self._endpoints.get(key)
+            if data is None:
+                data = self._endpoints[key] = {
+                    'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.BUCKETS),
+                    'queries': 0, 'db_seconds': 0.0
+                }
+            data['count'] += 1
+            data['sum'] += elapsed
+            for index, bound in enumerate(self.BUCKETS):
+                if elapsed <= bound:
+                    data['buckets'][index] += 1
+                    break
+            data['queries'] += current['queries']
+            data['db_seconds'] += current['db_seconds']
             
-            if query.strip().lower().startswith('select'):
-                result = cursor.fetchall()
-            else:
-                connection.commit()
-                result = cursor.lastrowid
+            status_key = (endpoint, request.method, response.status_code)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
             
-            return result
+            flush = time.monotonic() - self._last_flush >= self.flush_interval
+            if flush:
+                self._last_flush = time.monotonic()
+        if flush:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'endpoints': [[endpoint, method, dict(data, buckets=list(data['buckets']))]
+                              for (endpoint, method), data in self._endpoints.items()],
+                'statuses': [[endpoint, method, status, count]
+                             for (endpoint, method, status), count in self._statuses.items()]
+            }
+
+    def _path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        """Gravar o resumo deste worker (troca atômica do arquivo)"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(os.getpid())
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"[METRICAS] Erro ao gravar métricas: {e}")
+
+    def _collect(self):
+        """Resumos de todos os workers vivos (o deste processo vem da memória)"""
+        snapshots = [self.snapshot()]
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            names = []
+        for name in names:
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                pid = int(name[len('metrics-'):-len('.json')])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                continue  # Worker encerrado
+            except PermissionError:
+                pass
+            try:
+                with open(os.path.join(self.directory, name), encoding='utf-8') as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    def render(self):
+        """Exportar no formato texto do Prometheus"""
+        endpoints = {}
+        statuses = {}
+        for snapshot in self._collect():
+            for endpoint, method, data in snapshot['endpoints']:
+                total = endpoints.setdefault((endpoint, method), {
+                    'count': 0, 'sum': 0.0, 'buckets': [0] * len(self.BUCKETS),
+                    'queries': 0, 'db_seconds': 0.0
+                })
+                for name in ('count', 'sum', 'queries', 'db_seconds'):
+                    total[name] += data[name]
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], data['buckets'])]
+            for endpoint, method, status, count in snapshot['statuses']:
+                key = (endpoint, method, status)
+                statuses[key] = statuses.get(key, 0) + count
+        
+        lines = [
+            '# HELP logistica_http_requests_total Requisições por endpoint, método e status.',
+            '# TYPE logistica_http_requests_total counter'
+        ]
+        for (endpoint, method, status), count in sorted(statuses.items()):
+            lines.append(f'logistica_http_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+        
+        lines += [
+            '# HELP logistica_http_request_duration_seconds Latência das requisições.',
+            '# TYPE logistica_http_request_duration_seconds histogram'
+        ]
+        for (endpoint, method), data in sorted(endpoints.items()):
+            labels = f'endpoint="{endpoint}",method="{method}"'
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, data['buckets']):
+                cumulative += count
+                lines.append(f'logistica_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'logistica_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {data["count"]}')
+            lines.append(f'logistica_http_request_duration_seconds_sum{{{labels}}} {data["sum"]:.6f}')
+            lines.append(f'logistica_http_request_duration_seconds_count{{{labels}}} {data["count"]}')
+        
+        lines += [
+            '# HELP logistica_db_queries_total Queries executadas no banco por endpoint.',
+            '# TYPE logistica_db_queries_total counter'
+        ]
+        for (endpoint, method), data in sorted(endpoints.items()):
+            lines.append(f'logistica_db_queries_total{{endpoint="{endpoint}",method="{method}"}} {data["queries"]}')
+        
+        lines += [
+            '# HELP logistica_db_time_seconds_total Tempo gasto no banco por endpoint.',
+            '# TYPE logistica_db_time_seconds_total counter'
+        ]
+        for (endpoint, method), data in sorted(endpoints.items()):
+            lines.append(f'logistica_db_time_seconds_total{{endpoint="{endpoint}",method="{method}"}} {data["db_seconds"]:.6f}')
+        
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics(**METRICS_CONFIG)
+atexit.register(request_metrics.flush)
+
+class SlowQueryLog:
+    """Registro de queries acima de threshold_ms, agrupadas por SQL normalizado.
+
+    A query lenta é apenas enfileirada no caminho da requisição; uma thread grava
+    o agregado em consultas_lentas e, na primeira ocorrência de cada fingerprint
+    (em qualquer worker), captura o EXPLAIN com os parâmetros originais.
+    """
+    STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+    NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+    PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+    VALUES_LIST = re.compile(r"(\(\?(?:, \?)*\))(?:\s*,\s*\1)+")
+    EXPLAINABLE = ('select', 'insert', 'update', 'delete', 'replace')
+
+    def __init__(self, threshold_ms=200, explain=True, max_pending=1000):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.max_pending = max_pending
+        self._condition = threading.Condition()
+        self._pending = []
+        self._explained = set()
+        self._pid = None
+        self._local = threading.local()
+
+    @classmethod
+    def normalize(cls, query):
+        """SQL sem literais nem parâmetros, com listas IN/VALUES recolhidas"""
+        sql = cls.STRING_LITERAL.sub('?', query)
+        sql = sql.replace('%s', '?')
+        sql = cls.NUMBER_LITERAL.sub('?', sql)
+        sql = ' '.join(sql.split())
+        sql = cls.VALUES_LIST.sub(r'\1, ...', sql)
+        return cls.PLACEHOLDER_LIST.sub('(?, ...)', sql)
+
+    @staticmethod
+    def fingerprint(normalized):
+        return hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).hexdigest()
+
+    @staticmethod
+    def params_shape(params, many=False):
+        """Tipos dos parâmetros, com repetições agrupadas: (int, str x 50)"""
+        if many:
+            params = list(params or [])
+            return f"{len(params)} x {SlowQueryLog.params_shape(params[0]) if params else '()'}"
+        if params is None:
+            return '()'
+        if isinstance(params, dict):
+            return '{' + ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items()) + '}'
+        groups = []
+        for value in params:
+            name = type(value).__name__
+            if groups and groups[-1][0] == name:
+                groups[-1][1] += 1
+            else:
+                groups.append([name, 1])
+        return '(' + ', '.join(name if count == 1 else f'{name} x {count}' for name, count in groups) + ')'
+
+    def observe(self, query, params, elapsed, rowcount, many=False):
+        if not self.threshold or elapsed < self.threshold or getattr(self._local, 'busy', False):
+            return
+        normalized = self.normalize(query)
+        shape = self.params_shape(params, many)
+        endpoint = request.endpoint if has_request_context() else threading.current_thread().name
+        print(f"[SQL LENTA] {elapsed * 1000:.0f} ms, {rowcount} linhas, {endpoint}: {normalized[:200]} {shape}")
+        
+        explain_params = None if many else params
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                return  # Banco fora do ar ou rajada: o print acima já registrou
+            self._pending.append((query, explain_params, normalized, shape, elapsed, rowcount, endpoint))
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='slow-query-log', daemon=True).start()
+            self._condition.notify()
+
+    def _run(self):
+        self._local.busy = True  # Queries desta thread não entram no próprio log
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                batch, self._pending = self._pending, []
+            for entry in batch:
+                try:
+                    self._record(*entry)
+                except (Error, PoolError) as e:
+                    print(f"[SQL LENTA] Erro ao registrar query lenta: {e}")
+
+    def _record(self, query, params, normalized, shape, elapsed, rowcount, endpoint):
+        fingerprint = self.fingerprint(normalized)
+        elapsed_ms = elapsed * 1000
+        inserted = db.execute_update("""
+        INSERT INTO consultas_lentas
+            (fingerprint, sql_normalizado, ocorrencias, tempo_total_ms, tempo_max_ms,
+             ultimo_tempo_ms, ultimo_rowcount, formato_parametros, endpoint)
+        VALUES (%s, %s, 1, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            ocorrencias = ocorrencias + 1,
+            tempo_total_ms = tempo_total_ms + VALUES(tempo_total_ms),
+            tempo_max_ms = GREATEST(tempo_max_ms, VALUES(tempo_max_ms)),
+            ultimo_tempo_ms = VALUES(ultimo_tempo_ms),
+            ultimo_rowcount = VALUES(ultimo_rowcount),
+            formato_parametros = VALUES(formato_parametros),
+            endpoint = VALUES(endpoint),
+            ultima_ocorrencia = CURRENT_TIMESTAMP
+        """, (fingerprint, normalized, elapsed_ms, elapsed_ms, elapsed_ms, rowcount, shape[:255], endpoint[:100])) == 1
+        
+        # EXPLAIN apenas na primeira ocorrência (linha nova em qualquer worker)
+        if not (inserted and self.explain) or fingerprint in self._explained:
+            return
+        self._explained.add(fingerprint)
+        if not query.strip().lower().startswith(self.EXPLAINABLE):
+            return
+        plan = self._explain(query, params)
+        if plan:
+            db.execute_update("UPDATE consultas_lentas SET plano = %s WHERE fingerprint = %s", (plan, fingerprint))
+
+    @staticmethod
+    def _explain(query, params):
+        """Plano de execução em JSON, em conexão própria (fora de qualquer transação)"""
+        connection = db.pool.get_connection()
+        cursor = connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN FORMAT=JSON {query}", params)
+            row = cursor.fetchone()
+            return row[0] if row else None
         except Error as e:
-            print(f"Erro na execução da query: {e}")
+            print(f"[SQL LENTA] EXPLAIN falhou: {e}")
+            return None
+        finally:
+            cursor.close()
+            db.release_connection(connection)
+
+    def reset(self):
+        with self._condition:
+            self._explained.clear()
+
+slow_query_log = SlowQueryLog(**SLOW_QUERY_CONFIG)
+
+@app.before_request
+def start_request_metrics():
+    request_metrics.start_request()
+
+@app.after_request
+def finish_request_metrics(response):
+    request_metrics.finish_request(response)
+    return response
+
+class TTLCache:
+    """Cache LRU em memória com expiração por tempo, seguro entre threads"""
+    def __init__(self, max_entries=2048, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # chave -> (valor, instante de expiração)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+user_cache = TTLCache(**AUTH_CACHE_CONFIG)
+permission_cache = TTLCache(**AUTH_CACHE_CONFIG)
+product_cache = TTLCache(**PRODUCT_CACHE_CONFIG)   # produto_id -> linha do produto com estoque
+barcode_cache = TTLCache(**PRODUCT_CACHE_CONFIG)   # codigo_barras -> produto_id
+shard_cache = TTLCache(**PRODUCT_CACHE_CONFIG)     # produto_id -> número de frações do contador de estoque
+epoch_cache = TTLCache(max_entries=1, ttl=SESSION_CLAIMS_CONFIG['epoch_ttl'])                 # 'all' -> {usuario_id: época}
+permission_catalog_cache = TTLCache(max_entries=1, ttl=SESSION_CLAIMS_CONFIG['catalog_ttl'])  # 'all' -> {nome: id}
+
+def request_memo(name):
+    """Dicionário de memoização válido apenas durante a requisição atual"""
+    if not has_request_context():
+        return None
+    memo = g.get(name)
+    if memo is None:
+        memo = {}
+        setattr(g, name, memo)
+    return memo
+
+class PasswordHasherBusy(Exception):
+    """Fila de hash de senhas cheia; o cliente deve tentar novamente"""
+
+class PasswordHasher:
+    """Executa bcrypt em um pool de threads limitado, com custo calibrado por tempo alvo"""
+    def __init__(self, workers=4, max_pending=32, wait_timeout=10, target_ms=250,
+                 min_rounds=10, max_rounds=14, rounds=None, rounds_file=None):
+        self.wait_timeout = wait_timeout
+        self.target_ms = target_ms
+        self.min_rounds = min_rounds
+        self.max_rounds = max_rounds
+        self.rounds_file = rounds_file
+        self._rounds = rounds
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+        self._stats = {
+            'hashes': 0,
+            'verifications': 0,
+            'rehashes': 0,
+            'rejected': 0
+        }
+
+    @property
+    def rounds(self):
+        """Custo atual; lido de rounds_file ou calibrado (e gravado) na primeira utilização"""
+        if self._rounds is None:
+            with self._lock:
+                if self._rounds is None:
+                    rounds = self._stored_rounds()
+                    if rounds is None:
+                        rounds = self._store_rounds(self._calibrate())
+                    self._rounds = rounds
+        return self._rounds
+
+    def _stored_rounds(self):
+        if not self.rounds_file:
+            return None
+        try:
+            with open(self.rounds_file) as f:
+                rounds = int(f.read())
+        except (OSError, ValueError):
             return None
+        return rounds if self.min_rounds <= rounds <= self.max_rounds else None
+
+    def _store_rounds(self, rounds):
+        # Medições feitas com a CPU ocupada variam: o primeiro processo a gravar define
+        # o custo de todos, e ele não muda entre reinícios
+        if not self.rounds_file:
+            return rounds
+        temp_path = f"{self.rounds_file}.{os.getpid()}"
+        try:
+            with open(temp_path, 'w') as f:
+                f.write(str(rounds))
+            try:
+                os.link(temp_path, self.rounds_file)
+            except FileExistsError:
+                stored = self._stored_rounds()
+                if stored is not None:
+                    return stored
+                os.replace(temp_path, self.rounds_file)  # Valor fora dos limites atuais
+        except OSError as e:
+            print(f"[SENHAS] Não foi possível gravar o custo em {self.rounds_file}: {e}")
         finally:
-            if connection.is_connected():
-                cursor.close()
-                connection.close()
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        return rounds
+
+    def _calibrate(self):
+        # Cada round a mais dobra o tempo: medir o mínimo e extrapolar
+        start = time.perf_counter()
+        bcrypt.hashpw(b'calibracao', bcrypt.gensalt(self.min_rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        rounds = self.min_rounds
+        while rounds < self.max_rounds and elapsed_ms * 2 <= self.target_ms:
+            rounds += 1
+            elapsed_ms *= 2
+        print(f"[SENHAS] Custo bcrypt calibrado: {rounds} rounds (~{elapsed_ms:.0f} ms)")
+        return rounds
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PasswordHasherBusy("Fila de verificação de senhas cheia")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.wait_timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise PasswordHasherBusy("Tempo esgotado aguardando verificação de senha")
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def hash(self, password):
+        """Gerar hash da senha com o custo atual"""
+        rounds = self.rounds
+        self._count('hashes')
+        return self._wait(self._submit(
+            lambda: bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')))
+
+    def verify(self, password, hashed):
+        """Verificar senha contra o hash armazenado"""
+        hashed = hashed.encode('utf-8') if isinstance(hashed, str) else hashed
+        self._count('verifications')
+        return self._wait(self._submit(bcrypt.checkpw, password.encode('utf-8'), hashed))
+
+    def needs_rehash(self, hashed):
+        """Hash armazenado com custo menor que o atual (nunca reduz o custo)"""
+        hashed = hashed.decode('utf-8') if isinstance(hashed, bytes) else hashed
+        try:
+            return int(hashed.split('$')[2]) < self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def rehash_in_background(self, password, on_hashed):
+        """Recalcular o hash sem atrasar a resposta; ignorado se a fila estiver cheia"""
+        rounds = self.rounds
+        def task():
+            new_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+            on_hashed(new_hash)
+            self._count('rehashes')
+        try:
+            self._submit(task)
+        except PasswordHasherBusy:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, rounds=self._rounds, target_ms=self.target_ms)
+
+password_hasher = PasswordHasher(**PASSWORD_CONFIG)
+
+class LoginRateLimiter:
+    """Token bucket por usuário e por IP em arquivo mapeado em memória.
+
+    Todos os workers do gunicorn abrem o mesmo arquivo, então o limite vale para
+    o servidor inteiro. Cada chave ocupa uma posição de uma tabela hash de tamanho
+    fixo; sem espaço, a chave há mais tempo sem uso é reaproveitada (um balde
+    cheio equivale a uma chave nova). Sem fcntl (Windows) a trava vale apenas
+    para o processo atual.
+    """
+    HEADER = struct.Struct('<8sQQ')      # assinatura, permitidas, recusadas
+    SLOT = struct.Struct('<Qdd')         # hash da chave, tokens, último abastecimento
+    MAGIC = b'LOGILIM1'
+    PROBES = 8
+
+    def __init__(self, path, slots=8192, user_burst=5, user_per_minute=5, ip_burst=20, ip_per_minute=30):
+        self.path = path
+        self.slots = slots
+        self.limits = {
+            'user': (user_burst, user_per_minute / 60.0),
+            'ip': (ip_burst, ip_per_minute / 60.0)
+        }
+        self.size = self.HEADER.size + self.SLOT.size * slots
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # Abrir por processo: travas flock herdadas no fork não excluiriam os workers entre si
+        if self._pid == os.getpid():
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(fd).st_size < self.size:
+            os.ftruncate(fd, self.size)
+        self._map = mmap.mmap(fd, self.size)
+        self._fd = fd
+        self._pid = os.getpid()
+        with self._file_lock():
+            magic, _, _ = self.HEADER.unpack_from(self._map, 0)
+            if magic != self.MAGIC:
+                self._map[:self.size] = bytes(self.size)
+                self.HEADER.pack_into(self._map, 0, self.MAGIC, 0, 0)
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _key_hash(kind, value):
+        digest = hashlib.blake2b(f"{kind}:{value}".encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little') or 1  # 0 marca posição livre
+
+    def _find_slot(self, key_hash):
+        """Posição da chave, ou a mais antiga entre as sondadas para reaproveitar"""
+        start = key_hash % self.slots
+        oldest, oldest_at = None, None
+        for probe in range(self.PROBES):
+            index = (start + probe) % self.slots
+            offset = self.HEADER.size + index * self.SLOT.size
+            stored_hash, tokens, updated_at = self.SLOT.unpack_from(self._map, offset)
+            if stored_hash == key_hash:
+                return offset, tokens, updated_at
+            if stored_hash == 0:
+                return offset, None, None
+            if oldest_at is None or updated_at < oldest_at:
+                oldest, oldest_at = offset, updated_at
+        return oldest, None, None
+
+    def _bucket(self, kind, key_hash, now):
+        burst, rate = self.limits[kind]
+        offset, tokens, updated_at = self._find_slot(key_hash)
+        if tokens is None:
+            tokens = burst
+        else:
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+        return offset, tokens, rate
+
+    def acquire(self, username, ip_address):
+        """Consumir uma tentativa; retorna (permitido, segundos até a próxima)"""
+        keys = [('user', self._key_hash('user', username.lower()))]
+        if ip_address:
+            keys.append(('ip', self._key_hash('ip', ip_address)))
+        
+        with self._lock:
+            self._open()
+            with self._file_lock():
+                now = time.time()
+                buckets = [(key_hash, *self._bucket(kind, key_hash, now)) for kind, key_hash in keys]
+                retry_after = max(((1 - tokens) / rate for _, _, tokens, rate in buckets if tokens < 1), default=0)
+                allowed = retry_after == 0
+                
+                for key_hash, offset, tokens, _ in buckets:
+                    self.SLOT.pack_into(self._map, offset, key_hash, tokens - 1 if allowed else tokens, now)
+                
+                magic, allowed_count, rejected_count = self.HEADER.unpack_from(self._map, 0)
+                if allowed:
+                    allowed_count += 1
+                else:
+                    rejected_count += 1
+                self.HEADER.pack_into(self._map, 0, magic, allowed_count, rejected_count)
+        return allowed, retry_after
+
+    def reset_user(self, username):
+        """Devolver o balde do usuário após login bem-sucedido"""
+        key_hash = self._key_hash('user', username.lower())
+        with self._lock:
+            self._open()
+            with self._file_lock():
+                offset, tokens, _ = self._find_slot(key_hash)
+                if tokens is not None:
+                    self.SLOT.pack_into(self._map, offset, 0, 0.0, 0.0)
+
+    def stats(self):
+        with self._lock:
+            self._open()
+            with self._file_lock():
+                _, allowed_count, rejected_count = self.HEADER.unpack_from(self._map, 0)
+                now = time.time()
+                tracked = throttled = 0
+                for index in range(self.slots):
+                    stored_hash, tokens, updated_at = self.SLOT.unpack_from(
+                        self._map, self.HEADER.size + index * self.SLOT.size)
+                    if stored_hash:
+                        tracked += 1
+                        # Baldes ainda sem token para a próxima tentativa (pela menor taxa de reposição)
+                        if tokens + (now - updated_at) * min(rate for _, rate in self.limits.values()) < 1:
+                            throttled += 1
+        return {
+            'allowed': allowed_count,
+            'rejected': rejected_count,
+            'tracked_keys': tracked,
+            'throttled_keys': throttled,
+            'slots': self.slots,
+            'shared_between_processes': fcntl is not None,
+            'limits': {kind: {'burst': burst, 'per_minute': rate * 60}
+                       for kind, (burst, rate) in self.limits.items()}
+        }
+
+login_limiter = LoginRateLimiter(**LOGIN_LIMITER_CONFIG)
+
+class ResourceVersions:
+    """Contadores de versão por recurso em arquivo mapeado em memória.
+
+    Cada escrita em produtos ou estoque incrementa a versão do recurso depois do
+    commit; todos os workers leem o mesmo arquivo, então uma ETag derivada das
+    versões muda assim que qualquer processo altera os dados. O cabeçalho guarda
+    uma época aleatória gerada com o arquivo: se ele for recriado, ETags antigas
+    deixam de coincidir mesmo com os contadores recomeçando do zero. Escritas
+    feitas fora da aplicação (direto no MySQL) não são percebidas.
+    """
+    HEADER = struct.Struct('<8sQ')      # assinatura, época
+    SLOT = struct.Struct('<Q')
+    MAGIC = b'LOGIVER1'
+    RESOURCES = ('produtos', 'estoque')
 
-db = DatabaseManager(DB_CONFIG)
+    def __init__(self, path):
+        self.path = path
+        self.size = self.HEADER.size + self.SLOT.size * len(self.RESOURCES)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._map = None
+
+    def _open(self):
+        # Abrir por processo, como LoginRateLimiter (flock herdado no fork não exclui)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._map = mmap.mmap(fd, self.size)
+            self._fd = fd
+            with self._file_lock():
+                magic, _ = self.HEADER.unpack_from(self._map, 0)
+                if magic != self.MAGIC:
+                    self._map[:self.size] = bytes(self.size)
+                    self.HEADER.pack_into(self._map, 0, self.MAGIC, secrets.randbits(64))
+            self._pid = os.getpid()
+
+    @contextmanager
+    def _file_lock(self):
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _offset(self, resource):
+        return self.HEADER.size + self.RESOURCES.index(resource) * self.SLOT.size
+
+    def bump(self, *resources):
+        """Registrar alteração (chamar depois do commit)"""
+        self._open()
+        with self._lock, self._file_lock():
+            for resource in resources:
+                offset = self._offset(resource)
+                version, = self.SLOT.unpack_from(self._map, offset)
+                self.SLOT.pack_into(self._map, offset, version + 1)
+
+    def current(self, *resources):
+        """(época, versões) dos recursos, sem acessar o banco"""
+        self._open()
+        _, epoch = self.HEADER.unpack_from(self._map, 0)
+        return epoch, tuple(self.SLOT.unpack_from(self._map, self._offset(r))[0] for r in resources)
+
+    def etag(self, resources, variant):
+        """ETag forte para a representação variant (caminho e parâmetros) dos recursos"""
+        epoch, versions = self.current(*resources)
+        raw = f"{epoch}:{','.join(map(str, versions))}:{variant}".encode('utf-8')
+        return hashlib.blake2b(raw, digest_size=12).hexdigest()
+
+    def stats(self):
+        epoch, versions = self.current(*self.RESOURCES)
+        return {
+            'epoch': f'{epoch:016x}',
+            'versions': dict(zip(self.RESOURCES, versions)),
+            'shared_between_processes': fcntl is not None
+        }
+
+resource_versions = ResourceVersions(RESOURCE_VERSION_FILE)
+
+def conditional_get(*resources):
+    """Decorator: responder 304 a If-None-Match com a versão atual, sem consultar o banco.
+
+    A ETag combina as versões dos recursos com o caminho e os parâmetros da
+    requisição; é lida antes da consulta, então uma escrita concorrente no
+    máximo faz a próxima requisição receber 200 de novo.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            etag = resource_versions.etag(resources, request.full_path)
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = app.make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
+
+class LoginWriteBehind:
+    """Fila de gravações de registro de login, aplicadas em lote por uma thread.
+
+    Abertura de sessão, último login, encerramento de sessão e revogação de época
+    não precisam estar no banco antes da resposta: são acumulados e gravados a
+    cada flush_interval em uma única transação (INSERT de várias linhas e UPDATE
+    com CASE). A fila é esvaziada ao encerrar o processo.
+    """
+    def __init__(self, flush_interval=0.25, max_batch=500, max_pending=10000, pending_window=5):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending_window = pending_window
+        self._condition = threading.Condition()
+        self._pending = []
+        self._open_sessions = {}   # session_id -> ativo, até a linha chegar ao banco
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._flush_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'batches': 0,
+            'errors': 0,
+            'dropped': 0
+        }
+
+    def _enqueue(self, operation):
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                self._stats['dropped'] += 1
+                print(f"[LOGIN] Fila de gravação cheia, descartando {operation[0]}")
+                return
+            self._pending.append(operation)
+            self._stats['enqueued'] += 1
+            if operation[0] == 'open':
+                self._open_sessions[operation[1]] = True
+            elif operation[0] == 'close' and operation[1] in self._open_sessions:
+                self._open_sessions[operation[1]] = False
+            if self._pid != os.getpid() and not self._closed:
+                # Thread própria por processo (não sobrevive ao fork do gunicorn)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='login-writer', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+    def record_login(self, user_id, session_id, hours):
+        """Sessão nova e último login do usuário.
+
+        O instante é guardado em tempo monotônico; as datas são calculadas no
+        banco (NOW() menos a espera na fila), no mesmo relógio e fuso usados
+        por data_expiracao > NOW(), pela limpeza e pelas partições.
+        """
+        now = time.monotonic()
+        self._enqueue(('open', session_id, user_id, now, hours))
+        self._enqueue(('login', user_id, now))
+
+    def record_logout(self, session_id):
+        self._enqueue(('close', session_id))
+
+    def record_revocation(self, user_id):
+        self._enqueue(('revoke', user_id))
+
+    def pending_session_state(self, session_id):
+        """Estado de uma sessão ainda não gravada (True/False), ou None"""
+        with self._condition:
+            return self._open_sessions.get(session_id)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._condition.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Gravar tudo que estiver pendente em uma transação"""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Error as e:
+                print(f"[LOGIN] Erro ao gravar registro de logins ({len(batch)} operações): {e}")
+                with self._condition:
+                    self._stats['errors'] += 1
+                    # Recolocar na frente da fila, respeitando o limite
+                    room = max(self.max_pending - len(self._pending), 0)
+                    self._stats['dropped'] += max(len(batch) - room, 0)
+                    for operation in batch[room:]:
+                        if operation[0] == 'open':
+                            self._open_sessions.pop(operation[1], None)
+                    self._pending[:0] = batch[:room]
+                return
+            with self._condition:
+                self._stats['flushed'] += len(batch)
+                self._stats['batches'] += 1
+                for operation in batch:
+                    if operation[0] == 'open':
+                        self._open_sessions.pop(operation[1], None)
+            if any(operation[0] == 'revoke' for operation in batch):
+                epoch_cache.clear()
+
+    def _write(self, batch):
+        sessions = {}        # session_id -> [usuario_id, criação (monotônico), horas, ativo]
+        last_logins = {}     # usuario_id -> instante (monotônico)
+        closed = []
+        revoked = []
+        for operation in batch:
+            kind = operation[0]
+            if kind == 'open':
+                _, session_id, user_id, created_at, hours = operation
+                sessions[session_id] = [user_id, created_at, hours, 1]
+            elif kind == 'login':
+                _, user_id, logged_at = operation
+                last_logins[user_id] = max(logged_at, last_logins.get(user_id, logged_at))
+            elif kind == 'close':
+                if operation[1] in sessions:
+                    sessions[operation[1]][3] = 0   # Aberta e encerrada no mesmo lote
+                else:
+                    closed.append(operation[1])
+            elif kind == 'revoke':
+                revoked.append(operation[1])
+        
+        # Segundos desde o enfileiramento, descontados do NOW() do banco
+        now = time.monotonic()
+        def age(instant):
+            return max(int(now - instant), 0)
+        
+        with db.transaction() as transaction:
+            if sessions:
+                # Usuário desativado enquanto a sessão esperava na fila: gravar já encerrada.
+                # O bloqueio ordena este lote com admin_delete_user (que encerra as sessões gravadas)
+                user_ids = sorted({row[0] for row in sessions.values()})
+                placeholders = ', '.join(['%s'] * len(user_ids))
+                rows = transaction.execute(
+                    f"SELECT id, ativo FROM usuarios WHERE id IN ({placeholders}) FOR UPDATE", tuple(user_ids))
+                active_users = {row['id'] for row in rows or [] if row['ativo']}
+                for row in sessions.values():
+                    if row[0] not in active_users:
+                        row[3] = 0
+                
+                values = ', '.join(['(%s, %s, NOW() - INTERVAL %s SECOND, NOW() - INTERVAL %s SECOND + INTERVAL %s HOUR, %s)']
+                                   * len(sessions))
+                params = [value for session_id, (user_id, created_at, hours, ativo) in sessions.items()
+                          for value in (session_id, user_id, age(created_at), age(created_at), hours, ativo)]
+                transaction.execute(f"""
+                INSERT INTO sessoes (id, usuario_id, data_criacao, data_expiracao, ativo)
+                VALUES {values}
+                """, tuple(params))
+            
+            if last_logins:
+                cases = ' '.join(['WHEN %s THEN NOW() - INTERVAL %s SECOND'] * len(last_logins))
+                placeholders = ', '.join(['%s'] * len(last_logins))
+                params = [value for user_id, logged_at in last_logins.items() for value in (user_id, age(logged_at))]
+                transaction.execute(f"""
+                UPDATE usuarios SET data_ultimo_login = CASE id {cases} END
+                WHERE id IN ({placeholders})
+                """, (*params, *last_logins))
+            
+            online = {}
+            for user_id, _, _, ativo in sessions.values():
+                online[user_id] = online.get(user_id, 0) + ativo
+            
+            if closed:
+                placeholders = ', '.join(['%s'] * len(closed))
+                rows = transaction.execute(
+                    f"SELECT usuario_id, ativo FROM sessoes WHERE id IN ({placeholders}) AND ativo = 1 FOR UPDATE",
+                    tuple(closed))
+                transaction.execute(f"UPDATE sessoes SET ativo = 0 WHERE id IN ({placeholders})", tuple(closed))
+                for user_id, delta in sessoes_ativas_por_usuario(rows or []).items():
+                    online[user_id] = online.get(user_id, 0) + delta
+            
+            ajustar_usuarios_online(transaction, online)
+            
+            if revoked:
+                values = ', '.join(['(%s, 1)'] * len(revoked))
+                transaction.execute(f"""
+                INSERT INTO sessao_epocas (usuario_id, epoca) VALUES {values}
+                ON DUPLICATE KEY UPDATE epoca = epoca + 1
+                """, tuple(revoked))
+
+    def close(self):
+        """Parar a thread e gravar o que restar (chamado ao encerrar o processo)"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, pending=len(self._pending))
+
+login_writer = LoginWriteBehind(**LOGIN_WRITER_CONFIG)
+atexit.register(login_writer.close)
+
+def ajustar_usuarios_online(transaction, deltas):
+    """Somar deltas de sessões ativas por usuário em usuarios_online (um único comando)"""
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    # O delta bruto (negativo em logouts e limpezas) chega ao UPDATE; só o resultado é limitado a 0
+    rows = ' UNION ALL '.join(['SELECT %s AS usuario_id, %s AS delta'] * len(deltas))
+    params = [value for item in deltas.items() for value in item]
+    transaction.execute(f"""
+    INSERT INTO usuarios_online (usuario_id, sessoes_ativas)
+    SELECT d.usuario_id, GREATEST(d.delta, 0) FROM ({rows}) d
+    ON DUPLICATE KEY UPDATE sessoes_ativas = GREATEST(usuarios_online.sessoes_ativas + d.delta, 0)
+    """, tuple(params))
+
+def sessoes_ativas_por_usuario(rows):
+    """Contar linhas ativas por usuário como deltas negativos"""
+    deltas = {}
+    for row in rows:
+        if row['ativo']:
+            deltas[row['usuario_id']] = deltas.get(row['usuario_id'], 0) - 1
+    return deltas
+
+def inicio_do_mes(year, month):
+    """Primeiro dia do mês (month pode passar de 12)"""
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return datetime(year, month, 1)
+
+def criar_particoes_mensais(tabela, months_ahead):
+    """Separar de pmax as partições mensais pAAAAMM até months_ahead meses à frente.
+
+    A tabela deve ser particionada por RANGE (UNIX_TIMESTAMP(coluna)). Retorna
+    (partições existentes antes da chamada, quantidade criada); lista vazia se
+    a tabela não for particionada.
+    """
+    rows = db.execute_query("""
+    SELECT PARTITION_NAME AS nome, PARTITION_DESCRIPTION AS limite
+    FROM information_schema.PARTITIONS
+    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL
+    ORDER BY PARTITION_ORDINAL_POSITION
+    """, (tabela,))
+    if not rows:
+        return [], 0
+    
+    existing = {row['nome'] for row in rows}
+    created = 0
+    today = datetime.now()
+    for offset in range(months_ahead + 1):
+        month = inicio_do_mes(today.year, today.month + offset)
+        name = month.strftime('p%Y%m')
+        if name in existing or 'pmax' not in existing:
+            continue
+        upper = inicio_do_mes(month.year, month.month + 1).strftime('%Y-%m-%d %H:%M:%S')
+        db.execute_update(f"""
+        ALTER TABLE {tabela} REORGANIZE PARTITION pmax INTO (
+            PARTITION {name} VALUES LESS THAN (UNIX_TIMESTAMP('{upper}')),
+            PARTITION pmax VALUES LESS THAN MAXVALUE
+        )
+        """)
+        created += 1
+    return rows, created
+
+class SessionSweeper:
+    """Remove sessões expiradas em lotes e mantém as partições mensais de sessoes.
+
+    Roda em todos os workers, mas só quem obtém o GET_LOCK do MySQL trabalha.
+    Partições inteiramente expiradas são descartadas com DROP PARTITION; o que
+    sobra é apagado em lotes de batch_size. usuarios_online é decrementado
+    na mesma transação das linhas ativas removidas. Também apaga as marcas de
+    produtos excluídos mais antigas que tombstone_days (ver sync_catalogo).
+    """
+    LOCK_NAME = 'logistica_sessoes_sweeper'
+
+    def __init__(self, interval=300, batch_size=1000, pause=0.05, months_ahead=2, tombstone_days=90):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.months_ahead = months_ahead
+        self.tombstone_days = tombstone_days
+        self._pid = None
+        self._lock = threading.Lock()
+        self._stats = {'runs': 0, 'deleted': 0, 'partitions_dropped': 0, 'partitions_created': 0,
+                       'tombstones_deleted': 0, 'last_run': None}
+
+    def ensure_started(self):
+        """Iniciar a thread deste processo (uma por worker, após o fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, name='session-sweeper', daemon=True).start()
+
+    def _run(self):
+        while True:
+            # Espalhar os workers para não disputarem a trava ao mesmo tempo
+            time.sleep(self.interval * random.uniform(0.5, 1.0))
+            try:
+                self.run_once()
+            except Exception as e:
+                # Qualquer falha só adia a limpeza: a thread precisa continuar viva
+                print(f"[SESSOES] Erro na limpeza de sessões: {e}")
+
+    def run_once(self):
+        """Executar uma limpeza se nenhum outro processo estiver executando"""
+        connection = db.get_connection()
+        if connection is None:
+            return False
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            if not cursor.fetchone()[0]:
+                return False
+            try:
+                self._maintain_partitions()
+                deleted = self._delete_expired()
+                tombstones = self._delete_tombstones()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+                cursor.fetchone()
+        finally:
+            cursor.close()
+            db.release_connection(connection)
+        
+        with self._lock:
+            self._stats['runs'] += 1
+            self._stats['deleted'] += deleted
+            self._stats['tombstones_deleted'] += tombstones
+            self._stats['last_run'] = datetime.now().isoformat()
+        return True
+
+    def _delete_expired(self):
+        deleted = 0
+        while True:
+            with db.transaction() as transaction:
+                rows = transaction.execute("""
+                SELECT id, usuario_id, ativo FROM sessoes
+                WHERE data_expiracao < NOW()
+                LIMIT %s FOR UPDATE
+                """, (self.batch_size,))
+                if not rows:
+                    break
+                placeholders = ', '.join(['%s'] * len(rows))
+                deleted += transaction.execute_update(
+                    f"DELETE FROM sessoes WHERE id IN ({placeholders})", tuple(row['id'] for row in rows))
+                ajustar_usuarios_online(transaction, sessoes_ativas_por_usuario(rows))
+            if len(rows) < self.batch_size:
+                break
+            time.sleep(self.pause)
+        return deleted
+
+    def _delete_tombstones(self):
+        deleted = 0
+        while True:
+            count = db.execute_update(
+                "DELETE FROM produtos_excluidos WHERE data_exclusao < NOW() - INTERVAL %s DAY LIMIT %s",
+                (self.tombstone_days, self.batch_size)
+            )
+            deleted += count
+            if count < self.batch_size:
+                break
+            time.sleep(self.pause)
+        return deleted
+
+    def _maintain_partitions(self):
+        # pAAAAMM guarda as sessões que expiram naquele mês
+        rows, created = criar_particoes_mensais('sessoes', self.months_ahead)
+        if not rows:
+            return  # Tabela não particionada: apenas a limpeza em lotes
+        with self._lock:
+            self._stats['partitions_created'] += created
+        
+        # Descartar partições cujo limite já passou (todas as linhas expiradas)
+        now = time.time()
+        for row in rows:
+            if row['nome'] == 'pmax' or row['limite'] == 'MAXVALUE' or int(row['limite']) > now:
+                continue
+            name = row['nome']
+            with db.transaction() as transaction:
+                ativas = transaction.execute(
+                    f"SELECT usuario_id, 1 AS ativo FROM sessoes PARTITION ({name}) WHERE ativo = 1 FOR UPDATE")
+                transaction.execute_update(f"UPDATE sessoes PARTITION ({name}) SET ativo = 0 WHERE ativo = 1")
+                ajustar_usuarios_online(transaction, sessoes_ativas_por_usuario(ativas or []))
+            db.execute_update(f"ALTER TABLE sessoes DROP PARTITION {name}")
+            with self._lock:
+                self._stats['partitions_dropped'] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+session_sweeper = SessionSweeper(**SESSION_SWEEPER_CONFIG, tombstone_days=SYNC_CONFIG['tombstone_days'])
+
+class AuditLog:
+    """Trilha de auditoria somente de inserção, gravada em lote por uma thread.
+
+    Os handlers chamam record(), que só enfileira o evento (com autor, IP e
+    instante da requisição); a thread de cada processo grava a cada
+    flush_interval um INSERT de várias linhas em auditoria. Nenhuma requisição
+    espera commit de auditoria. A mesma thread cria as partições mensais
+    futuras e, com retention_months > 0, descarta as mais antigas inteiras.
+    """
+    LOCK_NAME = 'logistica_auditoria_particoes'
+
+    def __init__(self, flush_interval=1, max_batch=500, max_pending=10000, months_ahead=2,
+                 retention_months=0, maintenance_interval=3600):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.months_ahead = months_ahead
+        self.retention_months = retention_months
+        self.maintenance_interval = maintenance_interval
+        self._condition = threading.Condition()
+        self._pending = []
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._flush_lock = threading.Lock()
+        self._next_maintenance = 0.0
+        self._stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'batches': 0,
+            'errors': 0,
+            'dropped': 0,
+            'partitions_created': 0,
+            'partitions_dropped': 0
+        }
+
+    def record(self, acao, entidade=None, entidade_id=None, detalhes=None, usuario_id=None):
+        """Enfileirar um evento; autor e IP vêm da requisição atual quando não informados"""
+        ip_address = None
+        if has_request_context():
+            if usuario_id is None:
+                usuario_id = session.get('user_id')
+            ip_address = request.remote_addr
+        event = (
+            datetime.now(), usuario_id, acao, entidade,
+            str(entidade_id) if entidade_id is not None else None,
+            json.dumps(detalhes, default=str, ensure_ascii=False) if detalhes else None,
+            ip_address
+        )
+        with self._condition:
+            if len(self._pending) >= self.max_pending:
+                self._stats['dropped'] += 1
+                print(f"[AUDITORIA] Fila cheia, descartando {acao}")
+                return
+            self._pending.append(event)
+            self._stats['enqueued'] += 1
+            if self._pid != os.getpid() and not self._closed:
+                # Thread própria por processo (não sobrevive ao fork do gunicorn)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-log', daemon=True)
+                self._thread.start()
+            if len(self._pending) >= self.max_batch:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._pending) < self.max_batch:
+                    self._condition.wait(self.flush_interval)
+                if self._closed:
+                    return
+            self.flush()
+            if time.monotonic() >= self._next_maintenance:
+                self._next_maintenance = time.monotonic() + self.maintenance_interval
+                try:
+                    self.maintain_partitions()
+                except (Error, PoolError) as e:
+                    print(f"[AUDITORIA] Erro na manutenção de partições: {e}")
+
+    def flush(self):
+        """Gravar os eventos pendentes (um INSERT por até max_batch eventos)"""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, []
+            for start in range(0, len(batch), self.max_batch):
+                chunk = batch[start:start + self.max_batch]
+                values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(chunk))
+                try:
+                    db.execute_update(f"""
+                    INSERT INTO auditoria (data_evento, usuario_id, acao, entidade, entidade_id, detalhes, ip_address)
+                    VALUES {values}
+                    """, tuple(value for event in chunk for value in event))
+                except (Error, PoolError) as e:
+                    print(f"[AUDITORIA] Erro ao gravar {len(batch) - start} eventos: {e}")
+                    with self._condition:
+                        self._stats['errors'] += 1
+                        # Recolocar na frente da fila, respeitando o limite
+                        remaining = batch[start:]
+                        room = max(self.max_pending - len(self._pending), 0)
+                        self._stats['dropped'] += max(len(remaining) - room, 0)
+                        self._pending[:0] = remaining[:room]
+                    return
+                with self._condition:
+                    self._stats['flushed'] += len(chunk)
+                    self._stats['batches'] += 1
+
+    def maintain_partitions(self):
+        """Criar partições futuras e descartar as anteriores à retenção (um processo por vez)"""
+        connection = db.get_connection()
+        if connection is None:
+            return
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (self.LOCK_NAME,))
+            if not cursor.fetchone()[0]:
+                return
+            try:
+                rows, created = criar_particoes_mensais('auditoria', self.months_ahead)
+                dropped = 0
+                if rows and self.retention_months > 0:
+                    today = datetime.now()
+                    cutoff = inicio_do_mes(today.year, today.month - self.retention_months).timestamp()
+                    for row in rows:
+                        if row['nome'] == 'pmax' or row['limite'] == 'MAXVALUE' or int(row['limite']) > cutoff:
+                            continue
+                        db.execute_update(f"ALTER TABLE auditoria DROP PARTITION {row['nome']}")
+                        dropped += 1
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (self.LOCK_NAME,))
+                cursor.fetchone()
+        finally:
+            cursor.close()
+            db.release_connection(connection)
+        
+        with self._condition:
+            self._stats['partitions_created'] += created
+            self._stats['partitions_dropped'] += dropped
+
+    def close(self):
+        """Parar a thread e gravar o que restar (chamado ao encerrar o processo)"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._condition:
+            return dict(self._stats, pending=len(self._pending))
+
+audit_log = AuditLog(**AUDIT_CONFIG)
+atexit.register(audit_log.close)
+
+@app.before_request
+def start_background_jobs():
+    """Iniciar as tarefas de manutenção no primeiro acesso de cada worker"""
+    session_sweeper.ensure_started()
+
+def warm_up_worker():
+    """Preparar o processo atual antes de aceitar requisições (chamado pelo gunicorn após o fork).
+
+    O pool descarta sozinho as conexões herdadas do processo pai; aqui abrimos
+    as conexões do worker, carregamos os caches compartilhados pelas sessões,
+    calibramos o bcrypt e compilamos os templates.
+    """
+    started = time.perf_counter()
+    connections = db.pool.warm(WARMUP_CONFIG['connections'])
+    get_permission_catalog()
+    get_session_epochs()
+    password_hasher.rounds
+    login_limiter.stats()
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    session_sweeper.ensure_started()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    print(f"[WORKER] Processo {os.getpid()} pronto em {elapsed_ms:.0f} ms ({connections} conexões abertas)")
 
 # Funções de Autenticação e Autorização
 def hash_password(password):
-    """Gerar hash da senha"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    """Gerar hash da senha (executado no pool de bcrypt)"""
+    return password_hasher.hash(password)
 
 def verify_password(password, hashed):
-    """Verificar senha"""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8') if isinstance(hashed, str) else hashed)
+    """Verificar senha (executado no pool de bcrypt)"""
+    return password_hasher.verify(password, hashed)
+
+def rehash_password_if_needed(user, password):
+    """Atualizar em segundo plano hashes gerados com outro custo"""
+    if not password_hasher.needs_rehash(user['password_hash']):
+        return
+    
+    old_hash = user['password_hash']
+    def save(new_hash):
+        query = "UPDATE usuarios SET password_hash = %s WHERE id = %s AND password_hash = %s"
+        try:
+            db.execute_query(query, (new_hash, user['id'], old_hash))
+            invalidate_user_cache(user['id'])
+        except Error as e:
+            print(f"[SENHAS] Erro ao atualizar hash do usuário {user['id']}: {e}")
+    
+    password_hasher.rehash_in_background(password, save)
 
 def login_required(f):
     """Decorator para exigir login"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if 'user_id' not in session or (SESSION_CLAIMS_CONFIG['enabled'] and not get_session_identity()):
             if request.is_json:
                 return jsonify({'error': 'Authentication required'}), 401
             return redirect(url_for('login'))
@@ -87,8 +1832,8 @@ def admin_required(f):
             return redirect(url_for('login'))
         
         # Verificar se é admin
-        user = get_user_by_id(session['user_id'])
-        if not user or user.get('tipo') != 'admin':
+        identity = get_session_identity()
+        if not identity or identity['tipo'] != 'admin':
             if request.is_json:
                 return jsonify({'error': 'Admin privileges required'}), 403
             return redirect(url_for('login'))
@@ -106,18 +1851,18 @@ def permission_required(permission):
                     return jsonify({'error': 'Authentication required'}), 401
                 return redirect(url_for('login'))
             
-            user = get_user_by_id(session['user_id'])
-            if not user:
+            identity = get_session_identity()
+            if not identity:
                 if request.is_json:
                     return jsonify({'error': 'User not found'}), 401
                 return redirect(url_for('login'))
             
             # Admin tem todas as permissões
-            if user.get('tipo') == 'admin':
+            if identity['tipo'] == 'admin':
                 return f(*args, **kwargs)
             
             # Verificar permissão específica
-            if not user_has_permission(user['id'], permission):
+            if not identity_has_permission(identity, permission):
                 if request.is_json:
                     return jsonify({'error': f'Permission {permission} required'}), 403
                 return redirect(url_for('login'))
@@ -127,10 +1872,23 @@ def permission_required(permission):
     return decorator
 
 def get_user_by_id(user_id):
-    """Obter usuário por ID"""
-    query = "SELECT * FROM usuarios WHERE id = %s AND ativo = 1"
-    users = db.execute_query(query, (user_id,))
-    return users[0] if users else None
+    """Obter usuário por ID (memoizado na requisição e em cache por processo)"""
+    memo = request_memo('_users')
+    if memo is not None and user_id in memo:
+        user = memo[user_id]
+        return dict(user) if user else None
+    
+    user = user_cache.get(user_id)
+    if user is None:
+        query = "SELECT * FROM usuarios WHERE id = %s AND ativo = 1"
+        users = db.execute_query(query, (user_id,))
+        user = users[0] if users else None
+        if user:
+            user_cache.set(user_id, user)
+    
+    if memo is not None:
+        memo[user_id] = user
+    return dict(user) if user else None
 
 def get_user_by_username(username):
     """Obter usuário por nome de usuário"""
@@ -144,25 +1902,211 @@ def get_user_by_nfc(nfc_data):
     users = db.execute_query(query, (nfc_data,))
     return users[0] if users else None
 
+def load_user_permissions(user_id):
+    """Carregar permissões do usuário como tupla (memoizado na requisição e em cache por processo)"""
+    memo = request_memo('_permissions')
+    if memo is not None and user_id in memo:
+        return memo[user_id]
+    
+    permissions = permission_cache.get(user_id)
+    if permissions is None:
+        query = """
+        SELECT p.nome FROM usuario_permissoes up
+        JOIN permissoes p ON up.permissao_id = p.id
+        WHERE up.usuario_id = %s
+        """
+        rows = db.execute_query(query, (user_id,))
+        if rows is None:
+            return ()  # Erro no banco: não guardar em cache
+        permissions = tuple(p['nome'] for p in rows)
+        permission_cache.set(user_id, permissions)
+    
+    if memo is not None:
+        memo[user_id] = permissions
+    return permissions
+
+def get_permissions_for_users(user_ids, chunk_size=1000):
+    """Carregar permissões de vários usuários em lote: {user_id: [permissões]}"""
+    result = {}
+    pending = []
+    for user_id in dict.fromkeys(user_ids):
+        cached = permission_cache.get(user_id)
+        if cached is None:
+            pending.append(user_id)
+        else:
+            result[user_id] = list(cached)
+    
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        query = f"""
+        SELECT up.usuario_id, p.nome FROM usuario_permissoes up
+        JOIN permissoes p ON up.permissao_id = p.id
+        WHERE up.usuario_id IN ({placeholders})
+        """
+        rows = db.execute_query(query, tuple(chunk))
+        if rows is None:
+            # Erro no banco: responder sem permissões e não guardar em cache
+            result.update((user_id, []) for user_id in chunk)
+            continue
+        
+        loaded = {user_id: [] for user_id in chunk}
+        for row in rows:
+            loaded[row['usuario_id']].append(row['nome'])
+        for user_id, permissions in loaded.items():
+            permission_cache.set(user_id, tuple(permissions))
+            result[user_id] = permissions
+    
+    return result
+
 def user_has_permission(user_id, permission):
     """Verificar se usuário tem permissão específica"""
-    query = """
-    SELECT COUNT(*) as count FROM usuario_permissoes up
-    JOIN permissoes p ON up.permissao_id = p.id
-    WHERE up.usuario_id = %s AND p.nome = %s
-    """
-    result = db.execute_query(query, (user_id, permission))
-    return result[0]['count'] > 0 if result else False
+    return permission in load_user_permissions(user_id)
 
 def get_user_permissions(user_id):
     """Obter todas as permissões do usuário"""
+    return list(load_user_permissions(user_id))
+
+def invalidate_user_cache(user_id):
+    """Descartar usuário e permissões em cache após alterações administrativas"""
+    user_cache.invalidate(user_id)
+    permission_cache.invalidate(user_id)
+    for name in ('_users', '_permissions'):
+        memo = request_memo(name)
+        if memo is not None:
+            memo.pop(user_id, None)
+
+def get_session_epochs():
+    """Épocas de revogação de todos os usuários ({usuario_id: época}), em cache curto"""
+    epochs = epoch_cache.get('all')
+    if epochs is None:
+        rows = db.execute_query("SELECT usuario_id, epoca FROM sessao_epocas")
+        if rows is None:
+            return None
+        epochs = {row['usuario_id']: row['epoca'] for row in rows}
+        epoch_cache.set('all', epochs)
+    return epochs
+
+def get_permission_catalog():
+    """Mapa nome -> id das permissões; o id é a posição do bit nas claims"""
+    catalog = permission_catalog_cache.get('all')
+    if catalog is None:
+        rows = db.execute_query("SELECT id, nome FROM permissoes")
+        if rows is None:
+            return None
+        catalog = {row['nome']: row['id'] for row in rows}
+        permission_catalog_cache.set('all', catalog)
+    return catalog
+
+def revoke_user_sessions(user_id):
+    """Incrementar a época do usuário: claims emitidas antes disso deixam de valer"""
     query = """
-    SELECT p.nome FROM usuario_permissoes up
-    JOIN permissoes p ON up.permissao_id = p.id
-    WHERE up.usuario_id = %s
+    INSERT INTO sessao_epocas (usuario_id, epoca) VALUES (%s, 1)
+    ON DUPLICATE KEY UPDATE epoca = epoca + 1
+    """
+    db.execute_query(query, (user_id,))
+    epoch_cache.clear()
+
+def build_session_claims(user, permissions):
+    """Claims compactas para o cookie assinado (None se o banco não responder)"""
+    epochs = get_session_epochs()
+    catalog = get_permission_catalog()
+    if epochs is None or catalog is None:
+        return None
+    
+    mask = 0
+    for nome in permissions:
+        if nome in catalog:
+            mask |= 1 << catalog[nome]
+    return {
+        'uid': user['id'],
+        'tipo': user['tipo'],
+        'perms': format(mask, 'x'),
+        'epoch': epochs.get(user['id'], 0)
+    }
+
+class SessionStoreUnavailable(Exception):
+    """Banco fora do ar ao validar uma sessão revogada; a sessão é mantida e o cliente tenta depois"""
+
+@app.errorhandler(SessionStoreUnavailable)
+def session_store_unavailable(e):
+    response = jsonify({'error': 'Serviço temporariamente indisponível, tente novamente em instantes'})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+def is_session_active(session_id, created_at=None):
+    """Sessão registrada, ativa e não expirada (None se o banco não responder).
+
+    A linha de uma sessão nova só chega ao banco no próximo lote do worker que fez
+    o login; nos outros workers, uma sessão ainda ausente e criada há menos de
+    pending_window segundos é tratada como pendente (ativa).
     """
-    permissions = db.execute_query(query, (user_id,))
-    return [p['nome'] for p in permissions] if permissions else []
+    if not session_id:
+        return False
+    pending = login_writer.pending_session_state(session_id)
+    if pending is not None:
+        return pending
+    query = "SELECT ativo = 1 AND data_expiracao > NOW() AS ativa FROM sessoes WHERE id = %s"
+    rows = db.execute_query(query, (session_id,))
+    if rows is None:
+        return None
+    if rows:
+        return bool(rows[0]['ativa'])
+    try:
+        age = datetime.now() - datetime.fromisoformat(created_at)
+    except (TypeError, ValueError):
+        return False
+    return age < timedelta(seconds=login_writer.pending_window)
+
+def get_session_identity():
+    """Usuário da requisição ({'id', 'tipo', 'perms'}), pelas claims assinadas ou pelo banco"""
+    if 'user_id' not in session:
+        return None
+    if '_identity' not in g:
+        g._identity = resolve_session_identity()
+    return g._identity
+
+def resolve_session_identity():
+    user_id = session['user_id']
+    enabled = SESSION_CLAIMS_CONFIG['enabled']
+    
+    claims = session.get('claims') if enabled else None
+    if claims and claims.get('uid') == user_id:
+        epochs = get_session_epochs()
+        if epochs is None or claims.get('epoch') == epochs.get(user_id, 0):
+            # Caminho rápido: nenhuma consulta de autenticação. Com o banco fora do ar
+            # valem as claims assinadas, para uma queda curta não deslogar todos
+            return {'id': user_id, 'tipo': claims['tipo'], 'perms': int(claims['perms'], 16)}
+        
+        # Época mudou: a sessão só é renovada se ainda estiver ativa no banco
+        active = is_session_active(session.get('session_id'), session.get('created_at'))
+        if active is None:
+            raise SessionStoreUnavailable()
+        if not active:
+            session.clear()
+            return None
+        # A troca de época exige leitura nova: o cache do worker (AUTH_CACHE_TTL) pode
+        # ainda guardar o tipo e as permissões anteriores ao rebaixamento
+        invalidate_user_cache(user_id)
+    
+    user = get_user_by_id(user_id)
+    if not user:
+        return None
+    
+    if enabled:
+        claims = build_session_claims(user, load_user_permissions(user_id))
+        if claims:
+            session['claims'] = claims
+            return {'id': user_id, 'tipo': claims['tipo'], 'perms': int(claims['perms'], 16)}
+    return {'id': user_id, 'tipo': user.get('tipo'), 'perms': None}
+
+def identity_has_permission(identity, permission):
+    """Verificar permissão pela máscara das claims, ou pelo cache de permissões"""
+    if identity['perms'] is not None:
+        catalog = get_permission_catalog()
+        if catalog is not None and permission in catalog:
+            return bool(identity['perms'] >> catalog[permission] & 1)
+    return user_has_permission(identity['id'], permission)
 
 def create_session(user_id, remember=False):
     """Criar sessão do usuário"""
@@ -175,28 +2119,37 @@ def create_session(user_id, remember=False):
     else:
         app.permanent_session_lifetime = timedelta(hours=8)
     
-    # Atualizar último login
-    query = "UPDATE usuarios SET data_ultimo_login = NOW() WHERE id = %s"
-    db.execute_query(query, (user_id,))
-    
-    # Registrar na tabela de sessões
     session_id = secrets.token_urlsafe(32)
-    session_query = """
-    INSERT INTO sessoes (id, usuario_id, data_criacao, data_expiracao, ativo)
-    VALUES (%s, %s, NOW(), DATE_ADD(NOW(), INTERVAL %s HOUR), 1)
-    """
     hours = 720 if remember else 8  # 30 dias ou 8 horas
-    db.execute_query(session_query, (session_id, user_id, hours))
+    
+    # Último login e registro na tabela de sessões gravados em lote, fora da resposta
+    login_writer.record_login(user_id, session_id, hours)
+    # Histórico de logins (sessoes é apagada pela limpeza depois de expirar)
+    audit_log.record('login.sucesso', 'usuario', user_id,
+                     {'user_agent': request.headers.get('User-Agent')}, usuario_id=user_id)
     
     session['session_id'] = session_id
+    
+    if SESSION_CLAIMS_CONFIG['enabled']:
+        user = get_user_by_id(user_id)
+        claims = build_session_claims(user, load_user_permissions(user_id)) if user else None
+        if claims:
+            session['claims'] = claims
     return session_id
 
 def destroy_session():
     """Destruir sessão atual"""
+    if 'user_id' in session:
+        audit_log.record('logout', 'usuario', session['user_id'])
+    
     if 'session_id' in session:
-        # Marcar sessão como inativa no banco
-        query = "UPDATE sessoes SET ativo = 0 WHERE id = %s"
-        db.execute_query(query, (session['session_id'],))
+        # Marcar sessão como inativa no banco (gravação em lote)
+        login_writer.record_logout(session['session_id'])
+    
+    if 'claims' in session:
+        # Cópias do cookie passam a ser revalidadas (e recusadas, pois a sessão está inativa);
+        # gravada no mesmo lote, depois do encerramento
+        login_writer.record_revocation(session['user_id'])
     
     session.clear()
 
@@ -229,6 +2182,12 @@ def admin_logs_page():
     """Página de logs do sistema"""
     return render_template('admin_logs.html')
 
+@app.route('/admin/slow-queries')
+@admin_required
+def admin_slow_queries_page():
+    """Página de queries lentas"""
+    return render_template('admin_slow_queries.html')
+
 @app.route('/test')
 def test_page():
     """Página de teste"""
@@ -258,12 +2217,22 @@ def api_login():
             print(f"[LOGIN] ERRO: Campos obrigatórios em branco")
             return jsonify({'success': False, 'message': 'Usuário e senha são obrigatórios'}), 400
         
+        # Limitar tentativas antes de qualquer consulta ou bcrypt
+        allowed, retry_after = login_limiter.acquire(username, request.remote_addr)
+        if not allowed:
+            print(f"[LOGIN] ERRO: Muitas tentativas para {username} / {request.remote_addr}")
+            audit_log.record('login.bloqueado', 'usuario', detalhes={'username': username})
+            response = jsonify({'success': False, 'message': 'Muitas tentativas de login. Aguarde e tente novamente'})
+            response.headers['Retry-After'] = str(int(retry_after) + 1)
+            return response, 429
+        
         # Buscar usuário
         user = get_user_by_username(username)
         print(f"[LOGIN] Usuário encontrado: {user is not None}")
         
         if not user:
             print(f"[LOGIN] ERRO: Usuário não encontrado")
+            audit_log.record('login.falha', 'usuario', detalhes={'username': username, 'motivo': 'usuario_inexistente'})
             return jsonify({'success': False, 'message': 'Usuário não encontrado'}), 401
         
         # Verificar senha
@@ -272,11 +2241,16 @@ def api_login():
         
         if not password_valid:
             print(f"[LOGIN] ERRO: Senha incorreta")
+            audit_log.record('login.falha', 'usuario', user['id'], {'motivo': 'senha_incorreta'}, usuario_id=user['id'])
             return jsonify({'success': False, 'message': 'Senha incorreta'}), 401
         
+        rehash_password_if_needed(user, password)
+        login_limiter.reset_user(username)
+        
         # Verificar se está ativo
         if not user['ativo']:
             print(f"[LOGIN] ERRO: Usuário inativo")
+            audit_log.record('login.falha', 'usuario', user['id'], {'motivo': 'usuario_inativo'}, usuario_id=user['id'])
             return jsonify({'success': False, 'message': 'Usuário inativo'}), 401
         
         # Se for acesso admin, verificar privilégios
@@ -305,6 +2279,11 @@ def api_login():
             'user': user_data
         })
         
+    except PasswordHasherBusy as e:
+        print(f"[LOGIN] Servidor ocupado: {e}")
+        response = jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente em instantes'})
+        response.headers['Retry-After'] = '2'
+        return response, 503
     except Exception as e:
         print(f"[LOGIN] EXCEÇÃO: {str(e)}")
         import traceback
@@ -431,11 +2410,8 @@ def admin_stats():
     result = db.execute_query("SELECT COUNT(*) as count FROM usuarios WHERE tipo = 'admin' AND ativo = 1")
     stats['total_admins'] = result[0]['count'] if result else 0
     
-    # Usuários online (com sessão ativa nas últimas 24h)
-    result = db.execute_query("""
-        SELECT COUNT(DISTINCT usuario_id) as count FROM sessoes 
-        WHERE ativo = 1 AND data_criacao >= DATE_SUB(NOW(), INTERVAL 24 HOUR)
-    """)
+    # Usuários online (com sessão ativa), pelo contador mantido em usuarios_online
+    result = db.execute_query("SELECT COUNT(*) as count FROM usuarios_online WHERE sessoes_ativas > 0")
     stats['users_online'] = result[0]['count'] if result else 0
     
     # Total de produtos (se a tabela existir)
@@ -447,6 +2423,115 @@ def admin_stats():
     
     return jsonify(stats)
 
+@app.route('/api/admin/db/pool', methods=['GET'])
+@admin_required
+def admin_db_pool_stats():
+    """Estatísticas do pool de conexões com o banco"""
+    return jsonify(db.pool.stats())
+
+@app.route('/api/admin/login-limiter/stats', methods=['GET'])
+@admin_required
+def admin_login_limiter_stats():
+    """Estatísticas da limitação de tentativas de login (todos os workers)"""
+    return jsonify(login_limiter.stats())
+
+@app.route('/api/admin/login-writer/stats', methods=['GET'])
+@admin_required
+def admin_login_writer_stats():
+    """Estatísticas da gravação em lote do registro de logins"""
+    return jsonify(login_writer.stats())
+
+@app.route('/api/admin/resource-versions', methods=['GET'])
+@admin_required
+def admin_resource_versions():
+    """Versões atuais usadas nas ETags do catálogo e dos relatórios"""
+    return jsonify(resource_versions.stats())
+
+@app.route('/api/admin/audit-log/stats', methods=['GET'])
+@admin_required
+def admin_audit_log_stats():
+    """Estatísticas da gravação em lote da auditoria"""
+    return jsonify(audit_log.stats())
+
+@app.route('/api/admin/sessions/sweeper', methods=['GET'])
+@admin_required
+def admin_session_sweeper_stats():
+    """Estatísticas da limpeza de sessões expiradas"""
+    return jsonify(session_sweeper.stats())
+
+@app.route('/api/admin/metrics', methods=['GET'])
+@admin_required
+def admin_metrics():
+    """Métricas por endpoint no formato texto do Prometheus"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+SLOW_QUERY_ORDER = {
+    'total': 'tempo_total_ms',
+    'max': 'tempo_max_ms',
+    'ocorrencias': 'ocorrencias',
+    'recentes': 'ultima_ocorrencia'
+}
+
+@app.route('/api/admin/slow-queries', methods=['GET'])
+@admin_required
+def admin_slow_queries():
+    """Queries lentas agrupadas por fingerprint (?ordem=total|max|ocorrencias|recentes)"""
+    ordem = SLOW_QUERY_ORDER.get(request.args.get('ordem', 'total'))
+    if ordem is None:
+        return jsonify({'error': 'Parâmetro ordem inválido'}), 400
+    try:
+        limit = parse_page_size(default=100)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = f"""
+    SELECT fingerprint, sql_normalizado, ocorrencias, tempo_total_ms, tempo_max_ms,
+           tempo_total_ms / ocorrencias AS tempo_medio_ms, ultimo_tempo_ms, ultimo_rowcount,
+           formato_parametros, endpoint, plano IS NOT NULL AS tem_plano,
+           primeira_ocorrencia, ultima_ocorrencia
+    FROM consultas_lentas
+    ORDER BY {ordem} DESC
+    LIMIT %s
+    """
+    consultas = db.execute_query(query, (limit,))
+    return jsonify({
+        'threshold_ms': slow_query_log.threshold * 1000,
+        'consultas': consultas if consultas else []
+    })
+
+@app.route('/api/admin/slow-queries/<fingerprint>', methods=['GET'])
+@admin_required
+def admin_slow_query_detail(fingerprint):
+    """Detalhe de uma query lenta, com o plano de execução capturado"""
+    rows = db.execute_query("SELECT * FROM consultas_lentas WHERE fingerprint = %s", (fingerprint,))
+    if not rows:
+        return jsonify({'success': False, 'message': 'Consulta não encontrada'}), 404
+    consulta = rows[0]
+    if consulta['plano']:
+        try:
+            consulta['plano'] = json.loads(consulta['plano'])
+        except ValueError:
+            pass
+    return jsonify(consulta)
+
+@app.route('/api/admin/slow-queries', methods=['DELETE'])
+@admin_required
+def admin_clear_slow_queries():
+    """Limpar o log de queries lentas (novas ocorrências voltam a capturar EXPLAIN)"""
+    try:
+        db.execute_update("DELETE FROM consultas_lentas")
+        slow_query_log.reset()
+        audit_log.record('sql_lenta.limpeza')
+        return jsonify({'success': True, 'message': 'Log de queries lentas limpo'})
+    except Error as e:
+        return jsonify({'success': False, 'message': f'Erro ao limpar log: {str(e)}'}), 500
+
+@app.route('/api/admin/passwords/stats', methods=['GET'])
+@admin_required
+def admin_password_stats():
+    """Estatísticas do pool de hash de senhas (custo atual, fila recusada)"""
+    return jsonify(password_hasher.stats())
+
 @app.route('/api/admin/users', methods=['GET'])
 @admin_required
 def admin_get_users():
@@ -459,13 +2544,14 @@ def admin_get_users():
     users = db.execute_query(query)
     print(f"[ADMIN] Encontrados {len(users or [])} usuários")
     
-    # Adicionar permissões e ajustar formato para cada usuário
+    # Adicionar permissões (carregadas em lote) e ajustar formato para cada usuário
+    permissions = get_permissions_for_users(user['id'] for user in users or [])
     for user in users or []:
         user['active'] = user['ativo']  # Compatibilidade com frontend
         user['is_admin'] = user['tipo'] == 'admin'
         user['created_at'] = user['data_criacao']
         user['last_login'] = user['data_ultimo_login']
-        user['permissions'] = get_user_permissions(user['id'])
+        user['permissions'] = permissions.get(user['id'], [])
     
     return jsonify(users or [])
 
@@ -519,7 +2605,10 @@ def admin_create_user():
         return jsonify({'success': False, 'message': 'Usuário já existe'}), 400
     
     # Criar hash da senha
-    password_hash = hash_password(password)
+    try:
+        password_hash = hash_password(password)
+    except PasswordHasherBusy:
+        return jsonify({'success': False, 'message': 'Servidor ocupado, tente novamente em instantes'}), 503
     
     # Inserir usuário
     query = """
@@ -531,6 +2620,7 @@ def admin_create_user():
         tipo = 'admin' if is_admin else 'usuario'
         user_id = db.execute_query(query, (username, password_hash, nome, email, active, tipo))
         if user_id:
+            audit_log.record('usuario.criado', 'usuario', user_id, {'username': username, 'tipo': tipo, 'ativo': bool(active)})
             return jsonify({'success': True, 'message': 'Usuário criado com sucesso', 'user_id': user_id})
         else:
             return jsonify({'success': False, 'message': 'Erro ao criar usuário'}), 500
@@ -570,7 +2660,14 @@ def admin_update_user(user_id):
     
     try:
         tipo = 'admin' if is_admin else 'usuario'
-        db.execute_query(query, (username, nome, email, tipo, active, user_id))
+        with db.transaction():
+            db.execute_query(query, (username, nome, email, tipo, active, user_id))
+            revoke_user_sessions(user_id)
+        invalidate_user_cache(user_id)
+        novos = {'username': username, 'nome': nome, 'email': email, 'tipo': tipo, 'ativo': bool(active)}
+        alteracoes = {campo: [user.get(campo), valor] for campo, valor in novos.items()
+                      if (bool(user.get(campo)) if campo == 'ativo' else user.get(campo)) != valor}
+        audit_log.record('usuario.atualizado', 'usuario', user_id, alteracoes)
         return jsonify({'success': True, 'message': 'Usuário atualizado com sucesso'})
     except Exception as e:
         return jsonify({'success': False, 'message': f'Erro ao atualizar usuário: {str(e)}'}), 500
@@ -595,13 +2692,18 @@ def admin_delete_user(user_id):
             return jsonify({'success': False, 'message': 'Não é possível excluir o último administrador'}), 400
     
     try:
-        # Marcar como inativo em vez de excluir
-        query = "UPDATE usuarios SET ativo = 0 WHERE id = %s"
-        db.execute_query(query, (user_id,))
-        
-        # Desativar todas as sessões do usuário
-        session_query = "UPDATE sessoes SET ativo = 0 WHERE usuario_id = %s"
-        db.execute_query(session_query, (user_id,))
+        with db.transaction():
+            # Marcar como inativo em vez de excluir
+            query = "UPDATE usuarios SET ativo = 0 WHERE id = %s"
+            db.execute_query(query, (user_id,))
+            
+            # Desativar todas as sessões do usuário
+            session_query = "UPDATE sessoes SET ativo = 0 WHERE usuario_id = %s"
+            db.execute_query(session_query, (user_id,))
+            db.execute_query("DELETE FROM usuarios_online WHERE usuario_id = %s", (user_id,))
+            revoke_user_sessions(user_id)
+        invalidate_user_cache(user_id)
+        audit_log.record('usuario.desativado', 'usuario', user_id, {'username': user['username']})
         
         return jsonify({'success': True, 'message': 'Usuário excluído com sucesso'})
     except Exception as e:
@@ -626,48 +2728,52 @@ def admin_update_user_permissions(user_id):
         
         print(f"[ADMIN] Usuário encontrado: {user['username']}")
         
-        # Primeiro, garantir que as permissões existam na tabela permissoes
-        for permission_id in permissions:
-            # Verificar se a permissão existe, se não, criar
-            check_query = "SELECT id FROM permissoes WHERE nome = %s"
-            existing = db.execute_query(check_query, (permission_id,))
+        permissions = list(dict.fromkeys(permissions))  # Remover duplicadas mantendo a ordem
+        anteriores = set(get_user_permissions(user_id))
+        placeholders = ', '.join(['%s'] * len(permissions))
+        admin_user_id = session.get('user_id', 1)  # ID do admin que está fazendo a alteração
+        
+        with db.transaction():
+            if permissions:
+                # Primeiro, garantir que as permissões existam na tabela permissoes
+                existing = db.execute_query(
+                    f"SELECT nome FROM permissoes WHERE nome IN ({placeholders})", tuple(permissions)
+                )
+                existing_names = {p['nome'] for p in existing or []}
+                missing = [p for p in permissions if p not in existing_names]
+                
+                if missing:
+                    print(f"[ADMIN] Criando permissões {missing}")
+                    # Descrição da permissão vem da lista predefinida
+                    descriptions = {p['id']: p['description'] for p in get_predefined_permissions()}
+                    db.execute_many(
+                        "INSERT INTO permissoes (nome, descricao) VALUES (%s, %s)",
+                        [(p, descriptions.get(p, f'Permissão {p}')) for p in missing]
+                    )
+            
+            # Remover permissões antigas do usuário
+            print(f"[ADMIN] Removendo permissões antigas do usuário {user_id}")
+            db.execute_query("DELETE FROM usuario_permissoes WHERE usuario_id = %s", (user_id,))
             
-            if not existing:
-                print(f"[ADMIN] Criando permissão {permission_id}")
-                # Criar a permissão
-                insert_perm_query = "INSERT INTO permissoes (nome, descricao) VALUES (%s, %s)"
-                # Encontrar descrição da permissão na lista predefinida
-                perm_info = next((p for p in get_predefined_permissions() if p['id'] == permission_id), None)
-                description = perm_info['description'] if perm_info else f'Permissão {permission_id}'
-                db.execute_query(insert_perm_query, (permission_id, description))
+            # Adicionar novas permissões
+            if permissions:
+                print(f"[ADMIN] Adicionando {len(permissions)} novas permissões")
+                insert_query = f"""
+                INSERT INTO usuario_permissoes (usuario_id, permissao_id, concedida_por)
+                SELECT %s, id, %s FROM permissoes WHERE nome IN ({placeholders})
+                """
+                db.execute_query(insert_query, (user_id, admin_user_id, *permissions))
             else:
-                print(f"[ADMIN] Permissão {permission_id} já existe")
-        
-        # Remover permissões antigas do usuário
-        print(f"[ADMIN] Removendo permissões antigas do usuário {user_id}")
-        delete_query = "DELETE FROM usuario_permissoes WHERE usuario_id = %s"
-        result = db.execute_query(delete_query, (user_id,))
-        print(f"[ADMIN] Permissões antigas removidas")
-        
-        # Adicionar novas permissões
-        if permissions:
-            admin_user_id = session.get('user_id', 1)  # ID do admin que está fazendo a alteração
-            print(f"[ADMIN] Adicionando {len(permissions)} novas permissões")
+                print(f"[ADMIN] Nenhuma permissão para adicionar (lista vazia)")
             
-            for permission_id in permissions:
-                # Buscar ID da permissão
-                perm_query = "SELECT id FROM permissoes WHERE nome = %s"
-                perm_result = db.execute_query(perm_query, (permission_id,))
-                
-                if perm_result:
-                    # Inserir permissão do usuário
-                    insert_query = "INSERT INTO usuario_permissoes (usuario_id, permissao_id, concedida_por) VALUES (%s, %s, %s)"
-                    result = db.execute_query(insert_query, (user_id, perm_result[0]['id'], admin_user_id))
-                    print(f"[ADMIN] Permissão {permission_id} adicionada (ID: {perm_result[0]['id']})")
-                else:
-                    print(f"[ADMIN] ERRO: Permissão {permission_id} não encontrada após criação")
-        else:
-            print(f"[ADMIN] Nenhuma permissão para adicionar (lista vazia)")
+            revoke_user_sessions(user_id)
+        invalidate_user_cache(user_id)
+        if permissions and missing:
+            permission_catalog_cache.clear()
+        audit_log.record('usuario.permissoes', 'usuario', user_id, {
+            'concedidas': sorted(set(permissions) - anteriores),
+            'removidas': sorted(anteriores - set(permissions))
+        })
         
         print(f"[ADMIN] Permissões do usuário {user_id} atualizadas com sucesso: {permissions}")
         return jsonify({'success': True, 'message': 'Permissões atualizadas com sucesso'})
@@ -733,65 +2839,436 @@ def get_predefined_permissions():
         }
     ]
 
+# Feed de atividades: logins (sessoes), movimentações e auditoria, do mais recente para o mais antigo.
+# Ordem total: (data_hora DESC, tipo DESC, id DESC); o cursor guarda essa chave da última linha.
+ATIVIDADE_FONTES = {
+    'MOVIMENTACAO': {
+        'query': """
+        SELECT m.id, m.data_movimento AS data_hora, m.usuario_id, COALESCE(u.nome, u.username) AS usuario_nome,
+               m.tipo AS movimento, m.quantidade, m.descricao, p.nome AS produto_nome
+        FROM movimentacoes m
+        JOIN produtos p ON p.id = m.produto_id
+        LEFT JOIN usuarios u ON u.id = m.usuario_id
+        WHERE {where}
+        ORDER BY m.data_movimento DESC, m.id DESC
+        LIMIT %s
+        """,
+        'data': 'm.data_movimento', 'id': 'm.id', 'usuario': 'm.usuario_id'
+    },
+    # Logins vêm da auditoria: sessoes é apagada pela limpeza depois de expirar
+    'LOGIN': {
+        'query': """
+        SELECT a.id, a.data_evento AS data_hora, a.usuario_id, COALESCE(u.nome, u.username) AS usuario_nome,
+               a.ip_address, JSON_UNQUOTE(JSON_EXTRACT(a.detalhes, '$.user_agent')) AS user_agent
+        FROM auditoria a
+        LEFT JOIN usuarios u ON u.id = a.usuario_id
+        WHERE a.acao = 'login.sucesso' AND {where}
+        ORDER BY a.data_evento DESC, a.id DESC
+        LIMIT %s
+        """,
+        'data': 'a.data_evento', 'id': 'a.id', 'usuario': 'a.usuario_id'
+    },
+    'AUDITORIA': {
+        'query': """
+        SELECT a.id, a.data_evento AS data_hora, a.usuario_id, COALESCE(u.nome, u.username) AS usuario_nome,
+               a.acao, a.entidade, a.entidade_id, a.detalhes, a.ip_address
+        FROM auditoria a
+        LEFT JOIN usuarios u ON u.id = a.usuario_id
+        WHERE a.acao <> 'login.sucesso' AND {where}
+        ORDER BY a.data_evento DESC, a.id DESC
+        LIMIT %s
+        """,
+        'data': 'a.data_evento', 'id': 'a.id', 'usuario': 'a.usuario_id'
+    }
+}
+ATIVIDADE_TIPOS = sorted(ATIVIDADE_FONTES, reverse=True)  # Desempate entre fontes na mesma data_hora
+
+# Descrição das ações gravadas em auditoria (audit_log.record)
+AUDITORIA_ACOES = {
+    'login.sucesso': 'Login realizado',
+    'logout': 'Logout',
+    'login.falha': 'Falha de login',
+    'login.bloqueado': 'Login bloqueado por excesso de tentativas',
+    'usuario.criado': 'Usuário criado',
+    'usuario.atualizado': 'Usuário atualizado',
+    'usuario.desativado': 'Usuário desativado',
+    'usuario.permissoes': 'Permissões alteradas',
+    'produto.criado': 'Produto criado',
+    'produto.atualizado': 'Produto atualizado',
+    'produto.excluido': 'Produto excluído',
+    'estoque.fracoes': 'Contador de estoque fracionado configurado',
+    'sql_lenta.limpeza': 'Log de queries lentas limpo'
+}
+
+def formatar_atividade(tipo, row):
+    if tipo == 'LOGIN':
+        mensagem = f"Login realizado de {row['ip_address'] or 'IP desconhecido'}"
+        detalhes = row['user_agent']
+    elif tipo == 'AUDITORIA':
+        alvo = f" ({row['entidade']} {row['entidade_id']})" if row['entidade_id'] else ''
+        mensagem = f"{AUDITORIA_ACOES.get(row['acao'], row['acao'])}{alvo}"
+        detalhes = ' - '.join(filter(None, [row['detalhes'], row['ip_address'] and f"IP {row['ip_address']}"]))
+    else:
+        acao = 'Entrada' if row['movimento'] == 'ENTRADA' else 'Saída'
+        mensagem = f"{acao} de {row['quantidade']} un. - {row['produto_nome']}"
+        detalhes = row['descricao']
+    return {
+        'tipo': tipo,
+        'id': row['id'],
+        'data_hora': row['data_hora'],
+        'usuario_id': row['usuario_id'],
+        'usuario_nome': row['usuario_nome'],
+        'mensagem': mensagem,
+        'detalhes': detalhes
+    }
+
+def listar_atividades(limit, cursor=None, usuario_id=None, tipo=None, inicio=None, fim=None):
+    """Uma página do feed de atividades; retorna (itens, chave do cursor da próxima página ou None).
+
+    Cada fonte devolve no máximo limit + 1 linhas já filtradas e ordenadas pelo
+    índice de data; as listas são intercaladas e cortadas no limite.
+    """
+    tipos = [tipo] if tipo else ATIVIDADE_TIPOS
+    fontes = []
+    for nome in tipos:
+        fonte = ATIVIDADE_FONTES[nome]
+        where = ['1 = 1']
+        params = []
+        if usuario_id is not None:
+            where.append(f"{fonte['usuario']} = %s")
+            params.append(usuario_id)
+        if inicio:
+            where.append(f"{fonte['data']} >= %s")
+            params.append(inicio)
+        if fim:
+            where.append(f"{fonte['data']} < %s")
+            params.append(fim + timedelta(days=1))  # Dia final inclusivo
+        if cursor:
+            data_hora, cursor_tipo, cursor_id = cursor
+            if cursor_tipo == nome:
+                where.append(f"({fonte['data']} < %s OR ({fonte['data']} = %s AND {fonte['id']} < %s))")
+                params.extend([data_hora, data_hora, cursor_id])
+            elif ATIVIDADE_TIPOS.index(cursor_tipo) < ATIVIDADE_TIPOS.index(nome):
+                # Linhas desta fonte na mesma data_hora vêm depois das da fonte do cursor
+                where.append(f"{fonte['data']} <= %s")
+                params.append(data_hora)
+            else:
+                where.append(f"{fonte['data']} < %s")
+                params.append(data_hora)
+        params.append(limit + 1)
+        rows = db.execute_query(fonte['query'].format(where=' AND '.join(where)), tuple(params))
+        if rows is None:
+            raise Error("Erro ao consultar atividades")
+        fontes.append([formatar_atividade(nome, row) for row in rows])
+    
+    # Intercalar preservando a ordem de cada fonte (desempate por id feito pelo banco)
+    itens = list(heapq.merge(
+        *fontes, key=lambda item: (item['data_hora'], -ATIVIDADE_TIPOS.index(item['tipo'])), reverse=True
+    ))[:limit + 1]
+    if len(itens) <= limit:
+        return itens, None
+    itens = itens[:limit]
+    ultimo = itens[-1]
+    return itens, [ultimo['data_hora'], ultimo['tipo'], ultimo['id']]
+
+@app.route('/api/admin/logs', methods=['GET'])
+@admin_required
+def admin_get_logs():
+    """Feed de atividades paginado: limit, cursor, usuario_id, tipo (LOGIN/MOVIMENTACAO/AUDITORIA), inicio e fim"""
+    try:
+        limit = parse_page_size(default=50)
+        inicio = parse_date_param('inicio')
+        fim = parse_date_param('fim')
+        usuario_id = request.args.get('usuario_id', type=int)
+        tipo = request.args.get('tipo', '').strip().upper() or None
+        if tipo is not None and tipo not in ATIVIDADE_FONTES:
+            raise ValueError(f"tipo deve ser um de: {', '.join(ATIVIDADE_TIPOS)}")
+        cursor = None
+        if request.args.get('cursor'):
+            cursor = decode_cursor(request.args['cursor'])
+            if len(cursor) != 3 or cursor[1] not in ATIVIDADE_FONTES:
+                raise ValueError('Cursor inválido')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        itens, proximo = listar_atividades(limit, cursor, usuario_id, tipo, inicio, fim)
+    except Error as e:
+        print(f"[ADMIN] Erro ao buscar logs: {e}")
+        return jsonify({'success': False, 'message': 'Erro ao buscar logs'}), 500
+    
+    return jsonify({
+        'items': itens,
+        'next_cursor': encode_cursor(proximo) if proximo else None,
+        'has_more': proximo is not None
+    })
+
 @app.route('/api/admin/users/<int:user_id>/logs', methods=['GET'])
 @admin_required
 def admin_get_user_logs(user_id):
-    """Obter logs de atividade do usuário"""
+    """Obter logs de atividade do usuário (100 mais recentes)"""
     try:
-        # Por enquanto, retornar logs mockados da tabela sessoes e movimentacoes
-        logs = []
-        
-        # Logs de sessões (logins)
-        session_logs = db.execute_query("""
-            SELECT 'LOGIN' as tipo, data_login as data_hora, 
-                   CONCAT('Login realizado de ', ip_address) as mensagem,
-                   'Login do usuário' as detalhes
-            FROM sessoes 
-            WHERE user_id = %s 
-            ORDER BY data_login DESC 
-            LIMIT 50
-        """, (user_id,))
-        
-        if session_logs:
-            logs.extend(session_logs)
-        
-        # Logs de movimentações (se o usuário fez movimentações)
-        movement_logs = db.execute_query("""
-            SELECT 'MOVIMENTACAO' as tipo, data_movimentacao as data_hora,
-                   CONCAT('Movimentação: ', tipo_movimentacao, ' - Produto ID ', produto_id) as mensagem,
-                   CONCAT('Quantidade: ', quantidade, ', Observação: ', COALESCE(observacoes, 'Nenhuma')) as detalhes
-            FROM movimentacoes 
-            WHERE usuario_id = %s 
-            ORDER BY data_movimentacao DESC 
-            LIMIT 50
-        """, (user_id,))
-        
-        if movement_logs:
-            logs.extend(movement_logs)
-        
-        # Ordenar logs por data
-        logs.sort(key=lambda x: x['data_hora'] if x['data_hora'] else '', reverse=True)
-        
-        return jsonify(logs[:100])  # Limitar a 100 logs mais recentes
-        
-    except Exception as e:
+        itens, _ = listar_atividades(100, usuario_id=user_id)
+        return jsonify(itens)
+    except Error as e:
         print(f"[ADMIN] Erro ao buscar logs do usuário {user_id}: {e}")
         return jsonify({'success': False, 'message': f'Erro ao buscar logs: {str(e)}'}), 500
 
 # API Routes (com autenticação)
 # API Routes (com autenticação)
+# Paginação por cursor (keyset)
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(values):
+    """Codificar a chave da última linha da página como cursor opaco"""
+    raw = json.dumps(values, default=str, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decodificar cursor gerado por encode_cursor (ValueError se inválido)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError('Cursor inválido') from e
+    if not isinstance(values, list):
+        raise ValueError('Cursor inválido')
+    return values
+
+def parse_page_size(default=100):
+    """Ler parâmetro limit da requisição, limitado a MAX_PAGE_SIZE"""
+    limit = request.args.get('limit', default, type=int)
+    if limit is None or limit < 1:
+        raise ValueError('Parâmetro limit inválido')
+    return min(limit, MAX_PAGE_SIZE)
+
+def parse_date_param(name):
+    """Data AAAA-MM-DD do parâmetro name, ou None se ausente (ValueError se inválida)"""
+    value = request.args.get(name, '').strip()
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"{name} deve estar no formato AAAA-MM-DD")
+
+# Quantidade total em estoque: linha principal mais as frações dos produtos
+# com contador fracionado (ver registrar_movimentacao). CAST porque SUM() devolve
+# DECIMAL, que o JSON do Flask serializa como texto
+ESTOQUE_QUANTIDADE_SQL = """CAST(e.quantidade + IF(e.shards > 0, (
+    SELECT COALESCE(SUM(s.quantidade), 0) FROM estoque_shards s WHERE s.produto_id = e.produto_id
+), 0) AS SIGNED)"""
+
+# Colunas que podem ser pedidas em fields= no catálogo
+PRODUTO_FIELDS = {
+    'id': 'p.id',
+    'nome': 'p.nome',
+    'descricao': 'p.descricao',
+    'categoria': 'p.categoria',
+    'preco': 'p.preco',
+    'codigo_barras': 'p.codigo_barras',
+    'data_criacao': 'p.data_criacao',
+    'data_atualizacao': 'p.data_atualizacao',
+    'quantidade': ESTOQUE_QUANTIDADE_SQL,
+    'estoque_minimo': 'e.estoque_minimo',
+    'estoque_maximo': 'e.estoque_maximo'
+}
+
+# Filtros de status do estoque (mesmas regras de estoque.js)
+STATUS_ESTOQUE_FILTERS = {
+    'critico': f"COALESCE({ESTOQUE_QUANTIDADE_SQL}, 0) = 0",
+    'baixo': f"{ESTOQUE_QUANTIDADE_SQL} > 0 AND {ESTOQUE_QUANTIDADE_SQL} <= e.estoque_minimo",
+    'normal': f"{ESTOQUE_QUANTIDADE_SQL} > e.estoque_minimo"
+}
+
 @app.route('/api/produtos', methods=['GET'])
 @login_required
+@conditional_get('produtos', 'estoque')
 def get_produtos():
-    """Obter lista de produtos"""
-    query = """
-    SELECT p.*, e.quantidade, e.estoque_minimo, e.estoque_maximo
+    """Obter lista de produtos.
+
+    Parâmetros opcionais: categoria, status (critico/baixo/normal), q (prefixo do
+    nome ou código de barras exato), fields (colunas separadas por vírgula) e
+    limit/cursor para paginação por (nome, id). Sem limit/cursor a resposta é a
+    lista completa, como antes; com eles é {items, next_cursor, has_more}.
+    """
+    try:
+        fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+        unknown = [f for f in fields if f not in PRODUTO_FIELDS]
+        if unknown:
+            raise ValueError(f"Campos inválidos: {', '.join(unknown)}")
+        # id e nome são sempre incluídos porque formam a chave do cursor
+        selected = list(dict.fromkeys(['id', 'nome'] + fields)) if fields else list(PRODUTO_FIELDS)
+        
+        conditions = []
+        params = []
+        
+        categoria = request.args.get('categoria')
+        if categoria:
+            conditions.append("p.categoria = %s")
+            params.append(categoria)
+        
+        status = request.args.get('status')
+        if status:
+            if status not in STATUS_ESTOQUE_FILTERS:
+                raise ValueError('Parâmetro status inválido')
+            conditions.append(STATUS_ESTOQUE_FILTERS[status])
+        
+        search = request.args.get('q', '').strip()
+        if search:
+            escaped = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("(p.nome LIKE %s OR p.codigo_barras = %s)")
+            params.extend([escaped + '%', search])
+        
+        paginated = 'limit' in request.args or 'cursor' in request.args
+        if paginated:
+            limit = parse_page_size()
+            cursor = request.args.get('cursor')
+            if cursor:
+                last_nome, last_id = decode_cursor(cursor)
+                conditions.append("(p.nome > %s OR (p.nome = %s AND p.id > %s))")
+                params.extend([last_nome, last_nome, last_id])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    query = f"""
+    SELECT {', '.join(f'{PRODUTO_FIELDS[f]} AS {f}' for f in selected)}
     FROM produtos p
     LEFT JOIN estoque e ON p.id = e.produto_id
-    ORDER BY p.nome
+    {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+    ORDER BY p.nome, p.id
     """
-    produtos = db.execute_query(query)
-    return jsonify(produtos if produtos else [])
+    if not paginated:
+        produtos = db.execute_query(query, tuple(params))
+        return jsonify(produtos if produtos else [])
+    
+    query += " LIMIT %s"
+    produtos = db.execute_query(query, tuple(params) + (limit + 1,)) or []
+    has_more = len(produtos) > limit
+    produtos = produtos[:limit]
+    next_cursor = encode_cursor([produtos[-1]['nome'], produtos[-1]['id']]) if has_more else None
+    
+    return jsonify({'items': produtos, 'next_cursor': next_cursor, 'has_more': has_more})
+
+@app.route('/api/produtos/resumo', methods=['GET'])
+@login_required
+def get_produtos_resumo():
+    """Totais do catálogo para dashboard e relatórios, sem baixar a lista"""
+    query = f"""
+    SELECT p.categoria, COUNT(*) as total_produtos,
+           COALESCE(SUM({ESTOQUE_QUANTIDADE_SQL}), 0) as itens_estoque,
+           COALESCE(SUM(p.preco * {ESTOQUE_QUANTIDADE_SQL}), 0) as valor_estoque
+    FROM produtos p
+    LEFT JOIN estoque e ON p.id = e.produto_id
+    GROUP BY p.categoria
+    """
+    rows = db.execute_query(query) or []
+    
+    return jsonify({
+        'total_produtos': sum(row['total_produtos'] for row in rows),
+        'itens_estoque': int(sum(row['itens_estoque'] for row in rows)),
+        'valor_estoque': float(sum(row['valor_estoque'] for row in rows)),
+        'categorias': {row['categoria'] or 'Sem categoria': row['total_produtos'] for row in rows}
+    })
+
+# Consulta de produtos por id / código de barras (NFC e leitores)
+PRODUTO_LOOKUP_QUERY = f"""
+SELECT p.*, {ESTOQUE_QUANTIDADE_SQL} AS quantidade, e.estoque_minimo, e.estoque_maximo
+FROM produtos p
+LEFT JOIN estoque e ON p.id = e.produto_id
+WHERE {{column}} IN ({{placeholders}})
+"""
+
+def lookup_produtos(produto_ids=(), codigos_barras=()):
+    """Resolver produtos por id e código de barras, consultando o banco só para o que não está em cache.
+
+    Retorna ({produto_id: produto}, {codigo_barras: produto}) apenas com os encontrados.
+    """
+    by_id = {}
+    by_barcode = {}
+    
+    missing_ids = []
+    for produto_id in dict.fromkeys(produto_ids):
+        produto = product_cache.get(produto_id)
+        if produto is None:
+            missing_ids.append(produto_id)
+        else:
+            by_id[produto_id] = produto
+    
+    missing_barcodes = []
+    for codigo in dict.fromkeys(codigos_barras):
+        produto_id = barcode_cache.get(codigo)
+        produto = product_cache.get(produto_id) if produto_id is not None else None
+        # O código pode ter mudado desde que foi guardado
+        if produto is None or produto['codigo_barras'] != codigo:
+            missing_barcodes.append(codigo)
+        else:
+            by_barcode[codigo] = produto
+    
+    for column, keys in (('p.id', missing_ids), ('p.codigo_barras', missing_barcodes)):
+        if not keys:
+            continue
+        query = PRODUTO_LOOKUP_QUERY.format(column=column, placeholders=', '.join(['%s'] * len(keys)))
+        for produto in db.execute_query(query, tuple(keys)) or []:
+            product_cache.set(produto['id'], produto)
+            if produto['codigo_barras']:
+                barcode_cache.set(produto['codigo_barras'], produto['id'])
+            if column == 'p.id':
+                by_id[produto['id']] = produto
+            else:
+                by_barcode[produto['codigo_barras']] = produto
+    
+    return by_id, by_barcode
+
+def invalidate_produto_cache(produto_id):
+    """Descartar produto em cache após alteração de cadastro ou estoque"""
+    product_cache.invalidate(produto_id)
+
+@app.route('/api/produtos/lookup', methods=['GET'])
+@login_required
+def lookup_produto():
+    """Buscar um produto por produto_id ou codigo_barras"""
+    produto_id = request.args.get('produto_id', type=int)
+    codigo_barras = request.args.get('codigo_barras', '').strip()
+    
+    if produto_id is None and not codigo_barras:
+        return jsonify({'error': 'Informe produto_id ou codigo_barras'}), 400
+    
+    if produto_id is not None:
+        by_id, _ = lookup_produtos(produto_ids=[produto_id])
+        produto = by_id.get(produto_id)
+    else:
+        _, by_barcode = lookup_produtos(codigos_barras=[codigo_barras])
+        produto = by_barcode.get(codigo_barras)
+    
+    if not produto:
+        return jsonify({'error': 'Produto não encontrado'}), 404
+    return jsonify(produto)
+
+@app.route('/api/produtos/lookup', methods=['POST'])
+@login_required
+def lookup_produtos_lote():
+    """Buscar vários produtos de uma vez por produto_ids e/ou codigos_barras"""
+    data = request.json or {}
+    try:
+        produto_ids = [int(produto_id) for produto_id in data.get('produto_ids', [])]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'produto_ids deve conter apenas números'}), 400
+    codigos_barras = [str(codigo).strip() for codigo in data.get('codigos_barras', []) if str(codigo).strip()]
+    
+    if len(produto_ids) + len(codigos_barras) > MAX_PAGE_SIZE:
+        return jsonify({'error': f'Máximo de {MAX_PAGE_SIZE} chaves por consulta'}), 400
+    
+    by_id, by_barcode = lookup_produtos(produto_ids, codigos_barras)
+    
+    return jsonify({
+        'por_id': {str(produto_id): produto for produto_id, produto in by_id.items()},
+        'por_codigo_barras': by_barcode,
+        'nao_encontrados': {
+            'produto_ids': [produto_id for produto_id in produto_ids if produto_id not in by_id],
+            'codigos_barras': [codigo for codigo in codigos_barras if codigo not in by_barcode]
+        }
+    })
 
 @app.route('/api/produtos', methods=['POST'])
 @login_required
@@ -800,30 +3277,37 @@ def add_produto():
     """Adicionar novo produto"""
     data = request.json
     
-    # Inserir produto
     query = """
     INSERT INTO produtos (nome, descricao, categoria, preco, codigo_barras)
     VALUES (%(nome)s, %(descricao)s, %(categoria)s, %(preco)s, %(codigo_barras)s)
     """
-    produto_id = db.execute_query(query, data)
+    estoque_query = """
+    INSERT INTO estoque (produto_id, quantidade, estoque_minimo, estoque_maximo)
+    VALUES (%(produto_id)s, %(quantidade)s, %(estoque_minimo)s, %(estoque_maximo)s)
+    """
     
-    if produto_id:
-        # Criar entrada no estoque
-        estoque_query = """
-        INSERT INTO estoque (produto_id, quantidade, estoque_minimo, estoque_maximo)
-        VALUES (%(produto_id)s, %(quantidade)s, %(estoque_minimo)s, %(estoque_maximo)s)
-        """
-        estoque_data = {
-            'produto_id': produto_id,
-            'quantidade': data.get('quantidade', 0),
-            'estoque_minimo': data.get('estoque_minimo', 10),
-            'estoque_maximo': data.get('estoque_maximo', 100)
-        }
-        db.execute_query(estoque_query, estoque_data)
-        
-        return jsonify({'success': True, 'id': produto_id})
+    try:
+        with db.transaction():
+            # Inserir produto
+            produto_id = db.execute_query(query, data)
+            
+            # Criar entrada no estoque
+            estoque_data = {
+                'produto_id': produto_id,
+                'quantidade': data.get('quantidade', 0),
+                'estoque_minimo': data.get('estoque_minimo', 10),
+                'estoque_maximo': data.get('estoque_maximo', 100)
+            }
+            db.execute_query(estoque_query, estoque_data)
+    except Error as e:
+        print(f"Erro ao criar produto: {e}")
+        return jsonify({'success': False, 'error': 'Erro ao criar produto'})
     
-    return jsonify({'success': False, 'error': 'Erro ao criar produto'})
+    resource_versions.bump('produtos', 'estoque')
+    audit_log.record('produto.criado', 'produto', produto_id, {
+        'nome': data.get('nome'), 'codigo_barras': data.get('codigo_barras'), 'quantidade': estoque_data['quantidade']
+    })
+    return jsonify({'success': True, 'id': produto_id})
 
 @app.route('/api/produtos/<int:produto_id>', methods=['PUT'])
 @login_required
@@ -839,6 +3323,12 @@ def update_produto(produto_id):
     """
     data['id'] = produto_id
     result = db.execute_query(query, data)
+    invalidate_produto_cache(produto_id)
+    if result is not None:
+        resource_versions.bump('produtos')
+        audit_log.record('produto.atualizado', 'produto', produto_id, {
+            campo: data.get(campo) for campo in ('nome', 'categoria', 'preco', 'codigo_barras')
+        })
     
     return jsonify({'success': result is not None})
 
@@ -846,68 +3336,572 @@ def update_produto(produto_id):
 @login_required
 @permission_required('manage_products')
 def delete_produto(produto_id):
-    """Deletar produto"""
-    query = "DELETE FROM produtos WHERE id = %s"
-    result = db.execute_query(query, (produto_id,))
+    """Deletar produto (a marca em produtos_excluidos avisa os clientes da sincronização)"""
+    try:
+        with db.transaction() as transaction:
+            removidos = transaction.execute_update("DELETE FROM produtos WHERE id = %s", (produto_id,))
+            if removidos:
+                transaction.execute_update("""
+                INSERT INTO produtos_excluidos (produto_id) VALUES (%s)
+                ON DUPLICATE KEY UPDATE data_exclusao = CURRENT_TIMESTAMP
+                """, (produto_id,))
+    except Error as e:
+        print(f"Erro ao deletar produto {produto_id}: {e}")
+        return jsonify({'success': False})
     
-    return jsonify({'success': result is not None})
+    invalidate_produto_cache(produto_id)
+    resource_versions.bump('produtos', 'estoque')
+    audit_log.record('produto.excluido', 'produto', produto_id)
+    return jsonify({'success': True})
+
+# Sincronização incremental do catálogo
+# Cada fonte é lida por keyset na ordem de chave; a posição de cada uma vai no
+# token since. Só entram linhas alteradas há mais de settle_seconds, para que
+# um commit ainda em andamento com data anterior não fique para trás da marca.
+SYNC_PRODUTO_CAMPOS = ['id', 'nome', 'descricao', 'categoria', 'preco', 'codigo_barras', 'data_atualizacao']
+SYNC_ESTOQUE_CAMPOS = f"""e.produto_id, {ESTOQUE_QUANTIDADE_SQL} AS quantidade,
+       e.estoque_minimo, e.estoque_maximo"""
+
+SYNC_FONTES = {
+    'produtos': {
+        'query': f"""
+        SELECT {', '.join(PRODUTO_FIELDS[f] + ' AS ' + f for f in SYNC_PRODUTO_CAMPOS)}, p.data_atualizacao AS alterado
+        FROM produtos p""",
+        'chave': ['p.data_atualizacao', 'p.id'],
+        'campos': ['alterado', 'id']
+    },
+    'estoque': {
+        'query': f"""
+        SELECT {SYNC_ESTOQUE_CAMPOS}, e.data_atualizacao AS alterado
+        FROM estoque e""",
+        'chave': ['e.data_atualizacao', 'e.produto_id'],
+        'campos': ['alterado', 'produto_id']
+    },
+    # Saídas em produtos com contador fracionado só alteram estoque_shards
+    'fracoes': {
+        'query': f"""
+        SELECT {SYNC_ESTOQUE_CAMPOS}, s.shard, s.data_atualizacao AS alterado
+        FROM estoque_shards s
+        JOIN estoque e ON e.produto_id = s.produto_id""",
+        'chave': ['s.data_atualizacao', 's.produto_id', 's.shard'],
+        'campos': ['alterado', 'produto_id', 'shard']
+    },
+    'excluidos': {
+        'query': """
+        SELECT x.produto_id, x.data_exclusao AS alterado
+        FROM produtos_excluidos x""",
+        'chave': ['x.data_exclusao', 'x.produto_id'],
+        'campos': ['alterado', 'produto_id']
+    }
+}
+
+def keyset_condition(colunas, valores):
+    """Condição para as linhas após a chave valores na ordem de colunas.
+
+    A primeira coluna também é comparada com >= isoladamente, para que o
+    MySQL use o índice como intervalo.
+    """
+    sql, params = f"{colunas[-1]} > %s", [valores[-1]]
+    for coluna, valor in zip(reversed(colunas[:-1]), reversed(valores[:-1])):
+        sql = f"({coluna} > %s OR ({coluna} = %s AND {sql}))"
+        params = [valor, valor] + params
+    return f"{colunas[0]} >= %s AND {sql}", [valores[0]] + params
+
+def sync_posicoes_iniciais():
+    """Posições de uma sincronização completa: todo o catálogo, e só as exclusões a partir de agora"""
+    rows = db.execute_query("SELECT NOW() - INTERVAL %s SECOND AS inicio", (SYNC_CONFIG['settle_seconds'],))
+    if not rows:
+        raise Error('Banco de dados indisponível')
+    return {'produtos': None, 'estoque': None, 'fracoes': None, 'excluidos': [str(rows[0]['inicio']), 0]}
+
+def decode_sync_token(token):
+    """Posições por fonte a partir do token since (ValueError se inválido)"""
+    valores = decode_cursor(token)
+    if len(valores) != len(SYNC_FONTES):
+        raise ValueError('Token since inválido')
+    posicoes = {}
+    for nome, posicao in zip(SYNC_FONTES, valores):
+        if posicao is not None and (not isinstance(posicao, list) or len(posicao) != len(SYNC_FONTES[nome]['campos'])):
+            raise ValueError('Token since inválido')
+        posicoes[nome] = posicao
+    return posicoes
+
+def listar_alteracoes(nome, posicao, limit):
+    """Até limit + 1 linhas da fonte alteradas depois de posicao, na ordem da chave"""
+    fonte = SYNC_FONTES[nome]
+    conditions = [f"{fonte['chave'][0]} <= NOW() - INTERVAL %s SECOND"]
+    params = [SYNC_CONFIG['settle_seconds']]
+    if posicao is not None:
+        condicao, valores = keyset_condition(fonte['chave'], posicao)
+        conditions.append(condicao)
+        params.extend(valores)
+    query = f"""{fonte['query']}
+    WHERE {' AND '.join(conditions)}
+    ORDER BY {', '.join(fonte['chave'])}
+    LIMIT %s"""
+    return db.execute_query(query, tuple(params) + (limit + 1,))
+
+@app.route('/api/sync/catalogo', methods=['GET'])
+@login_required
+def sync_catalogo():
+    """Alterações do catálogo desde o token since (sem since: catálogo completo).
+
+    Resposta: produtos e estoque alterados (substituir pelo id/produto_id),
+    excluidos (ids a remover, aplicar por último), since para a próxima chamada
+    e has_more (chamar de novo imediatamente). limit vale por fonte. Token mais
+    antigo que a retenção das exclusões responde 410: sincronizar do zero.
+    """
+    try:
+        limit = parse_page_size(default=MAX_PAGE_SIZE)
+        posicoes = decode_sync_token(request.args['since']) if request.args.get('since') else None
+        if posicoes is not None and posicoes['excluidos'] is not None:
+            marca = datetime.fromisoformat(str(posicoes['excluidos'][0]))
+            if marca < datetime.now() - timedelta(days=SYNC_CONFIG['tombstone_days']):
+                return jsonify({'error': 'Token since expirado; sincronize o catálogo completo', 'reset': True}), 410
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # Mesma conexão para todas as fontes; erros propagam em vez de parecer "sem alterações"
+        with db.transaction():
+            if posicoes is None:
+                posicoes = sync_posicoes_iniciais()
+            linhas = {nome: listar_alteracoes(nome, posicoes[nome], limit) for nome in SYNC_FONTES}
+    except Error as e:
+        print(f"Erro na sincronização do catálogo: {e}")
+        return jsonify({'success': False, 'error': 'Erro ao buscar alterações'}), 500
+    
+    has_more = False
+    for nome, rows in linhas.items():
+        if len(rows) > limit:
+            has_more = True
+            del rows[limit:]
+        if rows:
+            posicoes[nome] = [rows[-1][campo] for campo in SYNC_FONTES[nome]['campos']]
+        for row in rows:
+            row.pop('alterado')
+            row.pop('shard', None)
+    
+    # Linhas do mesmo produto vindas de estoque e das frações são iguais
+    estoque = {row['produto_id']: row for row in linhas['estoque'] + linhas['fracoes']}
+    return jsonify({
+        'produtos': linhas['produtos'],
+        'estoque': list(estoque.values()),
+        'excluidos': [row['produto_id'] for row in linhas['excluidos']],
+        'since': encode_cursor([posicoes[nome] for nome in SYNC_FONTES]),
+        'has_more': has_more
+    })
+
+# Movimentações de estoque
+# A aplicação é o único caminho que altera estoque.quantidade: o UPDATE condicional
+# e o registro em movimentacoes são gravados na mesma transação.
+ESTOQUE_ENTRADA_QUERY = "UPDATE estoque SET quantidade = quantidade + %s WHERE produto_id = %s"
+ESTOQUE_SAIDA_QUERY = "UPDATE estoque SET quantidade = quantidade - %s WHERE produto_id = %s AND quantidade >= %s"
+MOVIMENTACAO_INSERT_QUERY = """
+INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao, usuario_id, chave_idempotencia, data_movimento)
+VALUES (%s, %s, %s, %s, %s, %s, NOW())
+"""
+
+# Chave gerada pelo cliente para que reenvios (fila offline, timeout) não dupliquem a movimentação
+CHAVE_IDEMPOTENCIA_RE = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+def validar_movimentacao(linha):
+    """Normalizar uma linha de movimentação; retorna (movimento, erro)"""
+    if not isinstance(linha, dict):
+        return None, 'Linha inválida'
+    try:
+        produto_id = int(linha.get('produto_id'))
+        quantidade = int(linha.get('quantidade'))
+    except (TypeError, ValueError):
+        return None, 'produto_id e quantidade devem ser números inteiros'
+    tipo = str(linha.get('tipo', '')).upper()
+    if tipo not in ('ENTRADA', 'SAIDA'):
+        return None, 'tipo deve ser ENTRADA ou SAIDA'
+    if quantidade <= 0:
+        return None, 'quantidade deve ser maior que zero'
+    chave = linha.get('chave_idempotencia')
+    if chave is not None and (not isinstance(chave, str) or not CHAVE_IDEMPOTENCIA_RE.fullmatch(chave)):
+        return None, 'chave_idempotencia deve ter de 1 a 64 letras, números, - ou _'
+    
+    descricao = linha.get('descricao') or ('Entrada de estoque' if tipo == 'ENTRADA' else 'Saída de estoque')
+    return {
+        'produto_id': produto_id, 'tipo': tipo, 'quantidade': quantidade, 'descricao': descricao,
+        'usuario_id': session.get('user_id'),  # Autor da movimentação (feed de atividades)
+        'chave_idempotencia': chave
+    }, None
+
+# Contador fracionado: produtos muito movimentados podem ter o saldo dividido em
+# N linhas de estoque_shards (somadas na leitura), para que saídas concorrentes
+# não disputem o bloqueio da mesma linha de estoque.
+MAX_ESTOQUE_SHARDS = 64
+SHARD_AJUSTE_QUERY = "UPDATE estoque_shards SET quantidade = quantidade + %s WHERE produto_id = %s AND shard = %s"
+SHARD_SAIDA_QUERY = """
+UPDATE estoque_shards SET quantidade = quantidade - %s
+WHERE produto_id = %s AND shard = %s AND quantidade >= %s
+"""
+
+def get_estoque_shards(produto_id, refresh=False):
+    """Número de frações do contador de estoque do produto (0 = linha única)"""
+    shards = None if refresh else shard_cache.get(produto_id)
+    if shards is None:
+        rows = db.execute_query("SELECT shards FROM estoque WHERE produto_id = %s", (produto_id,))
+        if rows is None:
+            return 0
+        shards = rows[0]['shards'] if rows else 0
+        shard_cache.set(produto_id, shards)
+    return shards
+
+def distribuir_entre_fracoes(fracoes, delta):
+    """Dividir delta entre as frações {shard: quantidade}; retorna [(shard, ajuste)].
+
+    Entradas vão para a fração com menor saldo; saídas são retiradas das frações
+    com maior saldo. A chave None representa a linha principal de estoque.
+    """
+    if delta >= 0:
+        shard = min((s for s in fracoes if s is not None), key=lambda s: fracoes[s], default=None)
+        return [(shard, delta)]
+    
+    ajustes = []
+    restante = -delta
+    for shard in sorted(fracoes, key=lambda s: fracoes[s], reverse=True):
+        if restante == 0:
+            break
+        retirar = min(restante, fracoes[shard])
+        if retirar > 0:
+            ajustes.append((shard, -retirar))
+            restante -= retirar
+    return ajustes
+
+def aplicar_ajustes_fracoes(transaction, produto_id, ajustes):
+    """Gravar ajustes calculados por distribuir_entre_fracoes"""
+    principal = sum(ajuste for shard, ajuste in ajustes if shard is None)
+    if principal:
+        transaction.execute_update(ESTOQUE_ENTRADA_QUERY, (principal, produto_id))
+    transaction.execute_many(
+        SHARD_AJUSTE_QUERY,
+        [(ajuste, produto_id, shard) for shard, ajuste in ajustes if shard is not None]
+    )
+
+def movimentar_estoque_fracionado(transaction, movimento, shards):
+    """Aplicar movimentação em produto com contador fracionado; retorna linhas alteradas"""
+    produto_id, quantidade = movimento['produto_id'], movimento['quantidade']
+    shard = random.randrange(shards)
+    
+    if movimento['tipo'] == 'ENTRADA':
+        return transaction.execute_update(SHARD_AJUSTE_QUERY, (quantidade, produto_id, shard))
+    
+    if transaction.execute_update(SHARD_SAIDA_QUERY, (quantidade, produto_id, shard, quantidade)):
+        return 1
+    
+    # A fração sorteada não tem saldo: bloquear todas e retirar de várias
+    principal = transaction.execute(
+        "SELECT quantidade FROM estoque WHERE produto_id = %s FOR UPDATE", (produto_id,)
+    )
+    rows = transaction.execute(
+        "SELECT shard, quantidade FROM estoque_shards WHERE produto_id = %s ORDER BY shard FOR UPDATE",
+        (produto_id,)
+    )
+    if not principal or not rows:
+        return 0
+    fracoes = {row['shard']: row['quantidade'] for row in rows}
+    fracoes[None] = principal[0]['quantidade'] or 0
+    if sum(fracoes.values()) < quantidade:
+        return 0
+    
+    ajustes = distribuir_entre_fracoes(fracoes, -quantidade)
+    aplicar_ajustes_fracoes(transaction, produto_id, ajustes)
+    return len(ajustes)
+
+def movimentacao_registrada(chave):
+    """Verificar se a movimentação com esta chave de idempotência já foi gravada"""
+    return bool(db.execute_query("SELECT 1 FROM movimentacoes WHERE chave_idempotencia = %s", (chave,)))
+
+def registrar_movimentacao(movimento):
+    """Aplicar uma movimentação validada; retorna False se o estoque não pôde ser alterado.
+
+    Se a chave_idempotencia já foi gravada o estoque não é alterado de novo:
+    o movimento é marcado como duplicada e o retorno é True.
+    """
+    produto_id, quantidade = movimento['produto_id'], movimento['quantidade']
+    chave = movimento['chave_idempotencia']
+    shards = get_estoque_shards(produto_id)
+    
+    try:
+        while True:
+            with db.transaction() as transaction:
+                if chave and movimentacao_registrada(chave):
+                    movimento['duplicada'] = True
+                    return True
+                
+                if shards:
+                    updated = movimentar_estoque_fracionado(transaction, movimento, shards)
+                elif movimento['tipo'] == 'ENTRADA':
+                    updated = transaction.execute_update(ESTOQUE_ENTRADA_QUERY, (quantidade, produto_id))
+                else:
+                    # Decremento atômico: só altera se houver saldo suficiente
+                    updated = transaction.execute_update(ESTOQUE_SAIDA_QUERY, (quantidade, produto_id, quantidade))
+                
+                if updated:
+                    transaction.execute(MOVIMENTACAO_INSERT_QUERY, (produto_id, movimento['tipo'], quantidade,
+                                                                      movimento['descricao'], movimento['usuario_id'], chave))
+                    break
+            
+            # A configuração de frações pode ter mudado em outro processo: tentar de novo só nesse caso
+            atual = get_estoque_shards(produto_id, refresh=True)
+            if atual == shards:
+                # Um reenvio simultâneo da mesma chave pode ter consumido o saldo
+                if chave and movimentacao_registrada(chave):
+                    movimento['duplicada'] = True
+                    return True
+                return False
+            shards = atual
+    except IntegrityError as e:
+        # Reenvio simultâneo gravou a mesma chave primeiro (índice único); a transação foi desfeita
+        if not chave or e.errno != errorcode.ER_DUP_ENTRY:
+            raise
+        movimento['duplicada'] = True
+        return True
+    
+    invalidate_produto_cache(produto_id)
+    resource_versions.bump('estoque')
+    event_broker.notify()
+    return True
 
 @app.route('/api/estoque/<int:produto_id>/entrada', methods=['POST'])
 @login_required
 @permission_required('manage_inventory')
 def entrada_estoque(produto_id):
     """Registrar entrada de estoque"""
-    data = request.json
-    quantidade = data['quantidade']
-    
-    # Atualizar estoque
-    query = """
-    UPDATE estoque 
-    SET quantidade = quantidade + %s
-    WHERE produto_id = %s
-    """
-    db.execute_query(query, (quantidade, produto_id))
+    data = request.json or {}
+    movimento, erro = validar_movimentacao(dict(data, produto_id=produto_id, tipo='ENTRADA'))
+    if erro:
+        return jsonify({'success': False, 'error': erro}), 400
     
-    # Registrar movimentação
-    mov_query = """
-    INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao, data_movimento)
-    VALUES (%s, 'ENTRADA', %s, %s, NOW())
-    """
-    db.execute_query(mov_query, (produto_id, quantidade, data.get('descricao', 'Entrada de estoque')))
+    try:
+        if not registrar_movimentacao(movimento):
+            return jsonify({'success': False, 'error': 'Produto não encontrado'}), 404
+    except Error as e:
+        print(f"Erro ao registrar entrada de estoque: {e}")
+        return jsonify({'success': False, 'error': 'Erro ao registrar entrada'}), 500
     
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'duplicada': movimento.get('duplicada', False)})
 
 @app.route('/api/estoque/<int:produto_id>/saida', methods=['POST'])
 @login_required
 @permission_required('manage_inventory')
 def saida_estoque(produto_id):
     """Registrar saída de estoque"""
-    data = request.json
-    quantidade = data['quantidade']
+    data = request.json or {}
+    movimento, erro = validar_movimentacao(dict(data, produto_id=produto_id, tipo='SAIDA'))
+    if erro:
+        return jsonify({'success': False, 'error': erro}), 400
     
-    # Verificar se há estoque suficiente
-    check_query = "SELECT quantidade FROM estoque WHERE produto_id = %s"
-    result = db.execute_query(check_query, (produto_id,))
-    
-    if not result or result[0]['quantidade'] < quantidade:
-        return jsonify({'success': False, 'error': 'Estoque insuficiente'})
+    try:
+        # Sem a linha o decremento condicional também não altera nada: separar os dois casos
+        if product_cache.get(produto_id) is None:
+            rows = db.execute_query("SELECT 1 FROM produtos WHERE id = %s", (produto_id,))
+            if rows is None:
+                return jsonify({'success': False, 'error': 'Erro ao registrar saída'}), 500
+            if not rows:
+                return jsonify({'success': False, 'error': 'Produto não encontrado'}), 404
+        if not registrar_movimentacao(movimento):
+            return jsonify({'success': False, 'error': 'Estoque insuficiente'})
+    except Error as e:
+        print(f"Erro ao registrar saída de estoque: {e}")
+        return jsonify({'success': False, 'error': 'Erro ao registrar saída'}), 500
     
-    # Atualizar estoque
-    query = """
-    UPDATE estoque 
-    SET quantidade = quantidade - %s
-    WHERE produto_id = %s
+    return jsonify({'success': True, 'duplicada': movimento.get('duplicada', False)})
+
+# Movimentações em lote
+MAX_BATCH_MOVEMENTS = 1000
+
+def aplicar_movimentacoes(movimentos):
+    """Aplicar movimentações já validadas em uma única transação.
+
+    As linhas de estoque envolvidas são bloqueadas (em ordem de produto_id, para
+    evitar deadlocks) e as movimentações são avaliadas na ordem recebida; uma saída
+    maior que o saldo é rejeitada sem afetar as demais. Movimentações cuja
+    chave_idempotencia já foi gravada são marcadas como duplicada e não alteram
+    o estoque. Retorna uma lista de (movimento, erro, saldo_final) na mesma ordem.
     """
-    db.execute_query(query, (quantidade, produto_id))
+    produto_ids = sorted({m['produto_id'] for m in movimentos})
+    if not produto_ids:
+        return []
     
-    # Registrar movimentação
-    mov_query = """
-    INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao, data_movimento)
-    VALUES (%s, 'SAIDA', %s, %s, NOW())
-    """
-    db.execute_query(mov_query, (produto_id, quantidade, data.get('descricao', 'Saída de estoque')))
+    with db.transaction() as transaction:
+        placeholders = ', '.join(['%s'] * len(produto_ids))
+        rows = transaction.execute(
+            f"SELECT produto_id, quantidade, shards FROM estoque WHERE produto_id IN ({placeholders}) "
+            "ORDER BY produto_id FOR UPDATE",
+            tuple(produto_ids)
+        )
+        saldos = {row['produto_id']: row['quantidade'] or 0 for row in rows}
+        
+        # Produtos com contador fracionado: saldo inclui as frações
+        fracoes = {row['produto_id']: {None: row['quantidade'] or 0} for row in rows if row['shards']}
+        if fracoes:
+            fracionados = sorted(fracoes)
+            shard_rows = transaction.execute(
+                f"SELECT produto_id, shard, quantidade FROM estoque_shards "
+                f"WHERE produto_id IN ({', '.join(['%s'] * len(fracionados))}) "
+                "ORDER BY produto_id, shard FOR UPDATE",
+                tuple(fracionados)
+            )
+            for row in shard_rows:
+                fracoes[row['produto_id']][row['shard']] = row['quantidade']
+                saldos[row['produto_id']] += row['quantidade']
+        
+        # Lido depois dos bloqueios: um lote concorrente com as mesmas chaves já terminou.
+        # Se ainda assim houver corrida, o índice único rejeita o lote inteiro.
+        chaves = list({m['chave_idempotencia'] for m in movimentos if m['chave_idempotencia']})
+        gravadas = set()
+        if chaves:
+            rows = transaction.execute(
+                f"SELECT chave_idempotencia FROM movimentacoes "
+                f"WHERE chave_idempotencia IN ({', '.join(['%s'] * len(chaves))})",
+                tuple(chaves)
+            )
+            gravadas = {row['chave_idempotencia'] for row in rows}
+        
+        resultados = []
+        deltas = {}
+        aceitos = []
+        for movimento in movimentos:
+            produto_id = movimento['produto_id']
+            chave = movimento['chave_idempotencia']
+            if chave in gravadas:
+                movimento['duplicada'] = True
+                resultados.append((movimento, None, None))
+                continue
+            if produto_id not in saldos:
+                resultados.append((movimento, 'Produto não encontrado', None))
+                continue
+            delta = movimento['quantidade'] if movimento['tipo'] == 'ENTRADA' else -movimento['quantidade']
+            if saldos[produto_id] + delta < 0:
+                resultados.append((movimento, 'Estoque insuficiente', saldos[produto_id]))
+                continue
+            saldos[produto_id] += delta
+            deltas[produto_id] = deltas.get(produto_id, 0) + delta
+            aceitos.append(movimento)
+            if chave:
+                gravadas.add(chave)
+            resultados.append((movimento, None, saldos[produto_id]))
+        
+        if aceitos:
+            transaction.execute_many(
+                ESTOQUE_ENTRADA_QUERY,
+                [(delta, produto_id) for produto_id, delta in deltas.items() if delta and produto_id not in fracoes]
+            )
+            for produto_id, delta in deltas.items():
+                if delta and produto_id in fracoes:
+                    aplicar_ajustes_fracoes(transaction, produto_id, distribuir_entre_fracoes(fracoes[produto_id], delta))
+            transaction.execute_many(
+                MOVIMENTACAO_INSERT_QUERY,
+                [(m['produto_id'], m['tipo'], m['quantidade'], m['descricao'], m['usuario_id'], m['chave_idempotencia'])
+                 for m in aceitos]
+            )
     
-    return jsonify({'success': True})
+    for produto_id in deltas:
+        invalidate_produto_cache(produto_id)
+    if deltas:
+        resource_versions.bump('estoque')
+        event_broker.notify()
+    return resultados
+
+@app.route('/api/estoque/lote', methods=['POST'])
+@login_required
+@permission_required('manage_inventory')
+def movimentacoes_lote():
+    """Registrar várias entradas/saídas de estoque em uma única transação"""
+    data = request.json or {}
+    linhas = data.get('movimentacoes')
+    
+    if not isinstance(linhas, list) or not linhas:
+        return jsonify({'success': False, 'error': 'Informe a lista de movimentacoes'}), 400
+    if len(linhas) > MAX_BATCH_MOVEMENTS:
+        return jsonify({'success': False, 'error': f'Máximo de {MAX_BATCH_MOVEMENTS} movimentações por lote'}), 400
+    
+    resultados = [None] * len(linhas)
+    validos = []
+    for indice, linha in enumerate(linhas):
+        movimento, erro = validar_movimentacao(linha)
+        if erro:
+            resultados[indice] = {'linha': indice, 'success': False, 'error': erro}
+        else:
+            validos.append((indice, movimento))
+    
+    try:
+        aplicados = aplicar_movimentacoes([movimento for _, movimento in validos])
+    except Error as e:
+        print(f"Erro ao registrar movimentações em lote: {e}")
+        return jsonify({'success': False, 'error': 'Erro ao registrar movimentações'}), 500
+    
+    for (indice, _), (movimento, erro, saldo) in zip(validos, aplicados):
+        resultado = {'linha': indice, 'success': erro is None, 'produto_id': movimento['produto_id']}
+        if erro:
+            resultado['error'] = erro
+        if movimento.get('duplicada'):
+            resultado['duplicada'] = True
+        if saldo is not None:
+            resultado['quantidade'] = saldo
+        resultados[indice] = resultado
+    
+    aceitas = sum(1 for resultado in resultados if resultado['success'])
+    return jsonify({
+        'success': True,
+        'aceitas': aceitas,
+        'rejeitadas': len(resultados) - aceitas,
+        'resultados': resultados
+    })
+
+@app.route('/api/estoque/<int:produto_id>/shards', methods=['PUT'])
+@admin_required
+def configurar_estoque_shards(produto_id):
+    """Ativar (shards > 0), redimensionar ou desativar (shards = 0) o contador fracionado"""
+    data = request.json or {}
+    try:
+        shards = int(data.get('shards'))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'shards deve ser um número inteiro'}), 400
+    if not 0 <= shards <= MAX_ESTOQUE_SHARDS:
+        return jsonify({'success': False, 'error': f'shards deve estar entre 0 e {MAX_ESTOQUE_SHARDS}'}), 400
+    
+    try:
+        with db.transaction() as transaction:
+            rows = transaction.execute(
+                "SELECT quantidade FROM estoque WHERE produto_id = %s FOR UPDATE", (produto_id,)
+            )
+            if not rows:
+                return jsonify({'success': False, 'error': 'Produto não encontrado'}), 404
+            
+            # Consolidar o saldo atual e redistribuir entre as novas frações
+            fracoes = transaction.execute(
+                "SELECT quantidade FROM estoque_shards WHERE produto_id = %s FOR UPDATE", (produto_id,)
+            )
+            total = (rows[0]['quantidade'] or 0) + sum(row['quantidade'] for row in fracoes)
+            transaction.execute("DELETE FROM estoque_shards WHERE produto_id = %s", (produto_id,))
+            
+            if shards:
+                base, resto = divmod(total, shards)
+                transaction.execute_many(
+                    "INSERT INTO estoque_shards (produto_id, shard, quantidade) VALUES (%s, %s, %s)",
+                    [(produto_id, shard, base + (1 if shard < resto else 0)) for shard in range(shards)]
+                )
+                transaction.execute(
+                    "UPDATE estoque SET quantidade = 0, shards = %s WHERE produto_id = %s", (shards, produto_id)
+                )
+            else:
+                transaction.execute(
+                    "UPDATE estoque SET quantidade = %s, shards = 0 WHERE produto_id = %s", (total, produto_id)
+                )
+    except Error as e:
+        print(f"Erro ao configurar frações do estoque: {e}")
+        return jsonify({'success': False, 'error': 'Erro ao configurar frações do estoque'}), 500
+    
+    shard_cache.set(produto_id, shards)
+    invalidate_produto_cache(produto_id)
+    audit_log.record('estoque.fracoes', 'produto', produto_id, {'shards': shards, 'quantidade': total})
+    return jsonify({'success': True, 'shards': shards, 'quantidade': total})
 
 @app.route('/api/movimentacoes/<int:produto_id>')
 @login_required
@@ -927,14 +3921,15 @@ def get_movimentacoes(produto_id):
 @app.route('/api/relatorio/estoque-baixo')
 @login_required
 @permission_required('view_reports')
+@conditional_get('produtos', 'estoque')
 def relatorio_estoque_baixo():
     """Relatório de produtos com estoque baixo"""
-    query = """
-    SELECT p.nome, p.categoria, e.quantidade, e.estoque_minimo
+    query = f"""
+    SELECT p.id, p.nome, p.categoria, {ESTOQUE_QUANTIDADE_SQL} AS quantidade, e.estoque_minimo
     FROM produtos p
     JOIN estoque e ON p.id = e.produto_id
-    WHERE e.quantidade <= e.estoque_minimo
-    ORDER BY e.quantidade ASC
+    WHERE {ESTOQUE_QUANTIDADE_SQL} <= e.estoque_minimo
+    ORDER BY quantidade ASC
     """
     produtos = db.execute_query(query)
     return jsonify(produtos if produtos else [])
@@ -942,10 +3937,12 @@ def relatorio_estoque_baixo():
 @app.route('/api/relatorio/movimentacoes')
 @login_required
 @permission_required('view_reports')
+@conditional_get('produtos', 'estoque')
 def relatorio_movimentacoes():
     """Relatório de movimentações recentes"""
     query = """
-    SELECT m.*, p.nome as produto_nome, p.categoria
+    SELECT m.*, p.nome as produto_nome, p.categoria,
+           DATE(m.data_movimento) = CURDATE() AS hoje
     FROM movimentacoes m
     JOIN produtos p ON m.produto_id = p.id
     ORDER BY m.data_movimento DESC
@@ -954,6 +3951,356 @@ def relatorio_movimentacoes():
     movimentacoes = db.execute_query(query)
     return jsonify(movimentacoes if movimentacoes else [])
 
+# Exportação CSV (streaming)
+EXPORT_SECOES = ('produtos', 'movimentacoes', 'estoque-baixo')
+EXPORT_FETCH_SIZE = 500
+
+def export_queries(secoes, categoria, inicio, fim):
+    """(título, cabeçalho, query, parâmetros, formatar linha) de cada seção pedida"""
+    filtro_categoria = " AND p.categoria = %s" if categoria else ""
+    params_categoria = (categoria,) if categoria else ()
+    
+    def data_hora(value):
+        return value.strftime('%d/%m/%Y %H:%M') if value else ''
+    
+    if 'produtos' in secoes:
+        yield ('PRODUTOS',
+               ['ID', 'Nome', 'Categoria', 'Preço', 'Código de Barras', 'Quantidade', 'Estoque Mínimo', 'Estoque Máximo'],
+               f"""
+               SELECT p.id, p.nome, p.categoria, p.preco, p.codigo_barras,
+                      COALESCE({ESTOQUE_QUANTIDADE_SQL}, 0), COALESCE(e.estoque_minimo, 0), COALESCE(e.estoque_maximo, 0)
+               FROM produtos p
+               LEFT JOIN estoque e ON p.id = e.produto_id
+               WHERE 1 = 1{filtro_categoria}
+               ORDER BY p.id
+               """, params_categoria,
+               lambda row: row)
+    
+    if 'movimentacoes' in secoes:
+        filtro_data = ""
+        params = list(params_categoria)
+        if inicio:
+            filtro_data += " AND m.data_movimento >= %s"
+            params.append(inicio)
+        if fim:
+            filtro_data += " AND m.data_movimento < %s"
+            params.append(fim + timedelta(days=1))  # Dia final inclusivo
+        yield ('MOVIMENTAÇÕES',
+               ['Data/Hora', 'Produto', 'Categoria', 'Tipo', 'Quantidade', 'Descrição'],
+               f"""
+               SELECT m.data_movimento, p.nome, p.categoria, m.tipo, m.quantidade, m.descricao
+               FROM movimentacoes m
+               JOIN produtos p ON m.produto_id = p.id
+               WHERE 1 = 1{filtro_categoria}{filtro_data}
+               ORDER BY m.data_movimento DESC
+               """, tuple(params),
+               lambda row: (data_hora(row[0]),) + tuple(row[1:]))
+    
+    if 'estoque-baixo' in secoes:
+        yield ('PRODUTOS COM ESTOQUE BAIXO',
+               ['Produto', 'Categoria', 'Quantidade Atual', 'Estoque Mínimo'],
+               f"""
+               SELECT p.nome, p.categoria, {ESTOQUE_QUANTIDADE_SQL} AS quantidade, e.estoque_minimo
+               FROM produtos p
+               JOIN estoque e ON p.id = e.produto_id
+               WHERE {ESTOQUE_QUANTIDADE_SQL} <= e.estoque_minimo{filtro_categoria}
+               ORDER BY quantidade ASC
+               """, params_categoria,
+               lambda row: row)
+
+@app.route('/api/relatorio/exportar')
+@login_required
+@permission_required('view_reports')
+def exportar_relatorio():
+    """Exportar produtos, movimentações e estoque baixo em CSV, gerado em streaming.
+
+    Parâmetros: secoes (lista separada por vírgula, padrão: todas), categoria,
+    inicio e fim (AAAA-MM-DD, filtram as movimentações). As linhas são lidas com
+    cursor sem buffer e escritas conforme chegam, então a memória usada não
+    depende do tamanho das tabelas; todas as seções vêm do mesmo snapshot.
+    """
+    secoes = [s.strip() for s in request.args.get('secoes', ','.join(EXPORT_SECOES)).split(',') if s.strip()]
+    invalidas = [s for s in secoes if s not in EXPORT_SECOES]
+    if invalidas or not secoes:
+        return jsonify({'error': f"secoes deve conter apenas: {', '.join(EXPORT_SECOES)}"}), 400
+    try:
+        inicio = parse_date_param('inicio')
+        fim = parse_date_param('fim')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if inicio and fim and inicio > fim:
+        return jsonify({'error': 'inicio deve ser anterior a fim'}), 400
+    categoria = request.args.get('categoria', '').strip() or None
+    
+    def generate():
+        # Conexão obtida só quando o download começa: o finally abaixo sempre a devolve
+        connection = db.get_connection()
+        if connection is None:
+            yield 'ERRO: banco de dados indisponível\n'
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        
+        def flush():
+            data = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return data
+        
+        completed = False
+        try:
+            connection.start_transaction(consistent_snapshot=True, readonly=True)
+            yield '\ufeff'  # BOM: acentos corretos ao abrir no Excel
+            for index, (titulo, cabecalho, query, params, formatar) in enumerate(
+                    export_queries(secoes, categoria, inicio, fim)):
+                if index:
+                    writer.writerow([])
+                writer.writerow([titulo])
+                writer.writerow(cabecalho)
+                yield flush()
+                cursor = connection.cursor()  # Sem buffer: linhas lidas do servidor aos poucos
+                try:
+                    timed_execute(cursor, query, params)
+                    while True:
+                        rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+                        if not rows:
+                            break
+                        writer.writerows(formatar(row) for row in rows)
+                        yield flush()
+                finally:
+                    try:
+                        cursor.close()
+                    except Error:
+                        pass
+            completed = True
+        except Error as e:
+            print(f"Erro na exportação CSV: {e}")
+            writer.writerow([])
+            writer.writerow(['ERRO: exportação incompleta'])
+            yield flush()
+        finally:
+            if completed:
+                db.release_connection(connection)
+            else:
+                # Resultado não lido até o fim (cliente desconectou ou erro): não devolver ao pool
+                db.discard_connection(connection)
+    
+    filename = f"relatorio_estoque_{datetime.now().strftime('%Y%m%d_%H%M')}.csv"
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# Eventos em tempo real (SSE)
+class EventBroker:
+    """Distribui eventos de movimentação e estoque para os clientes SSE deste processo.
+
+    Uma única thread por processo lê as movimentações novas (id > último visto) e
+    repassa para todos os assinantes; ela só roda enquanto houver assinantes.
+    O id é atribuído no INSERT, não no commit: ids pulados na sequência são
+    procurados de novo por late_window segundos, para que uma transação que
+    termina depois de outra com id maior não se perca.
+    Commits neste processo chamam notify() para a leitura acontecer na hora;
+    movimentações feitas por outros processos chegam em até poll_interval.
+    Cada assinante prende uma thread do servidor, então no máximo max_clients
+    são aceitos; subscribe() retorna None além disso. Movimentações levam o id
+    no campo id: do SSE; na reconexão o cliente o devolve e replay() reenvia
+    o que veio depois.
+    """
+    MAX_GAP = 1000  # Saltos maiores (auto_increment reajustado) não são rastreados
+    BATCH = 500
+    QUERY = f"""
+    SELECT m.id, m.produto_id, m.tipo, m.quantidade, m.descricao, m.data_movimento,
+           DATE(m.data_movimento) = CURDATE() AS hoje,
+           p.nome AS produto_nome, p.categoria,
+           {ESTOQUE_QUANTIDADE_SQL} AS estoque_atual, e.estoque_minimo
+    FROM movimentacoes m
+    JOIN produtos p ON m.produto_id = p.id
+    LEFT JOIN estoque e ON e.produto_id = m.produto_id
+    WHERE m.id > %s{{gaps}}
+    ORDER BY m.id
+    LIMIT {BATCH}
+    """
+
+    def __init__(self, poll_interval=2, keepalive=15, queue_size=1000, max_clients=8, late_window=30):
+        self.poll_interval = poll_interval
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.max_clients = max_clients
+        self.late_window = late_window
+        self._gaps = {}  # id pulado -> time.monotonic() em que foi notado
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._last_id = None
+
+    def subscribe(self):
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='event-broker', daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def notify(self):
+        """Pedir leitura imediata de novas movimentações (chamado após commit)"""
+        if self._subscribers:
+            self._wakeup.set()
+
+    def _format(self, event, data, event_id=None):
+        event_id = f"id: {event_id}\n" if event_id is not None else ''
+        return f"event: {event}\n{event_id}data: {json.dumps(data, default=self._json_default)}\n\n"
+
+    def publish(self, event, data, event_id=None):
+        message = self._format(event, data, event_id)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Cliente lento: descartar pendências e pedir que recarregue tudo
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait("event: resync\ndata: {}\n\n")
+
+    @staticmethod
+    def _json_default(value):
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    # Próximo assinante começa a partir das movimentações novas
+                    self._thread = None
+                    self._last_id = None
+                    self._gaps.clear()
+                    return
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"[EVENTOS] Erro ao ler movimentações: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _poll(self):
+        if self._last_id is None:
+            rows = db.execute_query("SELECT COALESCE(MAX(id), 0) AS last_id FROM movimentacoes")
+            if rows is not None:
+                self._last_id = rows[0]['last_id']
+            return
+        
+        # Ids pulados há mais de late_window: rollback (o id nunca é usado) ou commit muito atrasado
+        now = time.monotonic()
+        for gap_id in [gap_id for gap_id, seen_at in self._gaps.items() if now - seen_at > self.late_window]:
+            del self._gaps[gap_id]
+        
+        gaps = sorted(self._gaps)
+        query = self.QUERY.format(gaps=f" OR m.id IN ({', '.join(['%s'] * len(gaps))})" if gaps else '')
+        rows = db.execute_query(query, (self._last_id, *gaps))
+        if not rows:
+            return
+        
+        last_id = self._last_id
+        for row in rows:
+            if row['id'] > last_id:
+                if row['id'] - last_id <= self.MAX_GAP:
+                    for gap_id in range(last_id + 1, row['id']):
+                        self._gaps[gap_id] = now
+                last_id = row['id']
+            else:
+                self._gaps.pop(row['id'], None)  # Commit atrasado encontrado
+        for event, data, event_id in self._events(rows):
+            self.publish(event, data, event_id)
+        
+        self._last_id = last_id
+        if len(rows) == self.BATCH:
+            self._wakeup.set()  # Ainda há movimentações pendentes
+
+    @staticmethod
+    def _events(rows):
+        """(evento, dados, id) das movimentações lidas e do saldo de cada produto envolvido"""
+        estoques = {}
+        for row in rows:
+            yield 'movimentacao', {
+                'id': row['id'],
+                'produto_id': row['produto_id'],
+                'produto_nome': row['produto_nome'],
+                'categoria': row['categoria'],
+                'tipo': row['tipo'],
+                'quantidade': row['quantidade'],
+                'descricao': row['descricao'],
+                'data_movimento': row['data_movimento'],
+                'hoje': bool(row['hoje'])  # Dia do servidor: o cliente não recalcula datas
+            }, row['id']
+            estoques[row['produto_id']] = row
+        
+        # Saldo atual apenas uma vez por produto
+        for produto_id, row in estoques.items():
+            estoque = {
+                'produto_id': produto_id,
+                'nome': row['produto_nome'],
+                'categoria': row['categoria'],
+                'quantidade': row['estoque_atual'],
+                'estoque_minimo': row['estoque_minimo']
+            }
+            yield 'estoque', estoque, None
+            if row['estoque_atual'] is not None and row['estoque_minimo'] is not None \
+                    and row['estoque_atual'] <= row['estoque_minimo']:
+                yield 'estoque-baixo', estoque, None
+
+    def replay(self, last_id):
+        """Mensagens das movimentações posteriores a last_id (reconexão), ou None se
+        não for possível retomar (banco indisponível ou mais de um lote perdido)"""
+        rows = db.execute_query(self.QUERY.format(gaps=''), (last_id,))
+        if rows is None or len(rows) == self.BATCH:
+            return None
+        return ''.join(self._format(event, data, event_id) for event, data, event_id in self._events(rows))
+
+event_broker = EventBroker(**EVENTS_CONFIG)
+
+@app.route('/api/eventos')
+@login_required
+def eventos_stream():
+    """Stream SSE com eventos movimentacao, estoque e estoque-baixo"""
+    # Reconexão: último id recebido, devolvido pelo navegador (Last-Event-ID) ou pela página
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('ultimo_id', '')
+    subscriber = event_broker.subscribe()
+    if subscriber is None:
+        response = jsonify({'error': 'Limite de conexões de eventos atingido'})
+        response.headers['Retry-After'] = '60'
+        return response, 503
+    
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            if last_event_id:
+                # Já inscrito: o que chegar durante a consulta também vem pela fila (o cliente ignora repetidos)
+                missed = event_broker.replay(int(last_event_id)) if last_event_id.isdigit() else None
+                yield missed if missed is not None else "event: resync\ndata: {}\n\n"
+            while True:
+                try:
+                    yield subscriber.get(timeout=event_broker.keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            event_broker.unsubscribe(subscriber)
+    
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/admin_test')
 @admin_required
 def admin_test_page():
@@ -967,14 +4314,16 @@ def test_admin_page():
         return f.read()
 
 if __name__ == '__main__':
+    # Servidor de desenvolvimento; em produção use: python run_server.py (gunicorn)
+    debug = os.environ.get('FLASK_DEBUG', '0').lower() in ('1', 'true', 'yes')
     print("Iniciando servidor Flask em http://127.0.0.1:5000")
     try:
         app.run(
-            debug=True, 
+            debug=debug,
             host='127.0.0.1',  # Apenas localhost
             port=5000,
             threaded=True,      # Melhor performance
-            use_reloader=True   # Auto-reload em desenvolvimento
+            use_reloader=debug  # Auto-reload em desenvolvimento
         )
     except Exception as e:
         print(f"Erro ao iniciar servidor: {e}")
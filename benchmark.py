@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark dos fluxos principais da API
+
+Popula um banco MySQL separado (padrão: logistica_bench) com um conjunto de dados
+configurável e executa cenários concorrentes diretamente na aplicação WSGI
+(Flask test client, sem servidor HTTP), medindo p50/p95/p99 e requisições por
+segundo. O resultado em JSON serve para comparar commits.
+
+Uso:
+    python benchmark.py seed --reset --produtos 5000 --movimentacoes 20000
+    python benchmark.py run --concurrency 8 --duration 10 --output resultado.json
+    python benchmark.py compare base.json resultado.json
+
+O banco é configurado pelas mesmas variáveis DB_HOST, DB_PORT, DB_USER e
+DB_PASSWORD da aplicação; DB_NAME é substituído por --database.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import bcrypt
+import mysql.connector
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_FILES = ('create_database.sql', 'auth_system.sql')
+
+BENCH_PASSWORD = 'bench123'
+BENCH_USER_PREFIX = 'bench_'
+CATEGORIAS = [
+    'Eletrônicos', 'Informática', 'Papelaria', 'Móveis', 'Limpeza', 'Alimentos',
+    'Bebidas', 'Ferramentas', 'Automotivo', 'Vestuário', 'Brinquedos', 'Esportes'
+]
+# Permissões verificadas pelas rotas (permission_required)
+PERMISSOES_API = ('manage_products', 'manage_inventory', 'view_reports')
+
+SCENARIOS = ('login', 'catalogo', 'codigo_barras', 'entrada', 'saida', 'relatorios')
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark dos fluxos principais da API')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_database_args(subparser):
+        subparser.add_argument('--database', default='logistica_bench', help='Banco usado no benchmark')
+
+    seed = subparsers.add_parser('seed', help='Criar e popular o banco do benchmark')
+    add_database_args(seed)
+    seed.add_argument('--reset', action='store_true', help='Apagar o banco antes de criar')
+    seed.add_argument('--produtos', type=int, default=5000)
+    seed.add_argument('--usuarios', type=int, default=50)
+    seed.add_argument('--movimentacoes', type=int, default=20000)
+    seed.add_argument('--bcrypt-rounds', type=int, default=12, help='Custo do hash dos usuários gerados')
+    seed.add_argument('--seed', type=int, default=42, help='Semente dos dados aleatórios')
+
+    run = subparsers.add_parser('run', help='Executar os cenários')
+    add_database_args(run)
+    run.add_argument('--scenarios', default=','.join(SCENARIOS),
+                     help=f"Cenários separados por vírgula ({', '.join(SCENARIOS)})")
+    run.add_argument('--concurrency', type=int, default=8, help='Threads simultâneas por cenário')
+    run.add_argument('--duration', type=float, default=10, help='Segundos medidos por cenário')
+    run.add_argument('--warmup', type=float, default=2, help='Segundos de aquecimento (descartados)')
+    run.add_argument('--output', help='Arquivo JSON de saída (padrão: stdout)')
+    run.add_argument('--seed', type=int, default=42, help='Semente das escolhas aleatórias')
+
+    compare = subparsers.add_parser('compare', help='Comparar dois resultados')
+    compare.add_argument('base', help='Resultado de referência')
+    compare.add_argument('novo', help='Resultado a comparar')
+
+    return parser.parse_args()
+
+def db_config(database=None):
+    """Conexão a partir das mesmas variáveis de ambiente da aplicação"""
+    config = {
+        'host': os.environ.get('DB_HOST', 'localhost'),
+        'port': int(os.environ.get('DB_PORT', 3306)),
+        'user': os.environ.get('DB_USER', 'root'),
+        'password': os.environ.get('DB_PASSWORD', 'ecalfma')
+    }
+    if database:
+        config['database'] = database
+    return config
+
+# Carga do schema
+def split_sql(script):
+    """Separar um script SQL em comandos, respeitando blocos DELIMITER"""
+    statements = []
+    delimiter = ';'
+    buffer = []
+    for line in script.splitlines():
+        stripped = line.strip()
+        if stripped.upper().startswith('DELIMITER '):
+            delimiter = stripped.split()[1]
+            continue
+        if not buffer and (not stripped or stripped.startswith('--')):
+            continue
+        buffer.append(line)
+        if stripped.endswith(delimiter):
+            statement = '\n'.join(buffer).rstrip()
+            statements.append(statement[:-len(delimiter)].strip())
+            buffer = []
+    if buffer and '\n'.join(buffer).strip():
+        statements.append('\n'.join(buffer).strip())
+    return statements
+
+def load_schema(cursor, database):
+    """Executar os scripts do diretório database/ no banco do benchmark"""
+    for name in SCHEMA_FILES:
+        with open(os.path.join(BASE_DIR, 'database', name), 'r', encoding='utf-8') as file:
+            script = file.read().replace('logistica_estoque', database)
+        for statement in split_sql(script):
+            if statement.upper().startswith('SET GLOBAL'):
+                continue  # Exige privilégio administrativo e não afeta o benchmark
+            cursor.execute(statement)
+            if cursor.with_rows:
+                cursor.fetchall()
+        print(f"✓ {name} carregado")
+
+# População do banco
+def insert_chunks(cursor, query, rows, chunk_size=1000):
+    for start in range(0, len(rows), chunk_size):
+        cursor.executemany(query, rows[start:start + chunk_size])
+
+def seed_database(args):
+    rng = random.Random(args.seed)
+
+    connection = mysql.connector.connect(**db_config())
+    cursor = connection.cursor()
+    if args.reset:
+        cursor.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+        print(f"✓ Banco {args.database} removido")
+    else:
+        cursor.execute("SHOW DATABASES LIKE %s", (args.database,))
+        if cursor.fetchall():
+            raise SystemExit(f"Banco {args.database} já existe: use --reset para recriá-lo")
+    load_schema(cursor, args.database)
+    cursor.close()
+    connection.close()
+
+    connection = mysql.connector.connect(**db_config(args.database))
+    cursor = connection.cursor()
+    started = time.perf_counter()
+
+    # Produtos e estoque
+    produtos = [
+        (f"Produto {i:06d} {rng.choice(CATEGORIAS)}", f"Produto gerado para benchmark {i}",
+         rng.choice(CATEGORIAS), round(rng.uniform(1, 5000), 2), f"{990000000000 + i:013d}")
+        for i in range(args.produtos)
+    ]
+    insert_chunks(cursor, """
+    INSERT INTO produtos (nome, descricao, categoria, preco, codigo_barras)
+    VALUES (%s, %s, %s, %s, %s)
+    """, produtos)
+    cursor.execute("SELECT id FROM produtos WHERE codigo_barras LIKE '99%'")
+    produto_ids = [row[0] for row in cursor.fetchall()]
+
+    estoque = []
+    for produto_id in produto_ids:
+        minimo = rng.randint(5, 50)
+        estoque.append((produto_id, rng.randint(0, minimo * 10), minimo, minimo * 20))
+    insert_chunks(cursor, """
+    INSERT INTO estoque (produto_id, quantidade, estoque_minimo, estoque_maximo)
+    VALUES (%s, %s, %s, %s)
+    """, estoque)
+    connection.commit()
+    print(f"✓ {len(produto_ids)} produtos com estoque")
+
+    # Histórico de movimentações nos últimos 90 dias
+    agora = datetime.now()
+    movimentacoes = [
+        (rng.choice(produto_ids), rng.choice(('ENTRADA', 'SAIDA')), rng.randint(1, 20),
+         'Movimentação gerada para benchmark', agora - timedelta(seconds=rng.randint(0, 90 * 86400)))
+        for _ in range(args.movimentacoes)
+    ] if produto_ids else []
+    insert_chunks(cursor, """
+    INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao, data_movimento)
+    VALUES (%s, %s, %s, %s, %s)
+    """, movimentacoes)
+    connection.commit()
+    print(f"✓ {len(movimentacoes)} movimentações")
+
+    # Usuários com todas as permissões (mesmo hash para todos: o custo é o mesmo)
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'),
+                                  bcrypt.gensalt(args.bcrypt_rounds)).decode('utf-8')
+    usuarios = [
+        (f"{BENCH_USER_PREFIX}{i:04d}", password_hash, f"Operador {i}", f"bench{i}@logistica.local")
+        for i in range(args.usuarios)
+    ]
+    insert_chunks(cursor, """
+    INSERT INTO usuarios (username, password_hash, nome, email, tipo)
+    VALUES (%s, %s, %s, %s, 'usuario')
+    """, usuarios)
+    cursor.executemany("INSERT IGNORE INTO permissoes (nome, descricao) VALUES (%s, %s)",
+                       [(nome, f'Permissão {nome}') for nome in PERMISSOES_API])
+    cursor.execute("""
+    INSERT IGNORE INTO usuario_permissoes (usuario_id, permissao_id, concedida_por)
+    SELECT u.id, p.id, u.id FROM usuarios u CROSS JOIN permissoes p
+    WHERE u.username LIKE %s
+    """, (BENCH_USER_PREFIX.replace('_', '\\_') + '%',))
+    connection.commit()
+    print(f"✓ {len(usuarios)} usuários (senha: {BENCH_PASSWORD})")
+
+    cursor.close()
+    connection.close()
+    print(f"\n✅ Banco {args.database} populado em {time.perf_counter() - started:.1f}s")
+
+# Cenários
+class BenchContext:
+    """Dados compartilhados pelos cenários (ids, códigos de barras, usuários)"""
+    def __init__(self, db):
+        rows = db.execute_query("SELECT id, codigo_barras FROM produtos WHERE codigo_barras IS NOT NULL")
+        self.produto_ids = [row['id'] for row in rows or []]
+        self.codigos_barras = [row['codigo_barras'] for row in rows or []]
+        rows = db.execute_query("SELECT username FROM usuarios WHERE username LIKE %s AND ativo = 1",
+                                (BENCH_USER_PREFIX.replace('_', '\\_') + '%',))
+        self.usernames = [row['username'] for row in rows or []]
+        rows = db.execute_query("SELECT DISTINCT categoria FROM produtos WHERE categoria IS NOT NULL")
+        self.categorias = [row['categoria'] for row in rows or []]
+        if not self.produto_ids or not self.usernames:
+            raise SystemExit("Banco do benchmark vazio: execute 'python benchmark.py seed' antes")
+
+def login(client, context, rng):
+    return client.post('/api/auth/login', json={
+        'username': rng.choice(context.usernames),
+        'password': BENCH_PASSWORD
+    })
+
+def catalogo(client, context, rng):
+    params = {'limit': 100}
+    if rng.random() < 0.5:
+        params['categoria'] = rng.choice(context.categorias)
+    return client.get('/api/produtos', query_string=params)
+
+def codigo_barras(client, context, rng):
+    return client.get('/api/produtos/lookup', query_string={'codigo_barras': rng.choice(context.codigos_barras)})
+
+def entrada(client, context, rng):
+    return client.post(f'/api/estoque/{rng.choice(context.produto_ids)}/entrada',
+                       json={'quantidade': rng.randint(1, 10), 'descricao': 'Benchmark'})
+
+def saida(client, context, rng):
+    return client.post(f'/api/estoque/{rng.choice(context.produto_ids)}/saida',
+                       json={'quantidade': rng.randint(1, 3), 'descricao': 'Benchmark'})
+
+def relatorios(client, context, rng):
+    if rng.random() < 0.5:
+        return client.get('/api/relatorio/estoque-baixo')
+    return client.get('/api/relatorio/movimentacoes')
+
+def status_ok(response):
+    return response.status_code == 200
+
+def movimentacao_ok(response):
+    # Estoque insuficiente é resposta válida: 200 com success false
+    if response.status_code != 200:
+        return False
+    data = response.get_json(silent=True) or {}
+    return data.get('success') is True or data.get('error') == 'Estoque insuficiente'
+
+# cenário -> (função, classificação da resposta, precisa de sessão)
+SCENARIO_TABLE = {
+    'login': (login, status_ok, False),
+    'catalogo': (catalogo, status_ok, True),
+    'codigo_barras': (codigo_barras, status_ok, True),
+    'entrada': (entrada, movimentacao_ok, True),
+    'saida': (saida, movimentacao_ok, True),
+    'relatorios': (relatorios, status_ok, True)
+}
+
+# Tempo máximo esperando todos os workers fazerem login
+START_TIMEOUT = 120
+
+def percentile(sorted_values, fraction):
+    """Percentil pelo método nearest-rank"""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def run_scenario(flask_app, context, name, concurrency, duration, warmup, seed):
+    action, is_ok, needs_session = SCENARIO_TABLE[name]
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    statuses = [{} for _ in range(concurrency)]
+    start_barrier = threading.Barrier(concurrency + 1, timeout=START_TIMEOUT)
+    window = {}
+    failures = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = flask_app.test_client()
+        try:
+            if needs_session:
+                response = login(client, context, rng)
+                if response.status_code != 200:
+                    failures.append(f"Login do benchmark falhou: {response.status_code} {response.get_data(as_text=True)}")
+                    start_barrier.abort()
+                    return
+            start_barrier.wait()
+        except threading.BrokenBarrierError:
+            return
+        except Exception as e:
+            failures.append(f"Worker {index} falhou antes de iniciar: {e}")
+            start_barrier.abort()
+            return
+        while True:
+            started = time.perf_counter()
+            if started >= window['end']:
+                return
+            response = action(client, context, rng)
+            elapsed = time.perf_counter() - started
+            ok = is_ok(response)
+            response.close()
+            if started < window['start']:
+                continue  # Aquecimento
+            latencies[index].append(elapsed)
+            statuses[index][response.status_code] = statuses[index].get(response.status_code, 0) + 1
+            if not ok:
+                errors[index] += 1
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    now = time.perf_counter()
+    window['start'] = now + warmup
+    window['end'] = now + warmup + duration
+    try:
+        start_barrier.wait()
+    except threading.BrokenBarrierError:
+        for thread in threads:
+            thread.join()
+        raise SystemExit(failures[0] if failures else f"Workers não iniciaram em {START_TIMEOUT}s")
+    for thread in threads:
+        thread.join()
+    measured = time.perf_counter() - window['start']
+
+    values = sorted(value for worker_values in latencies for value in worker_values)
+    status_total = {}
+    for worker_statuses in statuses:
+        for status, count in worker_statuses.items():
+            status_total[str(status)] = status_total.get(str(status), 0) + count
+
+    def ms(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    return {
+        'requests': len(values),
+        'errors': sum(errors),
+        'statuses': status_total,
+        'req_per_s': round(len(values) / measured, 2) if measured > 0 else 0,
+        'latency_ms': {
+            'p50': ms(percentile(values, 0.50)),
+            'p95': ms(percentile(values, 0.95)),
+            'p99': ms(percentile(values, 0.99)),
+            'mean': ms(sum(values) / len(values)) if values else None,
+            'max': ms(values[-1]) if values else None
+        }
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args):
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIO_TABLE]
+    if unknown:
+        raise SystemExit(f"Cenários desconhecidos: {', '.join(unknown)}")
+
+    # Configuração lida pela aplicação na importação
+    os.environ['DB_NAME'] = args.database
+    os.environ.setdefault('DB_POOL_SIZE', str(max(10, args.concurrency * 2)))
+    os.environ['LOGIN_LIMITER_FILE'] = os.path.join(tempfile.gettempdir(), f'logistica_bench_limiter_{os.getpid()}.bin')
+    for name in ('LOGIN_LIMITER_USER_BURST', 'LOGIN_LIMITER_IP_BURST',
+                 'LOGIN_LIMITER_USER_PER_MIN', 'LOGIN_LIMITER_IP_PER_MIN'):
+        os.environ[name] = '1000000000'  # Limite de tentativas fora da medição
+
+    sys.path.insert(0, BASE_DIR)
+    import app as aplicacao
+
+    context = BenchContext(aplicacao.db)
+    result = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'config': {
+            'database': args.database,
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'seed': args.seed
+        },
+        'dataset': {
+            'produtos': len(context.produto_ids),
+            'usuarios': len(context.usernames),
+            'categorias': len(context.categorias)
+        },
+        'scenarios': {}
+    }
+
+    for name in names:
+        print(f"▶ {name} ({args.concurrency} threads, {args.duration}s)...", file=sys.stderr)
+        stats = run_scenario(aplicacao.app, context, name, args.concurrency, args.duration, args.warmup, args.seed)
+        result['scenarios'][name] = stats
+        print(f"  {stats['req_per_s']} req/s, p50 {stats['latency_ms']['p50']} ms, "
+              f"p95 {stats['latency_ms']['p95']} ms, p99 {stats['latency_ms']['p99']} ms, "
+              f"{stats['errors']} erros", file=sys.stderr)
+
+    aplicacao.login_writer.close()
+    try:
+        os.remove(os.environ['LOGIN_LIMITER_FILE'])
+    except OSError:
+        pass
+
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output + '\n')
+        print(f"✅ Resultado salvo em {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+# Comparação
+def compare_results(args):
+    with open(args.base, encoding='utf-8') as file:
+        base = json.load(file)
+    with open(args.novo, encoding='utf-8') as file:
+        novo = json.load(file)
+
+    def delta(old, new):
+        if not old or new is None:
+            return '    -'
+        return f"{(new - old) / old * 100:+6.1f}%"
+
+    print(f"Base: {base.get('commit')} ({base.get('timestamp')})  Novo: {novo.get('commit')} ({novo.get('timestamp')})")
+    print(f"{'cenário':<15}{'req/s':>12}{'Δ':>9}{'p50 ms':>10}{'Δ':>9}{'p95 ms':>10}{'Δ':>9}{'p99 ms':>10}{'Δ':>9}")
+    for name, stats in novo['scenarios'].items():
+        old = base['scenarios'].get(name)
+        if old is None:
+            continue
+        line = f"{name:<15}{stats['req_per_s']:>12}{delta(old['req_per_s'], stats['req_per_s']):>9}"
+        for key in ('p50', 'p95', 'p99'):
+            line += f"{stats['latency_ms'][key]:>10}{delta(old['latency_ms'][key], stats['latency_ms'][key]):>9}"
+        print(line)
+
+def main():
+    args = parse_args()
+    if args.command == 'seed':
+        seed_database(args)
+    elif args.command == 'run':
+        run_benchmark(args)
+    elif args.command == 'compare':
+        compare_results(args)
+
+if __name__ == '__main__':
+    main()
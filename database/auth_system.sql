@@ -44,8 +44,11 @@ CREATE TABLE usuario_permissoes (
 );
 
 -- Tabela de sessões (opcional, para controle avançado)
+-- Particionada por mês de expiração: a aplicação cria as partições futuras e
+-- descarta as já expiradas (ver SessionSweeper em app.py). Tabelas particionadas
+-- não aceitam chave estrangeira, e a data de expiração faz parte da chave primária.
 CREATE TABLE sessoes (
-    id VARCHAR(255) PRIMARY KEY,
+    id VARCHAR(255) NOT NULL,
     usuario_id INT NOT NULL,
     data_criacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     data_expiracao TIMESTAMP NOT NULL,
@@ -53,10 +56,52 @@ CREATE TABLE sessoes (
     user_agent TEXT,
     ativo BOOLEAN DEFAULT TRUE,
     
-    FOREIGN KEY (usuario_id) REFERENCES usuarios(id) ON DELETE CASCADE,
-    INDEX idx_usuario (usuario_id),
+    PRIMARY KEY (id, data_expiracao),
+    INDEX idx_usuario_criacao (usuario_id, data_criacao),
     INDEX idx_expiracao (data_expiracao),
     INDEX idx_ativo (ativo)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(data_expiracao)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- Sessões ativas por usuário, mantido junto com sessoes (usuários online)
+CREATE TABLE usuarios_online (
+    usuario_id INT PRIMARY KEY,
+    sessoes_ativas INT NOT NULL DEFAULT 0,
+    
+    INDEX idx_sessoes_ativas (sessoes_ativas)
+);
+
+-- Épocas de revogação das sessões com claims assinadas
+-- (sem chave estrangeira: a época precisa sobreviver à exclusão do usuário)
+CREATE TABLE sessao_epocas (
+    usuario_id INT PRIMARY KEY,
+    epoca INT UNSIGNED NOT NULL DEFAULT 0,
+    data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- Trilha de auditoria: somente inserção, gravada em lote pela aplicação (AuditLog).
+-- Particionada por mês de data_evento; a aplicação cria as partições futuras
+-- e, com AUDIT_RETENTION_MONTHS, descarta as antigas inteiras.
+-- (sem chave estrangeira: o histórico sobrevive à exclusão do usuário)
+CREATE TABLE auditoria (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    data_evento TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    usuario_id INT NULL,          -- Autor (NULL: sistema ou login de usuário inexistente)
+    acao VARCHAR(50) NOT NULL,    -- Ex.: usuario.permissoes, produto.excluido, login.falha
+    entidade VARCHAR(50) NULL,
+    entidade_id VARCHAR(64) NULL,
+    detalhes JSON NULL,
+    ip_address VARCHAR(45) NULL,
+    
+    PRIMARY KEY (id, data_evento),
+    INDEX idx_data_evento (data_evento DESC, id DESC),
+    INDEX idx_usuario_data (usuario_id, data_evento DESC, id DESC),
+    INDEX idx_acao_data (acao, data_evento DESC, id DESC)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(data_evento)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
 );
 
 -- Inserir permissões básicas
@@ -131,17 +176,8 @@ END$$
 
 DELIMITER ;
 
--- Trigger para limpar sessões expiradas automaticamente
-DELIMITER $$
-
-CREATE EVENT ev_limpar_sessoes_expiradas
-ON SCHEDULE EVERY 1 HOUR
-DO
-BEGIN
-    DELETE FROM sessoes WHERE data_expiracao < NOW();
-END$$
-
-DELIMITER ;
+-- Observação: sessões expiradas são removidas pela aplicação em lotes pequenos
+-- e por descarte de partições, mantendo usuarios_online atualizado.
 
 -- Habilitar event scheduler se não estiver ativo
 SET GLOBAL event_scheduler = ON;
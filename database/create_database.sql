@@ -17,7 +17,8 @@ CREATE TABLE produtos (
     
     INDEX idx_nome (nome),
     INDEX idx_categoria (categoria),
-    INDEX idx_codigo_barras (codigo_barras)
+    INDEX idx_codigo_barras (codigo_barras),
+    INDEX idx_data_atualizacao (data_atualizacao, id)
 );
 
 -- Tabela de controle de estoque
@@ -27,11 +28,34 @@ CREATE TABLE estoque (
     quantidade INT DEFAULT 0,
     estoque_minimo INT DEFAULT 10,
     estoque_maximo INT DEFAULT 100,
+    shards TINYINT UNSIGNED NOT NULL DEFAULT 0,  -- Frações do contador (0 = saldo apenas nesta linha)
     data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
     
     FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE,
     UNIQUE KEY unique_produto_estoque (produto_id),
-    INDEX idx_quantidade (quantidade)
+    INDEX idx_quantidade (quantidade),
+    INDEX idx_data_atualizacao (data_atualizacao, produto_id)
+);
+
+-- Frações do contador de estoque para produtos muito movimentados
+-- Saldo total = estoque.quantidade + SUM(estoque_shards.quantidade)
+CREATE TABLE estoque_shards (
+    produto_id INT NOT NULL,
+    shard TINYINT UNSIGNED NOT NULL,
+    quantidade INT NOT NULL DEFAULT 0,
+    data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    
+    PRIMARY KEY (produto_id, shard),
+    FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE,
+    INDEX idx_data_atualizacao (data_atualizacao)
+);
+
+-- Produtos excluídos, para a sincronização incremental do catálogo
+CREATE TABLE produtos_excluidos (
+    produto_id INT PRIMARY KEY,
+    data_exclusao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_data_exclusao (data_exclusao)
 );
 
 -- Tabela de movimentações de estoque
@@ -41,33 +65,39 @@ CREATE TABLE movimentacoes (
     tipo ENUM('ENTRADA', 'SAIDA') NOT NULL,
     quantidade INT NOT NULL,
     descricao TEXT,
+    usuario_id INT NULL,  -- Quem registrou (sem chave estrangeira: o histórico sobrevive à exclusão do usuário)
+    chave_idempotencia VARCHAR(64) NULL,  -- Gerada pelo cliente; reenvios da mesma chave são ignorados
     data_movimento TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     
     FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE,
+    UNIQUE KEY uk_chave_idempotencia (chave_idempotencia),
     INDEX idx_produto_movimento (produto_id),
     INDEX idx_tipo (tipo),
-    INDEX idx_data_movimento (data_movimento)
+    INDEX idx_data_movimento (data_movimento),
+    INDEX idx_usuario_data (usuario_id, data_movimento)
 );
 
--- Trigger para atualizar estoque automaticamente após movimentação
-DELIMITER $$
+-- Observação: não há trigger em movimentacoes. A aplicação atualiza estoque e
+-- registra a movimentação na mesma transação (um único caminho de escrita).
 
-CREATE TRIGGER tr_movimentacao_estoque 
-AFTER INSERT ON movimentacoes
-FOR EACH ROW
-BEGIN
-    IF NEW.tipo = 'ENTRADA' THEN
-        UPDATE estoque 
-        SET quantidade = quantidade + NEW.quantidade
-        WHERE produto_id = NEW.produto_id;
-    ELSEIF NEW.tipo = 'SAIDA' THEN
-        UPDATE estoque 
-        SET quantidade = GREATEST(0, quantidade - NEW.quantidade)
-        WHERE produto_id = NEW.produto_id;
-    END IF;
-END$$
-
-DELIMITER ;
+-- Queries lentas agrupadas por SQL normalizado (gravado pela aplicação)
+CREATE TABLE consultas_lentas (
+    fingerprint CHAR(16) PRIMARY KEY,            -- Hash do SQL normalizado
+    sql_normalizado TEXT NOT NULL,
+    ocorrencias INT NOT NULL DEFAULT 0,
+    tempo_total_ms DOUBLE NOT NULL DEFAULT 0,
+    tempo_max_ms DOUBLE NOT NULL DEFAULT 0,
+    ultimo_tempo_ms DOUBLE,
+    ultimo_rowcount INT,
+    formato_parametros VARCHAR(255),
+    endpoint VARCHAR(100),
+    plano TEXT,                                  -- EXPLAIN FORMAT=JSON da primeira ocorrência
+    primeira_ocorrencia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ultima_ocorrencia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_tempo_total (tempo_total_ms),
+    INDEX idx_ultima_ocorrencia (ultima_ocorrencia)
+);
 
 -- Inserir dados de exemplo
 INSERT INTO produtos (nome, descricao, categoria, preco, codigo_barras) VALUES
@@ -109,6 +139,17 @@ INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao) VALUES
 (10, 'ENTRADA', 10, 'Entrada de fones de ouvido');
 
 -- Views úteis para relatórios
+-- Saldo total por produto, incluindo frações do contador
+CREATE VIEW vw_estoque_total AS
+SELECT 
+    e.produto_id,
+    CAST(e.quantidade + IF(e.shards > 0, (
+        SELECT COALESCE(SUM(s.quantidade), 0) FROM estoque_shards s WHERE s.produto_id = e.produto_id
+    ), 0) AS SIGNED) as quantidade,
+    e.estoque_minimo,
+    e.estoque_maximo
+FROM estoque e;
+
 CREATE VIEW vw_produtos_estoque AS
 SELECT 
     p.id,
@@ -125,7 +166,7 @@ SELECT
         ELSE 'NORMAL'
     END as status_estoque
 FROM produtos p
-LEFT JOIN estoque e ON p.id = e.produto_id;
+LEFT JOIN vw_estoque_total e ON p.id = e.produto_id;
 
 CREATE VIEW vw_produtos_estoque_baixo AS
 SELECT 
@@ -136,7 +177,7 @@ SELECT
     e.estoque_minimo,
     e.estoque_maximo
 FROM produtos p
-JOIN estoque e ON p.id = e.produto_id
+JOIN vw_estoque_total e ON p.id = e.produto_id
 WHERE e.quantidade <= e.estoque_minimo;
 
 CREATE VIEW vw_movimentacoes_completa AS
@@ -167,10 +208,17 @@ BEGIN
     DECLARE v_diferenca INT;
     DECLARE v_tipo_movimento VARCHAR(10);
     
-    -- Obter quantidade atual
+    -- Obter quantidade atual (linha bloqueada até o fim da transação)
     SELECT quantidade INTO v_quantidade_atual 
     FROM estoque 
-    WHERE produto_id = p_produto_id;
+    WHERE produto_id = p_produto_id
+    FOR UPDATE;
+    
+    -- Somar frações do contador, se houver
+    SELECT v_quantidade_atual + COALESCE(SUM(quantidade), 0) INTO v_quantidade_atual
+    FROM estoque_shards
+    WHERE produto_id = p_produto_id
+    FOR UPDATE;
     
     -- Calcular diferença
     SET v_diferenca = p_nova_quantidade - v_quantidade_atual;
@@ -183,8 +231,16 @@ BEGIN
         SET v_diferenca = ABS(v_diferenca);
     END IF;
     
-    -- Registrar movimentação se houver diferença
+    -- Ajustar estoque e registrar movimentação se houver diferença
     IF v_diferenca != 0 THEN
+        UPDATE estoque 
+        SET quantidade = p_nova_quantidade
+        WHERE produto_id = p_produto_id;
+        
+        UPDATE estoque_shards 
+        SET quantidade = 0
+        WHERE produto_id = p_produto_id;
+        
         INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao)
         VALUES (p_produto_id, v_tipo_movimento, v_diferenca, p_descricao);
     END IF;
@@ -0,0 +1,263 @@
+-- Atualizações de desempenho para bancos já existentes
+-- Execute este script após create_database.sql e auth_system.sql
+-- (instalações novas já incluem estas alterações nos scripts principais)
+
+USE logistica_estoque;
+
+-- ==============================================
+-- Contador de estoque fracionado (produtos muito movimentados)
+-- ==============================================
+ALTER TABLE estoque
+    ADD COLUMN shards TINYINT UNSIGNED NOT NULL DEFAULT 0 AFTER estoque_maximo;
+
+CREATE TABLE IF NOT EXISTS estoque_shards (
+    produto_id INT NOT NULL,
+    shard TINYINT UNSIGNED NOT NULL,
+    quantidade INT NOT NULL DEFAULT 0,
+    
+    PRIMARY KEY (produto_id, shard),
+    FOREIGN KEY (produto_id) REFERENCES produtos(id) ON DELETE CASCADE
+);
+
+CREATE OR REPLACE VIEW vw_estoque_total AS
+SELECT 
+    e.produto_id,
+    CAST(e.quantidade + IF(e.shards > 0, (
+        SELECT COALESCE(SUM(s.quantidade), 0) FROM estoque_shards s WHERE s.produto_id = e.produto_id
+    ), 0) AS SIGNED) as quantidade,
+    e.estoque_minimo,
+    e.estoque_maximo
+FROM estoque e;
+
+CREATE OR REPLACE VIEW vw_produtos_estoque AS
+SELECT 
+    p.id,
+    p.nome,
+    p.categoria,
+    p.preco,
+    p.codigo_barras,
+    e.quantidade,
+    e.estoque_minimo,
+    e.estoque_maximo,
+    CASE 
+        WHEN e.quantidade = 0 THEN 'CRITICO'
+        WHEN e.quantidade <= e.estoque_minimo THEN 'BAIXO'
+        ELSE 'NORMAL'
+    END as status_estoque
+FROM produtos p
+LEFT JOIN vw_estoque_total e ON p.id = e.produto_id;
+
+CREATE OR REPLACE VIEW vw_produtos_estoque_baixo AS
+SELECT 
+    p.id,
+    p.nome,
+    p.categoria,
+    e.quantidade,
+    e.estoque_minimo,
+    e.estoque_maximo
+FROM produtos p
+JOIN vw_estoque_total e ON p.id = e.produto_id
+WHERE e.quantidade <= e.estoque_minimo;
+
+-- ==============================================
+-- Caminho único de escrita do estoque
+-- ==============================================
+-- A aplicação atualiza estoque e registra a movimentação na mesma transação;
+-- o trigger aplicava a mesma alteração uma segunda vez.
+DROP TRIGGER IF EXISTS tr_movimentacao_estoque;
+
+DROP PROCEDURE IF EXISTS sp_ajustar_estoque;
+
+DELIMITER $$
+
+CREATE PROCEDURE sp_ajustar_estoque(
+    IN p_produto_id INT,
+    IN p_nova_quantidade INT,
+    IN p_descricao TEXT
+)
+BEGIN
+    DECLARE v_quantidade_atual INT DEFAULT 0;
+    DECLARE v_diferenca INT;
+    DECLARE v_tipo_movimento VARCHAR(10);
+    
+    -- Obter quantidade atual (linha bloqueada até o fim da transação)
+    SELECT quantidade INTO v_quantidade_atual 
+    FROM estoque 
+    WHERE produto_id = p_produto_id
+    FOR UPDATE;
+    
+    -- Somar frações do contador, se houver
+    SELECT v_quantidade_atual + COALESCE(SUM(quantidade), 0) INTO v_quantidade_atual
+    FROM estoque_shards
+    WHERE produto_id = p_produto_id
+    FOR UPDATE;
+    
+    -- Calcular diferença
+    SET v_diferenca = p_nova_quantidade - v_quantidade_atual;
+    
+    -- Determinar tipo de movimento
+    IF v_diferenca > 0 THEN
+        SET v_tipo_movimento = 'ENTRADA';
+    ELSEIF v_diferenca < 0 THEN
+        SET v_tipo_movimento = 'SAIDA';
+        SET v_diferenca = ABS(v_diferenca);
+    END IF;
+    
+    -- Ajustar estoque e registrar movimentação se houver diferença
+    IF v_diferenca != 0 THEN
+        UPDATE estoque 
+        SET quantidade = p_nova_quantidade
+        WHERE produto_id = p_produto_id;
+        
+        UPDATE estoque_shards 
+        SET quantidade = 0
+        WHERE produto_id = p_produto_id;
+        
+        INSERT INTO movimentacoes (produto_id, tipo, quantidade, descricao)
+        VALUES (p_produto_id, v_tipo_movimento, v_diferenca, p_descricao);
+    END IF;
+END$$
+
+DELIMITER ;
+
+-- ==============================================
+-- Revogação de sessões com claims assinadas
+-- ==============================================
+-- (sem chave estrangeira: a época precisa sobreviver à exclusão do usuário)
+CREATE TABLE IF NOT EXISTS sessao_epocas (
+    usuario_id INT PRIMARY KEY,
+    epoca INT UNSIGNED NOT NULL DEFAULT 0,
+    data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+);
+
+-- ==============================================
+-- Limpeza e particionamento de sessões
+-- ==============================================
+-- Executar fora do horário de pico: a tabela sessoes é reconstruída.
+-- A exclusão em massa do evento é substituída pela limpeza em lotes da aplicação.
+DROP EVENT IF EXISTS ev_limpar_sessoes_expiradas;
+
+DELETE FROM sessoes WHERE data_expiracao < NOW();
+
+-- Nome gerado automaticamente pelo MySQL para a chave estrangeira de auth_system.sql
+ALTER TABLE sessoes DROP FOREIGN KEY sessoes_ibfk_1;
+
+ALTER TABLE sessoes
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (id, data_expiracao);
+
+ALTER TABLE sessoes
+    PARTITION BY RANGE (UNIX_TIMESTAMP(data_expiracao)) (
+        PARTITION pmax VALUES LESS THAN MAXVALUE
+    );
+
+CREATE TABLE IF NOT EXISTS usuarios_online (
+    usuario_id INT PRIMARY KEY,
+    sessoes_ativas INT NOT NULL DEFAULT 0,
+    
+    INDEX idx_sessoes_ativas (sessoes_ativas)
+);
+
+REPLACE INTO usuarios_online (usuario_id, sessoes_ativas)
+SELECT usuario_id, COUNT(*) FROM sessoes
+WHERE ativo = 1 AND data_expiracao > NOW()
+GROUP BY usuario_id;
+
+-- ==============================================
+-- Log de queries lentas
+-- ==============================================
+CREATE TABLE IF NOT EXISTS consultas_lentas (
+    fingerprint CHAR(16) PRIMARY KEY,            -- Hash do SQL normalizado
+    sql_normalizado TEXT NOT NULL,
+    ocorrencias INT NOT NULL DEFAULT 0,
+    tempo_total_ms DOUBLE NOT NULL DEFAULT 0,
+    tempo_max_ms DOUBLE NOT NULL DEFAULT 0,
+    ultimo_tempo_ms DOUBLE,
+    ultimo_rowcount INT,
+    formato_parametros VARCHAR(255),
+    endpoint VARCHAR(100),
+    plano TEXT,                                  -- EXPLAIN FORMAT=JSON da primeira ocorrência
+    primeira_ocorrencia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    ultima_ocorrencia TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_tempo_total (tempo_total_ms),
+    INDEX idx_ultima_ocorrencia (ultima_ocorrencia)
+);
+
+-- ==============================================
+-- Feed de atividades (logins e movimentações)
+-- ==============================================
+-- Paginação por data decrescente, com ou sem filtro de usuário.
+ALTER TABLE movimentacoes
+    ADD COLUMN usuario_id INT NULL AFTER descricao,
+    ADD INDEX idx_usuario_data (usuario_id, data_movimento);
+
+ALTER TABLE sessoes
+    DROP INDEX idx_usuario,
+    ADD INDEX idx_usuario_criacao (usuario_id, data_criacao),
+    ADD INDEX idx_data_criacao (data_criacao);
+
+-- ==============================================
+-- Trilha de auditoria
+-- ==============================================
+-- Gravada em lote pela aplicação; partições mensais criadas automaticamente.
+CREATE TABLE IF NOT EXISTS auditoria (
+    id BIGINT NOT NULL AUTO_INCREMENT,
+    data_evento TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    usuario_id INT NULL,          -- Autor (NULL: sistema ou login de usuário inexistente)
+    acao VARCHAR(50) NOT NULL,    -- Ex.: usuario.permissoes, produto.excluido, login.falha
+    entidade VARCHAR(50) NULL,
+    entidade_id VARCHAR(64) NULL,
+    detalhes JSON NULL,
+    ip_address VARCHAR(45) NULL,
+    
+    PRIMARY KEY (id, data_evento),
+    INDEX idx_data_evento (data_evento DESC, id DESC),
+    INDEX idx_usuario_data (usuario_id, data_evento DESC, id DESC),
+    INDEX idx_acao_data (acao, data_evento DESC)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(data_evento)) (
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+-- ==============================================
+-- Sincronização incremental do catálogo
+-- ==============================================
+-- Alterações desde uma marca d'água, por (data_atualizacao, id).
+ALTER TABLE produtos
+    ADD INDEX idx_data_atualizacao (data_atualizacao, id);
+
+ALTER TABLE estoque
+    ADD INDEX idx_data_atualizacao (data_atualizacao, produto_id);
+
+-- Saídas em produtos fracionados só alteram estoque_shards
+ALTER TABLE estoque_shards
+    ADD COLUMN data_atualizacao TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    ADD INDEX idx_data_atualizacao (data_atualizacao);
+
+CREATE TABLE IF NOT EXISTS produtos_excluidos (
+    produto_id INT PRIMARY KEY,
+    data_exclusao TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    
+    INDEX idx_data_exclusao (data_exclusao)
+);
+
+-- ==============================================
+-- Movimentações idempotentes (fila offline do navegador)
+-- ==============================================
+-- Reenvios com a mesma chave gerada pelo cliente não alteram o estoque de novo.
+ALTER TABLE movimentacoes
+    ADD COLUMN chave_idempotencia VARCHAR(64) NULL AFTER usuario_id,
+    ADD UNIQUE KEY uk_chave_idempotencia (chave_idempotencia);
+
+-- ==============================================
+-- Histórico de logins na auditoria
+-- ==============================================
+-- O feed lê logins de auditoria (acao = 'login.sucesso'); sessoes não é mais
+-- percorrida por data.
+ALTER TABLE auditoria
+    DROP INDEX idx_acao_data,
+    ADD INDEX idx_acao_data (acao, data_evento DESC, id DESC);
+
+ALTER TABLE sessoes
+    DROP INDEX idx_data_criacao;
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+Configuração do gunicorn para produção (lida automaticamente por `gunicorn app:app`
+no diretório do projeto, ou via `python run_server.py`).
+
+Modelo pré-fork: o processo mestre importa a aplicação uma vez (preload_app) e
+cria os workers com fork; cada worker abre o próprio pool de conexões e aquece
+os caches em post_worker_init, antes de aceitar a primeira requisição.
+
+Recarga sem derrubar conexões:
+    kill -HUP <pid do mestre>    novos workers com a configuração atual; os antigos
+                                 terminam as requisições em andamento (graceful_timeout).
+                                 Com preload_app o código NÃO é reimportado.
+    kill -USR2 <pid do mestre>   novo mestre com o código atualizado; depois de pronto,
+                                 kill -QUIT no mestre antigo.
+"""
+
+import multiprocessing
+import os
+
+def env_bool(name, default):
+    return os.environ.get(name, default).lower() in ('1', 'true', 'yes')
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:5000')
+# Atrás de proxy reverso o IP do cliente vem de X-Forwarded-For via ProxyFix na
+# aplicação (TRUSTED_PROXY_HOPS), o mesmo com gunicorn ou waitress
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+# Threads por worker: cada conexão SSE (/api/eventos) ocupa uma thread enquanto aberta.
+# A aplicação recusa com 503 as conexões SSE além de EVENTS_MAX_CLIENTS por worker,
+# então WEB_REQUEST_THREADS ficam sempre livres para as demais requisições.
+request_threads = int(os.environ.get('WEB_REQUEST_THREADS', 4))
+events_max_clients = int(os.environ.get('EVENTS_MAX_CLIENTS', 8))
+threads = int(os.environ.get('WEB_THREADS', request_threads + events_max_clients))
+# WEB_THREADS explícito: reduzir o limite de SSE para caber (lido pela aplicação ao importar)
+os.environ['EVENTS_MAX_CLIENTS'] = str(max(0, min(events_max_clients, threads - request_threads)))
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = env_bool('WEB_PRELOAD', 'true')
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Reciclar workers periodicamente (com variação para não reiniciarem juntos)
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 1000))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('WEB_LOG_LEVEL', 'info')
+proc_name = 'logistica_estoque'
+
+def when_ready(server):
+    # Com preload a aplicação já está no mestre: calibrar o bcrypt uma vez, herdado por todos os workers
+    if server.cfg.preload_app:
+        from app import password_hasher
+        password_hasher.rounds
+    server.log.info("Servidor pronto: %s workers x %s threads", server.cfg.workers, server.cfg.threads)
+
+def post_worker_init(worker):
+    # Chamado no worker depois de carregar a aplicação e antes de aceitar conexões
+    from app import warm_up_worker
+    warm_up_worker()
+
+def worker_abort(worker):
+    worker.log.warning("Worker %s encerrado por timeout", worker.pid)
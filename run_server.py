@@ -1,10 +1,54 @@
-from app import app
+"""
+Iniciar o servidor da aplicação
+
+    python run_server.py          produção: gunicorn com a configuração de gunicorn.conf.py
+                                  (no Windows, sem fork, usa waitress em um único processo)
+    python run_server.py --dev    servidor de desenvolvimento do Flask
+"""
+
+import argparse
+import os
 import sys
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def run_gunicorn():
+    from gunicorn.app.wsgiapp import WSGIApplication
+    sys.argv = ['gunicorn', '--config', os.path.join(BASE_DIR, 'gunicorn.conf.py'), 'app:app']
+    WSGIApplication("%(prog)s [OPTIONS] [APP_MODULE]").run()
+
+def run_waitress():
+    from waitress import serve
+    from app import app, event_broker, warm_up_worker
+
+    host, _, port = os.environ.get('WEB_BIND', '0.0.0.0:5000').rpartition(':')
+    threads = int(os.environ.get('WEB_THREADS', 16))
+    # Como no gunicorn: conexões SSE não podem ocupar as threads das demais requisições
+    request_threads = int(os.environ.get('WEB_REQUEST_THREADS', 4))
+    event_broker.max_clients = max(0, min(event_broker.max_clients, threads - request_threads))
+    warm_up_worker()
+    print(f"Iniciando waitress em http://{host}:{port} ({threads} threads)")
+    serve(app, host=host, port=int(port), threads=threads)
+
+def run_dev():
+    from app import app
+    print("Iniciando servidor Flask...")
+    app.run(debug=True, host='127.0.0.1', port=5000, use_reloader=False)
+
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Iniciar o servidor da aplicação')
+    parser.add_argument('--dev', action='store_true', help='Servidor de desenvolvimento do Flask (debug)')
+    args = parser.parse_args()
+
+    os.chdir(BASE_DIR)
+    sys.path.insert(0, BASE_DIR)
     try:
-        print("Iniciando servidor Flask...")
-        app.run(debug=True, host='127.0.0.1', port=5000, use_reloader=False)
+        if args.dev:
+            run_dev()
+        elif os.name == 'nt':
+            run_waitress()
+        else:
+            run_gunicorn()
     except Exception as e:
         print(f"Erro ao iniciar servidor: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
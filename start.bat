@@ -49,4 +49,4 @@ echo Acesse: http://localhost:5000
 echo Pressione Ctrl+C para parar
 echo.
 
-python app.py
\ No newline at end of file
+python run_server.py
\ No newline at end of file
@@ -5,9 +5,9 @@
 let logsData = {
     logs: [],
     filteredLogs: [],
-    currentPage: 1,
-    pageSize: 50,
-    totalPages: 1
+    nextCursor: null,
+    hasMore: false,
+    pageSize: 50
 };
 
 // Inicialização
@@ -20,7 +20,7 @@ document.addEventListener('DOMContentLoaded', function() {
 });
 
 function setupEventListeners() {
-    // Busca e filtros
+    // Busca (nos logs já carregados) e filtros (aplicados no servidor)
     document.getElementById('logSearch').addEventListener('input', handleLogSearch);
     document.getElementById('logTypeFilter').addEventListener('change', handleLogFilter);
     document.getElementById('userFilter').addEventListener('change', handleLogFilter);
@@ -28,7 +28,7 @@ function setupEventListeners() {
     document.getElementById('endDate').addEventListener('change', handleLogFilter);
     
     // Botões
-    document.getElementById('refreshLogsBtn').addEventListener('click', loadLogs);
+    document.getElementById('refreshLogsBtn').addEventListener('click', () => loadLogs());
     document.getElementById('clearLogsBtn').addEventListener('click', clearLogs);
 }
 
@@ -56,52 +56,39 @@ async function loadUsers() {
     }
 }
 
-async function loadLogs() {
-    console.log('[LOGS] Carregando logs do sistema');
+function buildLogsQuery(cursor) {
+    const params = new URLSearchParams({ limit: logsData.pageSize });
+    const filters = {
+        tipo: document.getElementById('logTypeFilter').value,
+        usuario_id: document.getElementById('userFilter').value,
+        inicio: document.getElementById('startDate').value,
+        fim: document.getElementById('endDate').value,
+        cursor: cursor
+    };
+    Object.entries(filters).forEach(([key, value]) => {
+        if (value) params.append(key, value);
+    });
+    return params.toString();
+}
+
+async function loadLogs(append = false) {
+    console.log(`[LOGS] Carregando logs do sistema${append ? ' (próxima página)' : ''}`);
     showLoading(true);
     
     try {
-        // Simular carregamento de logs do sistema
-        // Por enquanto, vamos usar os logs disponíveis dos usuários
-        const response = await fetch('/api/admin/users');
+        // Feed único (logins e movimentações), paginado por cursor no servidor
+        const response = await fetch(`/api/admin/logs?${buildLogsQuery(append ? logsData.nextCursor : null)}`);
+        const data = await response.json();
         if (!response.ok) {
-            throw new Error(`Erro HTTP: ${response.status}`);
+            throw new Error(data.error || data.message || `Erro HTTP: ${response.status}`);
         }
         
-        const users = await response.json();
-        let allLogs = [];
-        
-        // Carregar logs de cada usuário
-        for (const user of users) {
-            try {
-                const userLogsResponse = await fetch(`/api/admin/users/${user.id}/logs`);
-                if (userLogsResponse.ok) {
-                    const userLogs = await userLogsResponse.json();
-                    // Adicionar informações do usuário aos logs
-                    userLogs.forEach(log => {
-                        log.usuario_id = user.id;
-                        log.usuario_nome = user.nome || user.username;
-                    });
-                    allLogs = allLogs.concat(userLogs);
-                }
-            } catch (e) {
-                console.warn(`[LOGS] Erro ao carregar logs do usuário ${user.id}:`, e);
-            }
-        }
-        
-        // Ordenar logs por data (mais recentes primeiro)
-        allLogs.sort((a, b) => {
-            const dateA = new Date(a.data_hora || 0);
-            const dateB = new Date(b.data_hora || 0);
-            return dateB - dateA;
-        });
-        
-        logsData.logs = allLogs;
-        logsData.filteredLogs = allLogs;
-        updatePagination();
-        updateLogsDisplay();
+        logsData.logs = append ? logsData.logs.concat(data.items) : data.items;
+        logsData.nextCursor = data.next_cursor;
+        logsData.hasMore = data.has_more;
+        applySearch();
         
-        console.log(`[LOGS] Carregados ${allLogs.length} logs`);
+        console.log(`[LOGS] ${logsData.logs.length} logs carregados`);
         
     } catch (error) {
         console.error('[LOGS] Erro ao carregar logs:', error);
@@ -115,24 +102,25 @@ function handleLogSearch(event) {
     const searchTerm = event.target.value.toLowerCase().trim();
     console.log(`[LOGS] Buscando: "${searchTerm}"`);
     
-    applyFilters();
+    applySearch();
 }
 
 function handleLogFilter() {
+    const startDate = document.getElementById('startDate').value;
+    const endDate = document.getElementById('endDate').value;
+    if (startDate && endDate && startDate > endDate) {
+        showError('A data inicial deve ser anterior à data final');
+        return;
+    }
+    
     console.log('[LOGS] Aplicando filtros');
-    applyFilters();
+    loadLogs();
 }
 
-function applyFilters() {
+function applySearch() {
     const searchTerm = document.getElementById('logSearch').value.toLowerCase().trim();
-    const typeFilter = document.getElementById('logTypeFilter').value;
-    const userFilter = document.getElementById('userFilter').value;
-    const startDate = document.getElementById('startDate').value;
-    const endDate = document.getElementById('endDate').value;
     
     let filtered = logsData.logs;
-    
-    // Filtro de busca
     if (searchTerm) {
         filtered = filtered.filter(log => 
             (log.mensagem && log.mensagem.toLowerCase().includes(searchTerm)) ||
@@ -141,94 +129,29 @@ function applyFilters() {
         );
     }
     
-    // Filtro de tipo
-    if (typeFilter) {
-        filtered = filtered.filter(log => log.tipo === typeFilter);
-    }
-    
-    // Filtro de usuário
-    if (userFilter) {
-        filtered = filtered.filter(log => log.usuario_id == userFilter);
-    }
-    
-    // Filtro de data
-    if (startDate) {
-        const start = new Date(startDate);
-        filtered = filtered.filter(log => {
-            const logDate = new Date(log.data_hora);
-            return logDate >= start;
-        });
-    }
-    
-    if (endDate) {
-        const end = new Date(endDate);
-        end.setHours(23, 59, 59, 999); // Final do dia
-        filtered = filtered.filter(log => {
-            const logDate = new Date(log.data_hora);
-            return logDate <= end;
-        });
-    }
-    
     logsData.filteredLogs = filtered;
-    logsData.currentPage = 1; // Resetar para primeira página
-    updatePagination();
     updateLogsDisplay();
-    
-    console.log(`[LOGS] Filtros resultaram em ${filtered.length} logs`);
+    updatePagination();
 }
 
 function updatePagination() {
-    logsData.totalPages = Math.ceil(logsData.filteredLogs.length / logsData.pageSize);
-    
     const pagination = document.getElementById('pagination');
     pagination.innerHTML = '';
     
-    if (logsData.totalPages <= 1) return;
+    if (!logsData.hasMore) return;
     
-    // Botão anterior
-    if (logsData.currentPage > 1) {
-        const prevBtn = document.createElement('button');
-        prevBtn.className = 'btn btn-secondary';
-        prevBtn.innerHTML = '<i class="fas fa-chevron-left"></i> Anterior';
-        prevBtn.onclick = () => changePage(logsData.currentPage - 1);
-        pagination.appendChild(prevBtn);
-    }
-    
-    // Números das páginas
-    const startPage = Math.max(1, logsData.currentPage - 2);
-    const endPage = Math.min(logsData.totalPages, logsData.currentPage + 2);
-    
-    for (let i = startPage; i <= endPage; i++) {
-        const pageBtn = document.createElement('button');
-        pageBtn.className = `btn ${i === logsData.currentPage ? 'btn-primary' : 'btn-secondary'}`;
-        pageBtn.textContent = i;
-        pageBtn.onclick = () => changePage(i);
-        pagination.appendChild(pageBtn);
-    }
-    
-    // Botão próximo
-    if (logsData.currentPage < logsData.totalPages) {
-        const nextBtn = document.createElement('button');
-        nextBtn.className = 'btn btn-secondary';
-        nextBtn.innerHTML = 'Próximo <i class="fas fa-chevron-right"></i>';
-        nextBtn.onclick = () => changePage(logsData.currentPage + 1);
-        pagination.appendChild(nextBtn);
-    }
-}
-
-function changePage(page) {
-    logsData.currentPage = page;
-    updateLogsDisplay();
-    updatePagination();
+    const moreBtn = document.createElement('button');
+    moreBtn.className = 'btn btn-secondary';
+    moreBtn.innerHTML = '<i class="fas fa-chevron-down"></i> Carregar mais';
+    moreBtn.onclick = () => loadLogs(true);
+    pagination.appendChild(moreBtn);
 }
 
 function updateLogsDisplay() {
     const container = document.getElementById('logs-container');
     container.innerHTML = '';
     
-    const startIndex = (logsData.currentPage - 1) * logsData.pageSize;
-    const endIndex = startIndex + logsData.pageSize;
-    const logsToShow = logsData.filteredLogs.slice(startIndex, endIndex);
+    const logsToShow = logsData.filteredLogs;
     
     if (logsToShow.length === 0) {
         container.innerHTML = `
@@ -245,16 +168,15 @@ function updateLogsDisplay() {
         container.appendChild(logElement);
     });
     
-    // Adicionar informações de paginação
+    // Informações de paginação
     const info = document.createElement('div');
     info.className = 'pagination-info';
-    info.innerHTML = `
-        Mostrando ${startIndex + 1}-${Math.min(endIndex, logsData.filteredLogs.length)} 
-        de ${logsData.filteredLogs.length} logs
-    `;
+    info.innerHTML = logsToShow.length === logsData.logs.length
+        ? `Mostrando ${logsData.logs.length} logs${logsData.hasMore ? ' (há mais)' : ''}`
+        : `Mostrando ${logsToShow.length} de ${logsData.logs.length} logs carregados`;
     container.insertBefore(info, container.firstChild);
     
-    console.log(`[LOGS] Exibindo ${logsToShow.length} logs (página ${logsData.currentPage})`);
+    console.log(`[LOGS] Exibindo ${logsToShow.length} logs`);
 }
 
 function createLogElement(log) {
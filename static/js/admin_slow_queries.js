@@ -0,0 +1,131 @@
+/**
+ * JavaScript para página de queries lentas
+ */
+
+// Inicialização
+document.addEventListener('DOMContentLoaded', function() {
+    console.log('[SQL LENTA] Inicializando página de queries lentas');
+    
+    document.getElementById('slowQueryOrder').addEventListener('change', loadSlowQueries);
+    document.getElementById('refreshSlowQueriesBtn').addEventListener('click', loadSlowQueries);
+    document.getElementById('clearSlowQueriesBtn').addEventListener('click', clearSlowQueries);
+    
+    loadSlowQueries();
+});
+
+async function loadSlowQueries() {
+    showLoading(true);
+    
+    try {
+        const ordem = document.getElementById('slowQueryOrder').value;
+        const response = await fetch(`/api/admin/slow-queries?ordem=${encodeURIComponent(ordem)}`);
+        if (!response.ok) {
+            throw new Error(`Erro HTTP: ${response.status}`);
+        }
+        
+        const data = await response.json();
+        document.getElementById('slowQueriesSubtitle').textContent =
+            `Queries acima de ${data.threshold_ms} ms, agrupadas por SQL normalizado`;
+        renderSlowQueries(data.consultas);
+        
+    } catch (error) {
+        console.error('[SQL LENTA] Erro ao carregar queries lentas:', error);
+        alert('Erro: Erro ao carregar queries lentas: ' + error.message);
+    } finally {
+        showLoading(false);
+    }
+}
+
+function renderSlowQueries(consultas) {
+    const tableBody = document.getElementById('slow-queries-body');
+    tableBody.innerHTML = '';
+    
+    if (consultas.length === 0) {
+        tableBody.innerHTML = `
+            <tr>
+                <td colspan="9" style="text-align: center; padding: 2rem; color: #666;">
+                    Nenhuma query lenta registrada
+                </td>
+            </tr>
+        `;
+        return;
+    }
+    
+    consultas.forEach(consulta => {
+        const row = document.createElement('tr');
+        row.style.cursor = 'pointer';
+        row.title = consulta.tem_plano ? 'Ver plano de execução' : 'Ver SQL';
+        row.innerHTML = `
+            <td><code>${escapeHtml(truncate(consulta.sql_normalizado, 120))}</code></td>
+            <td>${consulta.ocorrencias}</td>
+            <td>${formatMs(consulta.tempo_total_ms)}</td>
+            <td>${formatMs(consulta.tempo_medio_ms)}</td>
+            <td>${formatMs(consulta.tempo_max_ms)}</td>
+            <td>${consulta.ultimo_rowcount ?? '-'}</td>
+            <td><code>${escapeHtml(consulta.formato_parametros || '')}</code></td>
+            <td>${escapeHtml(consulta.endpoint || '-')}</td>
+            <td>${formatDate(consulta.ultima_ocorrencia)}</td>
+        `;
+        row.addEventListener('click', () => showSlowQueryDetail(consulta.fingerprint));
+        tableBody.appendChild(row);
+    });
+}
+
+async function showSlowQueryDetail(fingerprint) {
+    try {
+        const response = await fetch(`/api/admin/slow-queries/${encodeURIComponent(fingerprint)}`);
+        if (!response.ok) {
+            throw new Error(`Erro HTTP: ${response.status}`);
+        }
+        
+        const consulta = await response.json();
+        document.getElementById('slowQueryDetailTitle').textContent =
+            `Query ${consulta.fingerprint} (${consulta.ocorrencias} ocorrências)`;
+        document.getElementById('slowQuerySql').textContent = consulta.sql_normalizado;
+        document.getElementById('slowQueryPlan').textContent = consulta.plano
+            ? JSON.stringify(consulta.plano, null, 2)
+            : 'Plano de execução não capturado';
+        
+        const detail = document.getElementById('slowQueryDetail');
+        detail.style.display = 'block';
+        detail.scrollIntoView({ behavior: 'smooth' });
+        
+    } catch (error) {
+        console.error('[SQL LENTA] Erro ao carregar detalhe:', error);
+        alert('Erro: Erro ao carregar detalhe: ' + error.message);
+    }
+}
+
+async function clearSlowQueries() {
+    if (!confirm('Tem certeza que deseja limpar o log de queries lentas?')) {
+        return;
+    }
+    
+    try {
+        const response = await fetch('/api/admin/slow-queries', { method: 'DELETE' });
+        const result = await response.json();
+        if (!result.success) {
+            throw new Error(result.message);
+        }
+        document.getElementById('slowQueryDetail').style.display = 'none';
+        loadSlowQueries();
+        
+    } catch (error) {
+        console.error('[SQL LENTA] Erro ao limpar log:', error);
+        alert('Erro: Erro ao limpar log: ' + error.message);
+    }
+}
+
+function showLoading(show) {
+    const overlay = document.getElementById('loadingOverlay');
+    overlay.style.display = show ? 'flex' : 'none';
+}
+
+// Funções utilitárias
+function formatMs(value) {
+    return value == null ? '-' : Number(value).toLocaleString('pt-BR', { maximumFractionDigits: 1 });
+}
+
+function truncate(text, length) {
+    return text && text.length > length ? text.slice(0, length) + '…' : (text || '');
+}
@@ -1,6 +1,11 @@
 // Dashboard JavaScript
 class Dashboard {
     constructor() {
+        this.eventSource = null;
+        this.lastEventId = null;  // Id da última movimentação recebida, repassado ao servidor na reconexão
+        this.seenIds = new Set();
+        this.alertsTimer = null;
+        this.lowStockIds = new Set();
         this.init();
     }
 
@@ -13,12 +18,12 @@ class Dashboard {
 
     async loadDashboardData() {
         try {
-            const produtos = await api.get('/produtos');
+            const resumo = await api.get('/produtos/resumo');
             const estoqueBaixo = await api.get('/relatorio/estoque-baixo');
             
-            // Calcular estatísticas
-            const totalProdutos = produtos.length;
-            const itensEstoque = produtos.reduce((total, produto) => total + (produto.quantidade || 0), 0);
+            // Estatísticas agregadas no servidor
+            const totalProdutos = resumo.total_produtos;
+            const itensEstoque = resumo.itens_estoque;
             const produtosEstoqueBaixo = estoqueBaixo.length;
             
             // Atualizar cards do dashboard
@@ -26,13 +31,9 @@ class Dashboard {
             this.updateDashboardCard('itens-estoque', itensEstoque);
             this.updateDashboardCard('estoque-baixo', produtosEstoqueBaixo);
 
-            // Carregar movimentações de hoje
-            const today = new Date().toISOString().split('T')[0];
+            // Carregar movimentações de hoje (o servidor marca as do dia dele)
             const movimentacoesRecentes = await api.get('/relatorio/movimentacoes');
-            const movimentacoesHoje = movimentacoesRecentes.filter(mov => {
-                const movDate = new Date(mov.data_movimento).toISOString().split('T')[0];
-                return movDate === today;
-            }).length;
+            const movimentacoesHoje = movimentacoesRecentes.filter(mov => mov.hoje).length;
             
             this.updateDashboardCard('movimentacoes-hoje', movimentacoesHoje);
 
@@ -71,19 +72,7 @@ class Dashboard {
             }
 
             recentActivities.forEach(atividade => {
-                const row = document.createElement('tr');
-                const tipoIcon = atividade.tipo === 'ENTRADA' ? 
-                    '<i class="fas fa-arrow-up" style="color: #28a745;"></i>' : 
-                    '<i class="fas fa-arrow-down" style="color: #dc3545;"></i>';
-                
-                row.innerHTML = `
-                    <td>${formatDate(atividade.data_movimento)}</td>
-                    <td>${escapeHtml(atividade.produto_nome || 'N/A')}</td>
-                    <td>${tipoIcon} ${atividade.tipo}</td>
-                    <td>${atividade.quantidade}</td>
-                    <td>${escapeHtml(atividade.descricao || 'N/A')}</td>
-                `;
-                tableBody.appendChild(row);
+                tableBody.appendChild(this.createActivityRow(atividade));
             });
 
         } catch (error) {
@@ -91,9 +80,26 @@ class Dashboard {
         }
     }
 
+    createActivityRow(atividade) {
+        const row = document.createElement('tr');
+        const tipoIcon = atividade.tipo === 'ENTRADA' ? 
+            '<i class="fas fa-arrow-up" style="color: #28a745;"></i>' : 
+            '<i class="fas fa-arrow-down" style="color: #dc3545;"></i>';
+        
+        row.innerHTML = `
+            <td>${formatDate(atividade.data_movimento)}</td>
+            <td>${escapeHtml(atividade.produto_nome || 'N/A')}</td>
+            <td>${tipoIcon} ${atividade.tipo}</td>
+            <td>${atividade.quantidade}</td>
+            <td>${escapeHtml(atividade.descricao || 'N/A')}</td>
+        `;
+        return row;
+    }
+
     async loadAlerts() {
         try {
             const estoqueBaixo = await api.get('/relatorio/estoque-baixo');
+            this.lowStockIds = new Set(estoqueBaixo.map(produto => produto.id));
             const alertsContainer = document.getElementById('alerts-container');
             
             if (!alertsContainer) return;
@@ -141,12 +147,105 @@ class Dashboard {
     }
 
     setupAutoRefresh() {
-        // Atualizar dados a cada 5 minutos
-        setInterval(() => {
-            this.loadDashboardData();
-            this.loadRecentActivities();
-            this.loadAlerts();
-        }, 5 * 60 * 1000);
+        // Sem suporte a SSE: voltar a atualizar a cada 5 minutos
+        if (!window.EventSource) {
+            setInterval(() => this.refreshAll(), 5 * 60 * 1000);
+            return;
+        }
+
+        window.addEventListener('beforeunload', () => this.eventSource.close());
+        this.connectEvents();
+    }
+
+    connectEvents() {
+        // Atualizações em tempo real enviadas pelo servidor
+        // Nova conexão depois de recusada: retomar do último id recebido, como veio do servidor.
+        // Nas reconexões automáticas o navegador envia o mesmo valor em Last-Event-ID
+        const url = this.lastEventId ? `/api/eventos?ultimo_id=${encodeURIComponent(this.lastEventId)}` : '/api/eventos';
+        this.eventSource = new EventSource(url);
+
+        this.eventSource.onerror = () => {
+            // Recusado (503: servidor no limite de conexões): o navegador não tenta de novo sozinho
+            if (this.eventSource.readyState === EventSource.CLOSED) {
+                this.refreshAll();
+                setTimeout(() => this.connectEvents(), 60 * 1000);
+            }
+        };
+
+        this.eventSource.addEventListener('movimentacao', (event) => {
+            const movimentacao = JSON.parse(event.data);
+            if (!this.lastEventId || movimentacao.id > Number(this.lastEventId)) {
+                this.lastEventId = event.lastEventId;
+            }
+            // Retomadas podem reenviar movimentações já exibidas
+            if (this.seenIds.has(movimentacao.id)) return;
+            this.seenIds.add(movimentacao.id);
+            if (this.seenIds.size > 1000) {
+                this.seenIds.delete(this.seenIds.values().next().value);
+            }
+            this.handleMovimentacao(movimentacao);
+        });
+
+        this.eventSource.addEventListener('estoque-baixo', () => {
+            this.scheduleAlertsRefresh();
+        });
+
+        this.eventSource.addEventListener('estoque', (event) => {
+            // Produto que saiu da faixa de estoque baixo após uma entrada
+            const estoque = JSON.parse(event.data);
+            if (this.lowStockIds.has(estoque.produto_id) && estoque.quantidade > estoque.estoque_minimo) {
+                this.scheduleAlertsRefresh();
+            }
+        });
+
+        this.eventSource.addEventListener('resync', () => {
+            this.refreshAll();
+        });
+    }
+
+    refreshAll() {
+        this.loadDashboardData();
+        this.loadRecentActivities();
+        this.loadAlerts();
+    }
+
+    handleMovimentacao(movimentacao) {
+        // Nova linha no topo das atividades recentes (mantendo 10)
+        const tableBody = document.getElementById('recent-activities-body');
+        if (tableBody) {
+            const placeholder = tableBody.querySelector('td[colspan]');
+            if (placeholder) {
+                tableBody.innerHTML = '';
+            }
+            tableBody.insertBefore(this.createActivityRow(movimentacao), tableBody.firstChild);
+            while (tableBody.rows.length > 10) {
+                tableBody.deleteRow(-1);
+            }
+        }
+
+        if (movimentacao.hoje) {
+            this.incrementDashboardCard('movimentacoes-hoje', 1);
+        }
+
+        const delta = movimentacao.tipo === 'ENTRADA' ? movimentacao.quantidade : -movimentacao.quantidade;
+        this.incrementDashboardCard('itens-estoque', delta);
+    }
+
+    incrementDashboardCard(elementId, delta) {
+        const element = document.getElementById(elementId);
+        if (element) {
+            const atual = parseInt(element.textContent.replace(/\D/g, ''), 10) || 0;
+            this.updateDashboardCard(elementId, Math.max(atual + delta, 0));
+        }
+    }
+
+    scheduleAlertsRefresh() {
+        // Agrupar rajadas de eventos em uma única consulta
+        clearTimeout(this.alertsTimer);
+        this.alertsTimer = setTimeout(async () => {
+            await this.loadAlerts();
+            this.updateDashboardCard('estoque-baixo', this.lowStockIds.size);
+        }, 2000);
     }
 }
 
@@ -3,6 +3,14 @@ class EstoqueManager {
     constructor() {
         this.produtos = [];
         this.selectedProduto = null;
+        this.nextCursor = null;
+        this.pageSize = 100;
+        this.modoLocal = false;  // Sem conexão: páginas vêm do catálogo salvo (offline.js)
+        this.opcoesProduto = new Map();  // Produtos do select do modal, independentes da tabela
+        this.selectLimit = 50;
+        // Contadores de requisição: só a resposta da busca mais recente é aplicada
+        this.estoqueSeq = 0;
+        this.buscaProdutoSeq = 0;
         this.init();
     }
 
@@ -66,6 +74,12 @@ class EstoqueManager {
             selectProduto.addEventListener('change', (e) => this.onProdutoSelect(e));
         }
 
+        // Busca de produto do modal (não depende da página nem dos filtros da tabela)
+        const buscaProduto = document.getElementById('busca-produto');
+        if (buscaProduto) {
+            buscaProduto.addEventListener('input', debounce(() => this.buscarProdutosSelect(buscaProduto.value.trim()), 300));
+        }
+
         // Tipo de movimento
         const tipoMovimento = document.getElementById('tipo-movimento');
         if (tipoMovimento) {
@@ -82,19 +96,80 @@ class EstoqueManager {
         if (filterStatus) {
             filterStatus.addEventListener('change', () => this.filterEstoque());
         }
+
+        // Próxima página do estoque
+        const btnLoadMore = document.getElementById('btn-load-more-estoque');
+        if (btnLoadMore) {
+            btnLoadMore.addEventListener('click', () => this.loadEstoque(true));
+        }
+
+        // Catálogo local mudou (sincronização ou fila enviada): atualizar a tela offline
+        window.addEventListener('catalogo-local-atualizado', () => {
+            if (this.modoLocal) {
+                this.loadEstoque();
+            }
+        });
     }
 
-    async loadEstoque() {
+    async loadEstoque(append = false) {
+        const seq = ++this.estoqueSeq;
+        if (append && this.modoLocal) {
+            await this.loadEstoqueLocal(true, seq);
+            return;
+        }
+
         try {
-            this.produtos = await api.get('/produtos');
-            this.renderEstoque();
-            this.populateProdutoSelect();
+            // Filtros são aplicados no servidor, página a página
+            const page = await api.get('/produtos', {
+                limit: this.pageSize,
+                cursor: append ? this.nextCursor : null,
+                q: document.getElementById('search-estoque')?.value.trim(),
+                status: document.getElementById('filter-status')?.value,
+                fields: 'nome,categoria,quantidade,estoque_minimo,estoque_maximo'
+            });
+            if (seq !== this.estoqueSeq) return;  // Busca mais nova em andamento
+
+            this.modoLocal = false;
+            this.nextCursor = page.next_cursor;
+            this.showPage(page, append);
         } catch (error) {
+            if (seq !== this.estoqueSeq) return;
+            if (error.offline && await this.loadEstoqueLocal(append, seq)) {
+                return;
+            }
             console.error('Erro ao carregar estoque:', error);
             showError('Erro ao carregar dados do estoque');
         }
     }
 
+    // Mesma listagem a partir do catálogo salvo no dispositivo; false se não houver
+    async loadEstoqueLocal(append = false, seq = this.estoqueSeq) {
+        const page = await catalogoLocal.pagina({
+            q: document.getElementById('search-estoque')?.value.trim(),
+            status: document.getElementById('filter-status')?.value
+        }, append ? this.produtos.length : 0, this.pageSize);
+        if (!page) return false;
+        if (seq !== this.estoqueSeq) return true;
+
+        if (!this.modoLocal) {
+            showInfo('Sem conexão: exibindo o estoque salvo neste dispositivo');
+        }
+        this.modoLocal = true;
+        this.nextCursor = null;
+        this.showPage(page, append);
+        return true;
+    }
+
+    showPage(page, append) {
+        this.produtos = append ? this.produtos.concat(page.items) : page.items;
+        this.renderEstoque();
+
+        const btnLoadMore = document.getElementById('btn-load-more-estoque');
+        if (btnLoadMore) {
+            btnLoadMore.style.display = page.has_more ? 'block' : 'none';
+        }
+    }
+
     renderEstoque(produtosToRender = this.produtos) {
         const tableBody = document.getElementById('estoque-table-body');
         if (!tableBody) return;
@@ -161,51 +236,74 @@ class EstoqueManager {
         }
     }
 
-    populateProdutoSelect() {
+    // Opções do select a partir de GET /api/produtos?q=, sem relação com a página da tabela
+    async buscarProdutosSelect(q = '') {
+        const seq = ++this.buscaProdutoSeq;
+        let page;
+        try {
+            page = await api.get('/produtos', {
+                limit: this.selectLimit,
+                q: q,
+                fields: 'nome,categoria,quantidade,estoque_minimo'
+            });
+        } catch (error) {
+            if (!error.offline) {
+                console.error('Erro ao buscar produtos:', error);
+                return;
+            }
+            page = await catalogoLocal.pagina({ q: q }, 0, this.selectLimit);
+            if (!page) return;
+        }
+        if (seq !== this.buscaProdutoSeq) return;  // Resposta de uma busca já substituída
+        this.populateProdutoSelect(page.items);
+    }
+
+    populateProdutoSelect(produtos) {
         const select = document.getElementById('select-produto');
         if (!select) return;
 
+        // O produto escolhido continua no select mesmo fora do resultado da busca
+        const selecionado = this.selectedProduto;
+        if (selecionado && !produtos.some(p => p.id === selecionado.id)) {
+            produtos = [selecionado].concat(produtos);
+        }
+
         // Limpar opções existentes (exceto a primeira)
         while (select.children.length > 1) {
             select.removeChild(select.lastChild);
         }
 
-        this.produtos.forEach(produto => {
+        this.opcoesProduto = new Map();
+        produtos.forEach(produto => {
+            this.opcoesProduto.set(produto.id, produto);
             const option = document.createElement('option');
             option.value = produto.id;
             option.textContent = produto.nome;
             select.appendChild(option);
         });
+        select.value = selecionado ? selecionado.id : '';
     }
 
-    filterEstoque() {
-        const searchValue = document.getElementById('search-estoque')?.value.toLowerCase() || '';
-        const statusFilter = document.getElementById('filter-status')?.value || '';
-
-        let filteredProdutos = this.produtos;
-
-        // Filtrar por texto de pesquisa
-        if (searchValue) {
-            filteredProdutos = filteredProdutos.filter(produto => 
-                produto.nome.toLowerCase().includes(searchValue) ||
-                produto.categoria?.toLowerCase().includes(searchValue)
-            );
-        }
-
-        // Filtrar por status
-        if (statusFilter) {
-            filteredProdutos = filteredProdutos.filter(produto => {
-                const { statusClass } = this.getStatusEstoque(produto);
-                return statusClass.includes(statusFilter);
-            });
+    // Selecionar um produto já conhecido (linha da tabela, leitura NFC) mesmo fora das opções
+    selecionarProduto(produto) {
+        this.selectedProduto = produto;
+        if (!this.opcoesProduto.has(produto.id)) {
+            this.populateProdutoSelect(Array.from(this.opcoesProduto.values()));
         }
+        document.getElementById('select-produto').value = produto.id;
+        this.showProductInfo(produto);
+    }
 
-        this.renderEstoque(filteredProdutos);
+    filterEstoque() {
+        // Pesquisa e status são filtrados no servidor
+        this.loadEstoque();
     }
 
     openMovimentacaoModal(tipo = null) {
         clearForm('movimentacao-form');
+        this.selectedProduto = null;
         document.getElementById('product-info').style.display = 'none';
+        this.buscarProdutosSelect();
         
         if (tipo) {
             document.getElementById('tipo-movimento').value = tipo;
@@ -220,13 +318,15 @@ class EstoqueManager {
 
     openMovimentacaoModalForProduto(produtoId) {
         this.openMovimentacaoModal();
-        document.getElementById('select-produto').value = produtoId;
-        this.onProdutoSelect({ target: { value: produtoId } });
+        const produto = this.produtos.find(p => p.id === produtoId);
+        if (produto) {
+            this.selecionarProduto(produto);
+        }
     }
 
     onProdutoSelect(e) {
         const produtoId = parseInt(e.target.value);
-        const produto = this.produtos.find(p => p.id === produtoId);
+        const produto = this.opcoesProduto.get(produtoId);
 
         if (produto) {
             this.selectedProduto = produto;
@@ -282,15 +382,23 @@ class EstoqueManager {
         }
 
         try {
-            const endpoint = `/estoque/${produtoId}/${tipo}`;
-            await api.post(endpoint, { quantidade, descricao });
+            // Sem conexão a movimentação fica na fila local e é enviada depois
+            const resultado = await filaMovimentacoes.registrar(produtoId, tipo, quantidade, descricao);
+            if (!resultado.success) {
+                showError(resultado.error || 'Erro ao registrar movimentação');
+                return;
+            }
             
-            showSuccess(`${tipo === 'entrada' ? 'Entrada' : 'Saída'} registrada com sucesso!`);
+            if (resultado.enfileirada) {
+                showInfo('Sem conexão: movimentação guardada e será enviada quando a conexão voltar', 5000);
+            } else {
+                showSuccess(`${tipo === 'entrada' ? 'Entrada' : 'Saída'} registrada com sucesso!`);
+            }
             modalManager.closeModal();
             await this.loadEstoque();
         } catch (error) {
             console.error('Erro ao registrar movimentação:', error);
-            showError(error.error || 'Erro ao registrar movimentação');
+            showError(error.message || 'Erro ao registrar movimentação');
         }
     }
 
@@ -2,6 +2,9 @@
 class ApiClient {
     constructor(baseURL = '/api') {
         this.baseURL = baseURL;
+        // Respostas GET com ETag: url -> {etag, data}; reenviadas como If-None-Match
+        this.etagCache = new Map();
+        this.etagCacheSize = 50;
     }
 
     async request(endpoint, options = {}) {
@@ -12,32 +15,57 @@ class ApiClient {
             },
             ...options,
         };
+        const isGet = !config.method || config.method.toUpperCase() === 'GET';
+        const cached = isGet ? this.etagCache.get(url) : null;
 
         if (config.body && typeof config.body === 'object') {
             config.body = JSON.stringify(config.body);
         }
+        if (cached) {
+            config.headers = { ...config.headers, 'If-None-Match': cached.etag };
+        }
 
         try {
             showLoading(true);
             const response = await fetch(url, config);
+            if (response.status === 304 && cached) {
+                // Nada mudou desde a última resposta: reutilizar o corpo guardado
+                this.etagCache.delete(url);
+                this.etagCache.set(url, cached);
+                return structuredClone(cached.data);  // Cópia: quem chama pode alterar o resultado
+            }
             const data = await response.json();
             
             if (!response.ok) {
                 throw new Error(data.message || 'Erro na requisição');
             }
             
+            const etag = isGet ? response.headers.get('ETag') : null;
+            if (etag) {
+                this.etagCache.delete(url);
+                this.etagCache.set(url, { etag, data: structuredClone(data) });
+                if (this.etagCache.size > this.etagCacheSize) {
+                    this.etagCache.delete(this.etagCache.keys().next().value);
+                }
+            }
+            
             return data;
         } catch (error) {
             console.error('Erro na API:', error);
-            showError('Erro na comunicação com o servidor: ' + error.message);
+            if (error instanceof TypeError) {
+                // Falha de rede: quem chamou decide se usa o catálogo local (offline.js)
+                error.offline = true;
+            } else {
+                showError('Erro na comunicação com o servidor: ' + error.message);
+            }
             throw error;
         } finally {
             showLoading(false);
         }
     }
 
-    async get(endpoint) {
-        return this.request(endpoint);
+    async get(endpoint, params = null) {
+        return this.request(endpoint + buildQueryString(params));
     }
 
     async post(endpoint, data) {
@@ -64,6 +92,19 @@ class ApiClient {
 // Instância global da API
 const api = new ApiClient();
 
+// Montar query string ignorando parâmetros vazios
+function buildQueryString(params) {
+    if (!params) return '';
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value !== null && value !== undefined && value !== '') {
+            query.append(key, value);
+        }
+    });
+    const queryString = query.toString();
+    return queryString ? `?${queryString}` : '';
+}
+
 // Funções de loading
 function showLoading(show = true) {
     const loadingEl = document.getElementById('loading');
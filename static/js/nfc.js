@@ -252,25 +252,31 @@ class NFCManager {
     // Buscar produto por ID ou código de barras
     async buscarProduto(dados) {
         try {
-            const produtos = await api.get('/produtos');
-            
-            // Buscar por ID
-            if (dados.produto_id) {
-                return produtos.find(p => p.id === parseInt(dados.produto_id));
-            }
-            
-            // Buscar por código de barras
-            if (dados.codigo_barras) {
-                return produtos.find(p => p.codigo_barras === dados.codigo_barras);
+            // Buscar por ID ou código de barras (consulta indexada, sem baixar o catálogo)
+            if (dados.produto_id || dados.codigo_barras) {
+                const resultado = await api.post('/produtos/lookup', {
+                    produto_ids: dados.produto_id ? [parseInt(dados.produto_id)] : [],
+                    codigos_barras: dados.codigo_barras ? [dados.codigo_barras] : []
+                });
+                
+                if (dados.produto_id) {
+                    return resultado.por_id[parseInt(dados.produto_id)] || null;
+                }
+                return resultado.por_codigo_barras[dados.codigo_barras] || null;
             }
             
             // Buscar por nome (fallback)
             if (dados.nome) {
-                return produtos.find(p => p.nome.toLowerCase().includes(dados.nome.toLowerCase()));
+                const page = await api.get('/produtos', { q: dados.nome, limit: 1 });
+                return page.items[0] || null;
             }
             
             return null;
         } catch (erro) {
+            if (erro.offline) {
+                // Sem conexão: procurar no catálogo salvo no dispositivo
+                return catalogoLocal.buscar(dados);
+            }
             console.error("Erro ao buscar produto:", erro);
             return null;
         }
@@ -280,7 +286,10 @@ class NFCManager {
     preencherFormularioMovimentacao(produto, dados) {
         // Preencher select do produto
         const selectProduto = document.getElementById('select-produto');
-        if (selectProduto) {
+        if (typeof estoqueManager !== 'undefined' && estoqueManager) {
+            // O produto lido pode não estar entre as opções da busca do modal
+            estoqueManager.selecionarProduto(produto);
+        } else if (selectProduto) {
             selectProduto.value = produto.id;
             // Trigger change event para mostrar informações do produto
             selectProduto.dispatchEvent(new Event('change'));
@@ -314,11 +323,8 @@ class NFCManager {
     // Executar movimentação automaticamente
     async executarMovimentacaoAutomatica(produto, dados) {
         try {
-            const endpoint = `/estoque/${produto.id}/${dados.tipo.toLowerCase()}`;
-            const movimentacaoData = {
-                quantidade: parseInt(dados.quantidade),
-                descricao: dados.descricao || `Movimentação automática via NFC - ${dados.tipo}`
-            };
+            const quantidade = parseInt(dados.quantidade);
+            const descricao = dados.descricao || `Movimentação automática via NFC - ${dados.tipo}`;
 
             // Validar se é saída e se há estoque suficiente
             if (dados.tipo.toLowerCase() === 'saida' && produto.quantidade < parseInt(dados.quantidade)) {
@@ -326,18 +332,25 @@ class NFCManager {
                 return;
             }
 
-            const response = await api.post(endpoint, movimentacaoData);
-            if (response.success) {
+            // Sem conexão a movimentação fica na fila local e é enviada depois
+            const response = await filaMovimentacoes.registrar(produto.id, dados.tipo, quantidade, descricao);
+            if (!response.success) {
+                showError(response.error || 'Erro ao executar movimentação');
+                return;
+            }
+            if (response.enfileirada) {
+                showInfo(`Sem conexão: movimentação de ${produto.nome} guardada e será enviada quando a conexão voltar`, 5000);
+            } else {
                 const tipoText = dados.tipo.toLowerCase() === 'entrada' ? 'Entrada' : 'Saída';
                 showSuccess(`${tipoText} de ${dados.quantidade} unidades registrada via NFC para ${produto.nome}!`);
-                
-                // Atualizar listagens se estiverem disponíveis
-                if (typeof estoqueManager !== 'undefined') {
-                    await estoqueManager.loadEstoque();
-                }
-                if (typeof produtosManager !== 'undefined') {
-                    await produtosManager.loadProdutos();
-                }
+            }
+            
+            // Atualizar listagens se estiverem disponíveis
+            if (typeof estoqueManager !== 'undefined') {
+                await estoqueManager.loadEstoque();
+            }
+            if (typeof produtosManager !== 'undefined') {
+                await produtosManager.loadProdutos();
             }
         } catch (erro) {
             showError('Erro ao executar movimentação: ' + (erro.error || erro.message));
@@ -0,0 +1,371 @@
+// Catálogo local (IndexedDB) e fila de movimentações offline
+// O catálogo é mantido por /api/sync/catalogo (só as alterações desde o último token)
+// e usado quando o servidor não responde. Movimentações feitas sem conexão ficam
+// na fila com uma chave de idempotência e são enviadas em lote quando a conexão
+// volta; reenviar a mesma chave não altera o estoque duas vezes.
+
+const OFFLINE_DB_NAME = 'logistica';
+const OFFLINE_DB_VERSION = 1;
+const OFFLINE_SYNC_TIMEOUT = 5000;     // Wi-Fi instável: desistir logo e usar o que está salvo
+const OFFLINE_SYNC_INTERVAL = 60000;
+const OFFLINE_FLUSH_INTERVAL = 30000;
+
+// Promessas para requisições e transações do IndexedDB
+function idbRequest(request) {
+    return new Promise((resolve, reject) => {
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+function idbTransactionDone(transaction) {
+    return new Promise((resolve, reject) => {
+        transaction.oncomplete = () => resolve();
+        transaction.onerror = () => reject(transaction.error);
+        transaction.onabort = () => reject(transaction.error);
+    });
+}
+
+// fetch com tempo limite; falhas de rede viram TypeError como no fetch
+async function fetchComTimeout(url, options = {}, timeout = OFFLINE_SYNC_TIMEOUT) {
+    const controller = new AbortController();
+    const timer = setTimeout(() => controller.abort(), timeout);
+    try {
+        return await fetch(url, {
+            credentials: 'same-origin',
+            ...options,
+            headers: { 'Content-Type': 'application/json', ...(options.headers || {}) },
+            signal: controller.signal
+        });
+    } catch (error) {
+        throw new TypeError(error.message);
+    } finally {
+        clearTimeout(timer);
+    }
+}
+
+class CatalogoLocal {
+    constructor() {
+        this.dbPromise = null;
+        this.sincronizando = null;
+        this.primeiraSincronizacao = null;
+    }
+
+    // Banco local; null se o navegador não tiver IndexedDB (ou estiver bloqueado)
+    abrir() {
+        if (!this.dbPromise) {
+            this.dbPromise = new Promise((resolve) => {
+                if (!('indexedDB' in window)) {
+                    resolve(null);
+                    return;
+                }
+                const request = indexedDB.open(OFFLINE_DB_NAME, OFFLINE_DB_VERSION);
+                request.onupgradeneeded = () => {
+                    const db = request.result;
+                    db.createObjectStore('produtos', { keyPath: 'id' });
+                    db.createObjectStore('meta');
+                    db.createObjectStore('fila', { keyPath: 'chave_idempotencia' });
+                };
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => {
+                    console.warn('IndexedDB indisponível:', request.error);
+                    resolve(null);
+                };
+            });
+        }
+        return this.dbPromise;
+    }
+
+    // Buscar as alterações desde o último token (uma execução por vez)
+    sincronizar() {
+        if (!this.sincronizando) {
+            this.sincronizando = this._sincronizar().finally(() => {
+                this.sincronizando = null;
+            });
+        }
+        return this.sincronizando;
+    }
+
+    async _sincronizar() {
+        const db = await this.abrir();
+        if (!db) return false;
+
+        let since = await idbRequest(db.transaction('meta').objectStore('meta').get('since'));
+        let alterados = 0;
+        try {
+            while (true) {
+                const response = await fetchComTimeout('/api/sync/catalogo' + buildQueryString({ since }));
+                if (response.status === 410) {
+                    // Token mais antigo que a retenção das exclusões: baixar tudo de novo
+                    await this.limpar();
+                    since = null;
+                    continue;
+                }
+                if (!response.ok) return false;
+
+                const data = await response.json();
+                alterados += await this.aplicarAlteracoes(db, data);
+                since = data.since;
+                if (!data.has_more) break;
+            }
+        } catch (error) {
+            if (error instanceof TypeError) return false;  // Sem conexão
+            throw error;
+        }
+
+        if (alterados) {
+            window.dispatchEvent(new CustomEvent('catalogo-local-atualizado'));
+        }
+        return true;
+    }
+
+    async aplicarAlteracoes(db, data) {
+        // Juntar produto e estoque antes de gravar; exclusões prevalecem (ids não são reutilizados)
+        const excluidos = new Set(data.excluidos);
+        const alteracoes = new Map();
+        data.produtos.forEach(produto => alteracoes.set(produto.id, { ...produto }));
+        data.estoque.forEach(({ produto_id, ...campos }) => {
+            alteracoes.set(produto_id, { ...(alteracoes.get(produto_id) || {}), ...campos });
+        });
+
+        const transaction = db.transaction(['produtos', 'meta'], 'readwrite');
+        const store = transaction.objectStore('produtos');
+        alteracoes.forEach((campos, id) => {
+            if (excluidos.has(id)) return;
+            const request = store.get(id);
+            request.onsuccess = () => store.put({ ...(request.result || { id }), ...campos });
+        });
+        excluidos.forEach(id => store.delete(id));
+        transaction.objectStore('meta').put(data.since, 'since');
+        await idbTransactionDone(transaction);
+        return alteracoes.size + excluidos.size;
+    }
+
+    async limpar() {
+        const db = await this.abrir();
+        if (!db) return;
+        const transaction = db.transaction(['produtos', 'meta'], 'readwrite');
+        transaction.objectStore('produtos').clear();
+        transaction.objectStore('meta').clear();
+        await idbTransactionDone(transaction);
+    }
+
+    // Produtos salvos, ou null se o catálogo nunca foi sincronizado neste dispositivo
+    async listar() {
+        if (!this.primeiraSincronizacao) {
+            this.primeiraSincronizacao = this.sincronizar();
+        }
+        await this.primeiraSincronizacao.catch(error => console.error('Erro ao sincronizar catálogo:', error));
+
+        const db = await this.abrir();
+        if (!db) return null;
+        const transaction = db.transaction(['produtos', 'meta']);
+        const [since, produtos] = await Promise.all([
+            idbRequest(transaction.objectStore('meta').get('since')),
+            idbRequest(transaction.objectStore('produtos').getAll())
+        ]);
+        return since ? produtos : null;
+    }
+
+    // Mesmos filtros e ordem (nome, id) de GET /api/produtos, com paginação por posição
+    async pagina(filtros = {}, offset = 0, limit = 100) {
+        const produtos = await this.listar();
+        if (!produtos) return null;
+
+        const busca = (filtros.q || '').trim();
+        const buscaMinuscula = busca.toLowerCase();
+        const filtrados = produtos.filter(produto => {
+            if (busca && !(produto.nome || '').toLowerCase().startsWith(buscaMinuscula) && produto.codigo_barras !== busca) {
+                return false;
+            }
+            if (filtros.categoria && produto.categoria !== filtros.categoria) {
+                return false;
+            }
+            const quantidade = produto.quantidade || 0;
+            const minimo = produto.estoque_minimo || 0;
+            if (filtros.status === 'critico') return quantidade === 0;
+            if (filtros.status === 'baixo') return quantidade > 0 && quantidade <= minimo;
+            if (filtros.status === 'normal') return quantidade > minimo;
+            return true;
+        });
+        filtrados.sort((a, b) => a.nome.localeCompare(b.nome, 'pt-BR', { sensitivity: 'base' }) || a.id - b.id);
+
+        return {
+            items: filtrados.slice(offset, offset + limit),
+            has_more: filtrados.length > offset + limit
+        };
+    }
+
+    // Procurar por id, código de barras ou prefixo do nome (como nfc.js faz no servidor)
+    async buscar(dados) {
+        const produtos = await this.listar();
+        if (!produtos) return null;
+        if (dados.produto_id) {
+            return produtos.find(produto => produto.id === parseInt(dados.produto_id)) || null;
+        }
+        if (dados.codigo_barras) {
+            return produtos.find(produto => produto.codigo_barras === dados.codigo_barras) || null;
+        }
+        if (dados.nome) {
+            const page = await this.pagina({ q: dados.nome }, 0, 1);
+            return page.items[0] || null;
+        }
+        return null;
+    }
+
+    // Refletir uma movimentação no saldo local até a próxima sincronização trazer o valor do servidor
+    async ajustarQuantidade(produtoId, delta) {
+        const db = await this.abrir();
+        if (!db) return;
+        const transaction = db.transaction('produtos', 'readwrite');
+        const store = transaction.objectStore('produtos');
+        const produto = await idbRequest(store.get(produtoId));
+        if (produto) {
+            produto.quantidade = (produto.quantidade || 0) + delta;
+            store.put(produto);
+        }
+        await idbTransactionDone(transaction);
+    }
+}
+
+class FilaMovimentacoes {
+    constructor(catalogo) {
+        this.catalogo = catalogo;
+        this.enviando = null;
+        this.tamanhoLote = 500;  // Servidor aceita até 1000 por lote
+    }
+
+    novaChave() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        // randomUUID exige contexto seguro (HTTPS); coletores na rede local podem usar HTTP
+        const bytes = crypto.getRandomValues(new Uint8Array(16));
+        return Array.from(bytes, byte => byte.toString(16).padStart(2, '0')).join('');
+    }
+
+    // Registrar entrada/saída; sem conexão a movimentação vai para a fila.
+    // Retorna a resposta do servidor ({success, error}) ou {success: true, enfileirada: true}.
+    async registrar(produtoId, tipo, quantidade, descricao) {
+        const movimento = {
+            produto_id: parseInt(produtoId),
+            tipo: tipo.toUpperCase(),
+            quantidade,
+            descricao,
+            chave_idempotencia: this.novaChave()
+        };
+        const delta = movimento.tipo === 'ENTRADA' ? quantidade : -quantidade;
+
+        try {
+            showLoading(true);
+            const response = await fetchComTimeout(`/api/estoque/${movimento.produto_id}/${tipo.toLowerCase()}`, {
+                method: 'POST',
+                body: JSON.stringify(movimento)
+            });
+            if (response.status >= 500) {
+                throw new TypeError('Servidor indisponível');
+            }
+            const data = await response.json();
+            if (data.success && !data.duplicada) {
+                await this.catalogo.ajustarQuantidade(movimento.produto_id, delta);
+            }
+            return data;
+        } catch (error) {
+            if (!(error instanceof TypeError)) throw error;
+            // A mesma chave vai no reenvio: se o servidor chegou a gravar, não duplica
+            await this.enfileirar(movimento);
+            await this.catalogo.ajustarQuantidade(movimento.produto_id, delta);
+            return { success: true, enfileirada: true };
+        } finally {
+            showLoading(false);
+        }
+    }
+
+    async enfileirar(movimento) {
+        const db = await this.catalogo.abrir();
+        if (!db) {
+            throw new Error('Sem conexão e sem armazenamento local para guardar a movimentação');
+        }
+        const transaction = db.transaction('fila', 'readwrite');
+        transaction.objectStore('fila').put({ ...movimento, criado_em: Date.now() });
+        await idbTransactionDone(transaction);
+    }
+
+    async pendentes() {
+        const db = await this.catalogo.abrir();
+        if (!db) return 0;
+        return idbRequest(db.transaction('fila').objectStore('fila').count());
+    }
+
+    // Enviar a fila em lotes (uma execução por vez); retorna quantas saíram da fila
+    enviar() {
+        if (!this.enviando) {
+            this.enviando = this._enviar().finally(() => {
+                this.enviando = null;
+            });
+        }
+        return this.enviando;
+    }
+
+    async _enviar() {
+        const db = await this.catalogo.abrir();
+        if (!db) return 0;
+
+        const fila = await idbRequest(db.transaction('fila').objectStore('fila').getAll());
+        fila.sort((a, b) => a.criado_em - b.criado_em);
+
+        let enviadas = 0;
+        const rejeitadas = [];
+        try {
+            for (let inicio = 0; inicio < fila.length; inicio += this.tamanhoLote) {
+                const lote = fila.slice(inicio, inicio + this.tamanhoLote);
+                const response = await fetchComTimeout('/api/estoque/lote', {
+                    method: 'POST',
+                    body: JSON.stringify({ movimentacoes: lote.map(({ criado_em, ...movimento }) => movimento) })
+                });
+                if (!response.ok) break;  // Sessão expirada ou servidor com erro: tentar depois
+
+                const data = await response.json();
+                // Aceitas, duplicadas (já gravadas antes) e rejeitadas saem da fila
+                const transaction = db.transaction('fila', 'readwrite');
+                data.resultados.forEach((resultado, indice) => {
+                    transaction.objectStore('fila').delete(lote[indice].chave_idempotencia);
+                    if (!resultado.success) {
+                        rejeitadas.push(`produto ${lote[indice].produto_id}: ${resultado.error}`);
+                    }
+                });
+                await idbTransactionDone(transaction);
+                enviadas += lote.length;
+            }
+        } catch (error) {
+            if (!(error instanceof TypeError)) throw error;  // Ainda sem conexão
+        }
+
+        if (enviadas) {
+            this.catalogo.sincronizar();
+            showInfo(`${enviadas - rejeitadas.length} movimentação(ões) pendente(s) enviada(s)`);
+        }
+        if (rejeitadas.length) {
+            showError(`Movimentações da fila rejeitadas: ${rejeitadas.join('; ')}`, 10000);
+        }
+        return enviadas;
+    }
+}
+
+// Instâncias globais
+const catalogoLocal = new CatalogoLocal();
+const filaMovimentacoes = new FilaMovimentacoes(catalogoLocal);
+
+document.addEventListener('DOMContentLoaded', function() {
+    filaMovimentacoes.enviar();
+    window.addEventListener('online', () => {
+        filaMovimentacoes.enviar();
+        catalogoLocal.sincronizar();
+    });
+    setInterval(() => filaMovimentacoes.enviar(), OFFLINE_FLUSH_INTERVAL);
+    setInterval(() => {
+        if (document.visibilityState === 'visible') {
+            catalogoLocal.sincronizar();
+        }
+    }, OFFLINE_SYNC_INTERVAL);
+});
@@ -3,6 +3,9 @@ class ProdutosManager {
     constructor() {
         this.produtos = [];
         this.currentProduto = null;
+        this.nextCursor = null;
+        this.pageSize = 100;
+        this.modoLocal = false;  // Sem conexão: páginas vêm do catálogo salvo (offline.js)
         this.init();
     }
 
@@ -64,18 +67,75 @@ class ProdutosManager {
         if (filterCategoria) {
             filterCategoria.addEventListener('change', () => this.filterProdutos());
         }
+
+        // Próxima página do catálogo
+        const btnLoadMore = document.getElementById('btn-load-more-produtos');
+        if (btnLoadMore) {
+            btnLoadMore.addEventListener('click', () => this.loadProdutos(true));
+        }
+
+        // Catálogo local mudou (sincronização ou fila enviada): atualizar a tela offline
+        window.addEventListener('catalogo-local-atualizado', () => {
+            if (this.modoLocal) {
+                this.loadProdutos();
+            }
+        });
     }
 
-    async loadProdutos() {
+    async loadProdutos(append = false) {
+        if (append && this.modoLocal) {
+            await this.loadProdutosLocal(true);
+            return;
+        }
+
         try {
-            this.produtos = await api.get('/produtos');
-            this.renderProdutos();
+            // Filtros são aplicados no servidor, página a página
+            const page = await api.get('/produtos', {
+                limit: this.pageSize,
+                cursor: append ? this.nextCursor : null,
+                q: document.getElementById('search-produto')?.value.trim(),
+                categoria: document.getElementById('filter-categoria')?.value
+            });
+
+            this.modoLocal = false;
+            this.nextCursor = page.next_cursor;
+            this.showPage(page, append);
         } catch (error) {
+            if (error.offline && await this.loadProdutosLocal(append)) {
+                return;
+            }
             console.error('Erro ao carregar produtos:', error);
             showError('Erro ao carregar lista de produtos');
         }
     }
 
+    // Mesma listagem a partir do catálogo salvo no dispositivo; false se não houver
+    async loadProdutosLocal(append = false) {
+        const page = await catalogoLocal.pagina({
+            q: document.getElementById('search-produto')?.value.trim(),
+            categoria: document.getElementById('filter-categoria')?.value
+        }, append ? this.produtos.length : 0, this.pageSize);
+        if (!page) return false;
+
+        if (!this.modoLocal) {
+            showInfo('Sem conexão: exibindo o catálogo salvo neste dispositivo');
+        }
+        this.modoLocal = true;
+        this.nextCursor = null;
+        this.showPage(page, append);
+        return true;
+    }
+
+    showPage(page, append) {
+        this.produtos = append ? this.produtos.concat(page.items) : page.items;
+        this.renderProdutos();
+
+        const btnLoadMore = document.getElementById('btn-load-more-produtos');
+        if (btnLoadMore) {
+            btnLoadMore.style.display = page.has_more ? 'block' : 'none';
+        }
+    }
+
     renderProdutos(produtosToRender = this.produtos) {
         const tableBody = document.getElementById('produtos-table-body');
         if (!tableBody) return;
@@ -139,28 +199,8 @@ class ProdutosManager {
     }
 
     filterProdutos() {
-        const searchValue = document.getElementById('search-produto')?.value.toLowerCase() || '';
-        const categoriaFilter = document.getElementById('filter-categoria')?.value || '';
-
-        let filteredProdutos = this.produtos;
-
-        // Filtrar por texto de pesquisa
-        if (searchValue) {
-            filteredProdutos = filteredProdutos.filter(produto => 
-                produto.nome.toLowerCase().includes(searchValue) ||
-                produto.categoria?.toLowerCase().includes(searchValue) ||
-                produto.codigo_barras?.toLowerCase().includes(searchValue)
-            );
-        }
-
-        // Filtrar por categoria
-        if (categoriaFilter) {
-            filteredProdutos = filteredProdutos.filter(produto => 
-                produto.categoria === categoriaFilter
-            );
-        }
-
-        this.renderProdutos(filteredProdutos);
+        // Pesquisa (prefixo do nome ou código de barras) e categoria são filtradas no servidor
+        this.loadProdutos();
     }
 
     openAddModal() {
@@ -21,21 +21,21 @@ class RelatoriosManager {
     async loadRelatorios() {
         try {
             // Carregar dados dos relatórios
-            const [produtos, estoqueBaixo, movimentacoes] = await Promise.all([
-                api.get('/produtos'),
+            const [resumo, estoqueBaixo, movimentacoes] = await Promise.all([
+                api.get('/produtos/resumo'),
                 api.get('/relatorio/estoque-baixo'),
                 api.get('/relatorio/movimentacoes')
             ]);
 
             // Atualizar cards de resumo
-            this.updateResumoCards(produtos, estoqueBaixo, movimentacoes);
+            this.updateResumoCards(resumo, estoqueBaixo, movimentacoes);
             
             // Atualizar tabelas
             this.updateEstoqueBaixoTable(estoqueBaixo);
             this.updateMovimentacoesTable(movimentacoes);
 
             // Atualizar gráficos
-            this.updateCharts(produtos, movimentacoes);
+            this.updateCharts(resumo, movimentacoes);
 
         } catch (error) {
             console.error('Erro ao carregar relatórios:', error);
@@ -43,7 +43,7 @@ class RelatoriosManager {
         }
     }
 
-    updateResumoCards(produtos, estoqueBaixo, movimentacoes) {
+    updateResumoCards(resumo, estoqueBaixo, movimentacoes) {
         // Produtos com estoque baixo
         document.getElementById('produtos-baixo').textContent = estoqueBaixo.length;
 
@@ -55,11 +55,8 @@ class RelatoriosManager {
         );
         document.getElementById('movimentacoes-mes').textContent = movimentacoesMes.length;
 
-        // Valor total em estoque
-        const valorTotal = produtos.reduce((total, produto) => {
-            return total + ((produto.preco || 0) * (produto.quantidade || 0));
-        }, 0);
-        document.getElementById('valor-estoque').textContent = formatCurrency(valorTotal);
+        // Valor total em estoque (agregado no servidor)
+        document.getElementById('valor-estoque').textContent = formatCurrency(resumo.valor_estoque);
     }
 
     updateEstoqueBaixoTable(estoqueBaixo) {
@@ -155,22 +152,16 @@ class RelatoriosManager {
         Chart.defaults.color = '#333';
     }
 
-    updateCharts(produtos, movimentacoes) {
-        this.updateCategoriesChart(produtos);
+    updateCharts(resumo, movimentacoes) {
+        this.updateCategoriesChart(resumo.categorias);
         this.updateMovimentsChart(movimentacoes);
     }
 
-    updateCategoriesChart(produtos) {
+    updateCategoriesChart(categorias) {
         const ctx = document.getElementById('categoriesChart');
         if (!ctx) return;
 
-        // Agrupar produtos por categoria
-        const categorias = {};
-        produtos.forEach(produto => {
-            const categoria = produto.categoria || 'Sem categoria';
-            categorias[categoria] = (categorias[categoria] || 0) + 1;
-        });
-
+        // Produtos por categoria (agrupados no servidor)
         const labels = Object.keys(categorias);
         const data = Object.values(categorias);
         const cores = this.generateColors(labels.length);
@@ -301,71 +292,24 @@ class RelatoriosManager {
         return result;
     }
 
-    async exportData() {
-        try {
-            showInfo('Preparando dados para exportação...');
-            
-            const [produtos, movimentacoes, estoqueBaixo] = await Promise.all([
-                api.get('/produtos'),
-                api.get('/relatorio/movimentacoes'),
-                api.get('/relatorio/estoque-baixo')
-            ]);
-
-            // Criar dados CSV
-            const csvData = this.generateCSV({
-                produtos,
-                movimentacoes,
-                estoqueBaixo
-            });
-
-            // Download do arquivo
-            this.downloadCSV(csvData, 'relatorio_estoque.csv');
-            showSuccess('Relatório exportado com sucesso!');
-
-        } catch (error) {
-            console.error('Erro ao exportar dados:', error);
-            showError('Erro ao exportar dados');
+    exportData() {
+        // O servidor gera o CSV em streaming; o navegador grava direto no arquivo
+        const params = {
+            inicio: document.getElementById('export-inicio')?.value,
+            fim: document.getElementById('export-fim')?.value,
+            categoria: document.getElementById('export-categoria')?.value
+        };
+        if (params.inicio && params.fim && params.inicio > params.fim) {
+            showError('A data inicial deve ser anterior à data final');
+            return;
         }
-    }
-
-    generateCSV(data) {
-        let csv = '';
-        
-        // Seção de Produtos
-        csv += 'PRODUTOS\n';
-        csv += 'ID,Nome,Categoria,Preço,Código de Barras,Quantidade,Estoque Mínimo,Estoque Máximo\n';
-        data.produtos.forEach(produto => {
-            csv += `${produto.id},"${produto.nome}","${produto.categoria || ''}",${produto.preco || 0},"${produto.codigo_barras || ''}",${produto.quantidade || 0},${produto.estoque_minimo || 0},${produto.estoque_maximo || 0}\n`;
-        });
-
-        csv += '\n\nMOVIMENTAÇÕES\n';
-        csv += 'Data/Hora,Produto,Tipo,Quantidade,Descrição\n';
-        data.movimentacoes.forEach(mov => {
-            csv += `"${formatDate(mov.data_movimento)}","${mov.produto_nome}","${mov.tipo}",${mov.quantidade},"${mov.descricao || ''}"\n`;
-        });
-
-        csv += '\n\nPRODUTOS COM ESTOQUE BAIXO\n';
-        csv += 'Produto,Categoria,Quantidade Atual,Estoque Mínimo\n';
-        data.estoqueBaixo.forEach(produto => {
-            csv += `"${produto.nome}","${produto.categoria}",${produto.quantidade},${produto.estoque_minimo}\n`;
-        });
-
-        return csv;
-    }
-
-    downloadCSV(csvContent, filename) {
-        const blob = new Blob([csvContent], { type: 'text/csv;charset=utf-8;' });
         const link = document.createElement('a');
-        
-        if (link.download !== undefined) {
-            const url = URL.createObjectURL(blob);
-            link.setAttribute('href', url);
-            link.setAttribute('download', filename);
-            link.style.visibility = 'hidden';
-            document.body.appendChild(link);
-            link.click();
-            document.body.removeChild(link);
-        }
+        link.href = `/api/relatorio/exportar${buildQueryString(params)}`;
+        link.style.visibility = 'hidden';
+        document.body.appendChild(link);
+        link.click();
+        document.body.removeChild(link);
+        showInfo('Exportação iniciada; o download continua em segundo plano.');
     }
 }
 